@@ -12,7 +12,6 @@ macOS / Windows / Linux (Railway) 多平台支持
 import sys
 import os
 import json
-import uuid
 import time
 import shutil
 import subprocess
@@ -20,11 +19,20 @@ import platform
 import tempfile
 import re
 import random
+import math
+import struct
 import typing
+import hashlib
+import binascii
+import threading
+import contextlib
 from pathlib import Path
 from datetime import datetime
 from urllib.parse import urlparse
 
+import draft_ids
+import zip_packager
+
 # ---- 进度回调器 ----
 _progress_callback = None
 
@@ -34,7 +42,13 @@ def set_progress_callback(callback):
     _progress_callback = callback
 
 def report_progress(progress: int, stage: str):
-    """报告进度到父进程（通过 stdout）"""
+    """报告进度到父进程（默认通过 stdout；常驻 worker 模式下走 set_progress_callback 设置的回调）"""
+    if _progress_callback is not None:
+        _progress_callback(progress, stage)
+        return
+    _print_progress_line(progress, stage)
+
+def _print_progress_line(progress: int, stage: str):
     # 输出到 stdout，用特殊标记让 Node 解析
     print(f"[PROGRESS] {progress}|{stage}", flush=True)
 
@@ -155,55 +169,553 @@ def _get_writable_output_dir() -> str:
     return output_dir
 
 
-def _safe_filename(url_or_path: str) -> str:
-    """从 URL / data:URL / 本地路径生成安全的本地文件名"""
+def _safe_filename(url_or_path: str, ids: draft_ids.IdAllocator = None) -> str:
+    """从 URL / data:URL / 本地路径生成安全的本地文件名（随机名取自 ids，seed 构建时可复现）"""
+    ids = ids or draft_ids.current()
     # 本地文件路径：直接取 basename
     if not url_or_path.startswith(('http://', 'https://', 'data:', 'blob:')):
         name = os.path.basename(url_or_path)
         if not name or len(name) > 80:
-            name = f"media_{uuid.uuid4().hex[:8]}"
+            name = f"media_{ids.next_hex()[:8]}"
         name = re.sub(r'[\\/:*?"<>|]', '_', name)
         return name
 
-    # data:URL → 从 MIME 推断扩展名
+    # data:URL → 从 MIME 推断扩展名（只看逗号前的头部）
     if url_or_path.startswith('data:'):
-        import re as _re
-        mime_match = _re.search(r'data:([^;]+)', url_or_path)
-        mime_map = {
-            'image/png': '.png',
-            'image/jpeg': '.jpg',
-            'image/jpg': '.jpg',
-            'image/gif': '.gif',
-            'image/webp': '.webp',
-            'audio/wav': '.wav',
-            'audio/wave': '.wav',
-            'audio/x-wav': '.wav',
-            'audio/mpeg': '.mp3',
-            'audio/mp3': '.mp3',
-            'audio/mp4': '.m4a',
-            'audio/x-m4a': '.m4a',
-            'audio/aac': '.aac',
-            'audio/flac': '.flac',
-            'audio/ogg': '.ogg',
-            'audio/webm': '.webm',
-            'video/mp4': '.mp4',
-            'video/quicktime': '.mov',
-            'video/webm': '.webm',
-            'video/x-msvideo': '.avi',
-        }
-        mime = mime_match.group(1) if mime_match else 'application/octet-stream'
-        ext = mime_map.get(mime, '.bin')
-        return f"media_{uuid.uuid4().hex[:8]}{ext}"
+        comma = url_or_path.find(',')
+        ext = _data_url_ext(url_or_path if comma < 0 else url_or_path[:comma], '.bin')
+        return f"media_{ids.next_hex()[:8]}{ext}"
 
     # HTTP/HTTPS URL
     parsed = urlparse(url_or_path)
     name = os.path.basename(parsed.path)
     if not name or len(name) > 80:
-        name = f"media_{uuid.uuid4().hex[:8]}"
+        name = f"media_{ids.next_hex()[:8]}"
     name = re.sub(r'[\\/:*?"<>|]', '_', name)
     return name
 
 
+# ---- data:URL 流式解码 ----
+# data:URL 的 base64 正文按块解码直接写盘，不再整体 split + b64decode（原文、切片、解码结果三份同时驻留内存）。
+_DATA_URL_MIME_EXT = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'audio/wav': '.wav',
+    'audio/wave': '.wav',
+    'audio/x-wav': '.wav',
+    'audio/mpeg': '.mp3',
+    'audio/mp3': '.mp3',
+    'audio/mp4': '.m4a',
+    'audio/x-m4a': '.m4a',
+    'audio/aac': '.aac',
+    'audio/flac': '.flac',
+    'audio/ogg': '.ogg',
+    'audio/webm': '.webm',
+    'video/mp4': '.mp4',
+    'video/quicktime': '.mov',
+    'video/webm': '.webm',
+    'video/x-msvideo': '.avi',
+}
+_DATA_URL_CHUNK_CHARS = 4 << 20  # 4 的倍数
+_B64_WHITESPACE = b" \t\r\n"
+
+
+def _data_url_ext(header: str, default: str = '.png') -> str:
+    """data:URL 头部（逗号之前）→ 文件扩展名。"""
+    mime_match = re.search(r'data:([^;,]+)', header)
+    if mime_match:
+        return _DATA_URL_MIME_EXT.get(mime_match.group(1).strip().lower(), default)
+    return default
+
+
+class _Base64Decoder:
+    """分块 base64 解码：每次只解码 4 字节对齐的部分，余数留给下一块。"""
+
+    def __init__(self):
+        self._rest = b""
+
+    def feed(self, data: bytes) -> bytes:
+        data = self._rest + data.translate(None, _B64_WHITESPACE)
+        n = len(data) - len(data) % 4
+        self._rest = data[n:]
+        return binascii.a2b_base64(data[:n]) if n else b""
+
+    def flush(self) -> bytes:
+        rest, self._rest = self._rest, b""
+        if not rest:
+            return b""
+        return binascii.a2b_base64(rest + b"=" * (-len(rest) % 4))
+
+
+def _iter_data_url(url: str):
+    """按块产出 data:URL 解码后的字节（base64 分块解码；非 base64 则按百分号编码解码）。"""
+    comma = url.index(',')
+    if ';base64' not in url[:comma].lower():
+        from urllib.parse import unquote_to_bytes
+        yield unquote_to_bytes(url[comma + 1:])
+        return
+    dec = _Base64Decoder()
+    for i in range(comma + 1, len(url), _DATA_URL_CHUNK_CHARS):
+        yield dec.feed(url[i:i + _DATA_URL_CHUNK_CHARS].encode('ascii'))
+    yield dec.flush()
+
+
+# ---- 全局媒体缓存（内容寻址，跨草稿 / batch / 重试共享）----
+# 目录结构：<get_persistent_dir()>/media_cache/
+#   objects/<sha256 前 2 位>/<sha256><ext>   媒体本体（按内容哈希存储，同内容只存一份）
+#   urls/<url 哈希前 2 位>/<url 哈希>.json     URL → {sha256, ext, size} 索引
+#   tmp/                                     下载中的临时文件（同一文件系统，完成后 rename）
+# 草稿 Resources/ 下的文件通过硬链接（其次 reflink，最后复制）指向缓存对象，
+# 缓存按对象 mtime 做 LRU（命中时 touch），总量超过 JIANYING_MEDIA_CACHE_MB 时淘汰最旧的对象。
+MEDIA_CACHE_MAX_MB = int(os.environ.get("JIANYING_MEDIA_CACHE_MB", "2048") or 0)
+_media_cache_root_path: typing.Optional[str] = None
+
+
+class _KeyedLocks:
+    """
+    按 key 互斥的锁表：条目带引用计数，最后一个持有 / 等待的线程离开时删除，
+    常驻 worker（--serve）处理大量不同 key 时不会无限增长。
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks: dict = {}  # key -> [Lock, 持有 / 等待的线程数]
+
+    @contextlib.contextmanager
+    def hold(self, key, on_wait: typing.Optional[typing.Callable[[], None]] = None):
+        """独占 key；需要等待其他线程时先调用 on_wait（如上报进度）。"""
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            if not entry[0].acquire(blocking=False):
+                if on_wait is not None:
+                    on_wait()
+                entry[0].acquire()
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def __len__(self) -> int:
+        with self._guard:
+            return len(self._locks)
+
+
+# 同一进程内同一 URL 只下载一次（多个镜头引用同一素材时，其余线程等待缓存结果）
+_url_locks = _KeyedLocks()
+
+
+def _media_cache_root() -> typing.Optional[str]:
+    """返回缓存根目录；禁用（JIANYING_MEDIA_CACHE=0 或上限为 0）或不可写时返回 None。"""
+    global _media_cache_root_path
+    if _media_cache_root_path is None:
+        _media_cache_root_path = ""
+        if os.environ.get("JIANYING_MEDIA_CACHE", "1") != "0" and MEDIA_CACHE_MAX_MB > 0:
+            root = os.path.join(get_persistent_dir(), "media_cache")
+            try:
+                for sub in ("objects", "urls", "tmp"):
+                    os.makedirs(os.path.join(root, sub), exist_ok=True)
+                _media_cache_root_path = root
+            except OSError as e:
+                print(f"[jianying_export] [MEDIA_CACHE] 缓存目录不可用，跳过缓存: {e}", file=sys.stderr, flush=True)
+    return _media_cache_root_path or None
+
+
+def _media_cache_object_path(root: str, digest: str, ext: str) -> str:
+    return os.path.join(root, "objects", digest[:2], f"{digest}{ext}")
+
+
+def _media_cache_index_path(root: str, url: str) -> str:
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(root, "urls", key[:2], f"{key}.json")
+
+
+def media_cache_lookup(url: str) -> typing.Optional[tuple]:
+    """按 URL 查缓存，命中返回 (对象路径, 扩展名) 并刷新 LRU 时间，未命中返回 None。"""
+    root = _media_cache_root()
+    if not root:
+        return None
+    try:
+        with open(_media_cache_index_path(root, url), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        obj = _media_cache_object_path(root, entry["sha256"], entry.get("ext") or "")
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    if not os.path.isfile(obj):
+        return None
+    try:
+        os.utime(obj)
+    except OSError:
+        pass
+    return obj, entry.get("ext") or ""
+
+
+def media_cache_tmp_path(suffix: str = "") -> typing.Optional[str]:
+    """在缓存 tmp/ 下分配一个临时文件路径（与 objects/ 同一文件系统，便于原子 rename）。"""
+    root = _media_cache_root()
+    if not root:
+        return None
+    fd, path = tempfile.mkstemp(prefix="dl_", suffix=suffix, dir=os.path.join(root, "tmp"))
+    os.close(fd)
+    return path
+
+
+def media_cache_put(tmp_path: str, digest: str, ext: str, url: str = None) -> str:
+    """把已写完的临时文件收入缓存（同内容已存在则丢弃临时文件），可选写入 URL 索引，返回对象路径。"""
+    root = _media_cache_root()
+    obj = _media_cache_object_path(root, digest, ext)
+    os.makedirs(os.path.dirname(obj), exist_ok=True)
+    if os.path.isfile(obj):
+        os.remove(tmp_path)
+        try:
+            os.utime(obj)
+        except OSError:
+            pass
+    else:
+        # mkstemp 创建的文件是 0600，收入缓存前放宽为常规媒体文件权限
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, obj)
+    if url:
+        idx_path = _media_cache_index_path(root, url)
+        os.makedirs(os.path.dirname(idx_path), exist_ok=True)
+        idx_tmp = f"{idx_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(idx_tmp, "w", encoding="utf-8") as f:
+            json.dump({"sha256": digest, "ext": ext, "size": os.path.getsize(obj)}, f)
+        os.replace(idx_tmp, idx_path)
+    return obj
+
+
+def _link_or_copy(src: str, dest: str) -> None:
+    """把 src 放到 dest：优先硬链接，其次 reflink（Linux FICLONE），最后普通复制。已存在的 dest 会被原子替换。"""
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            try:
+                import fcntl
+                _FICLONE = 0x40049409
+                with open(src, "rb") as fs, open(tmp, "wb") as fd:
+                    fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+            except (ImportError, OSError):
+                shutil.copyfile(src, tmp)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+def evict_media_cache(max_mb: int = None) -> int:
+    """缓存总量超过上限时按 LRU（mtime 最旧优先）淘汰对象，淘汰到上限的 90%。返回删除的对象数。
+
+    草稿里的硬链接不受影响（只是缓存侧少一个引用）；索引指向已淘汰对象时 lookup 会当作未命中。
+    """
+    root = _media_cache_root()
+    if not root:
+        return 0
+    limit = (MEDIA_CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+    entries = []
+    total = 0
+    now = time.time()
+    for dirpath, _dirs, files in os.walk(os.path.join(root, "objects")):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    # 顺带清理异常退出遗留的临时文件（1 小时前）
+    tmp_dir = os.path.join(root, "tmp")
+    for name in os.listdir(tmp_dir):
+        path = os.path.join(tmp_dir, name)
+        try:
+            if now - os.path.getmtime(path) > 3600:
+                os.remove(path)
+        except OSError:
+            pass
+    if total <= limit:
+        return 0
+    target = int(limit * 0.9)
+    removed = 0
+    for _mtime, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    print(f"[jianying_export] [MEDIA_CACHE] LRU 淘汰 {removed} 个对象，当前 {total / (1024 * 1024):.1f}MB", file=sys.stderr, flush=True)
+    return removed
+
+
+# ---- HTTP 下载引擎（按 host 复用连接 + keep-alive + 自适应并发）----
+# 镜头素材大多来自同两三个 CDN（runninghub / openlux），每个文件新建一次 TLS 连接的握手开销
+# 在 60+ 文件的导出里占主导。默认引擎按 (scheme, host) 维护 keep-alive 连接池，
+# 并给每个 host 一个自适应并发上限（AIMD：成功 +1，超时/连接错误减半）。
+# 可通过 set_download_engine() 替换；JIANYING_DOWNLOAD_ENGINE=urllib 或设置了代理时使用 urllib（每次新连接）。
+_DOWNLOAD_USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+# 常见站点的特殊 headers：(URL 关键字, Referer, 最小超时秒)
+_HOST_DOWNLOAD_PROFILES = [
+    (("runninghub.ai", "runninghub.cn"), "https://www.runninghub.ai/", 180),  # RunningHub 文件较大，增加超时
+    (("openlux.ai",), "https://api.openlux.ai/", 0),
+    (("jianying",), "https://lv.ulikecom.com/", 0),
+]
+
+DOWNLOAD_PER_HOST_MAX = max(1, int(os.environ.get("JIANYING_DOWNLOAD_PER_HOST", "8") or 8))
+DOWNLOAD_PER_HOST_INITIAL = min(DOWNLOAD_PER_HOST_MAX, 4)
+DOWNLOAD_MAX_WORKERS = max(1, int(os.environ.get("JIANYING_DOWNLOAD_MAX_WORKERS", "24") or 24))
+
+
+def _download_headers(url: str, timeout: int) -> tuple:
+    """按站点返回 (请求头, 超时秒)。"""
+    headers = {'User-Agent': _DOWNLOAD_USER_AGENT}
+    low = url.lower()
+    for keywords, referer, min_timeout in _HOST_DOWNLOAD_PROFILES:
+        if any(k in low for k in keywords):
+            headers['Referer'] = referer
+            timeout = max(timeout, min_timeout)
+            break
+    return headers, timeout
+
+
+class _HostLimiter:
+    """单个 host 的自适应并发上限：下载成功 +1（上限 maximum），超时 / 连接错误减半（下限 1）。"""
+
+    def __init__(self, initial: int, maximum: int):
+        self.limit = initial
+        self.maximum = maximum
+        self.active = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def release(self, ok: typing.Optional[bool]):
+        """ok=True 成功，False 网络失败，None 不计入（如 404 等业务错误）。"""
+        with self._cond:
+            self.active -= 1
+            if ok is True:
+                self.limit = min(self.maximum, self.limit + 1)
+            elif ok is False:
+                self.limit = max(1, self.limit // 2)
+            self._cond.notify_all()
+
+
+def _is_network_error(exc: BaseException) -> bool:
+    """
+    下载过程中的异常是否为网络 / 协议层失败（计入 host 并发上限的减半）。
+    本地写盘错误（ENOSPC 等普通 OSError）、调用方提前退出（GeneratorExit）等不算，限流器按中性释放。
+    """
+    import http.client
+    import socket
+    import ssl
+    return isinstance(exc, (http.client.HTTPException, ConnectionError, TimeoutError, ssl.SSLError, socket.gaierror))
+
+
+class _PooledHttpEngine:
+    """http.client 连接池：同一 (scheme, host) 复用 keep-alive 连接，手动跟随重定向。"""
+
+    MAX_REDIRECTS = 5
+
+    def __init__(self, per_host_initial: int = DOWNLOAD_PER_HOST_INITIAL, per_host_max: int = DOWNLOAD_PER_HOST_MAX):
+        self._per_host_initial = per_host_initial
+        self._per_host_max = per_host_max
+        self._idle: dict = {}
+        self._limiters: dict = {}
+        self._lock = threading.Lock()
+        self._ssl_context = None
+
+    def _limiter(self, host: str) -> _HostLimiter:
+        with self._lock:
+            lim = self._limiters.get(host)
+            if lim is None:
+                lim = self._limiters[host] = _HostLimiter(self._per_host_initial, self._per_host_max)
+            return lim
+
+    def _checkout(self, key: tuple, timeout: int):
+        """取一个空闲连接（返回 (conn, 是否复用)）；没有则新建。"""
+        import http.client
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                conn = idle.pop()
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                conn.timeout = timeout
+                return conn, True
+        scheme, netloc = key
+        if scheme == 'https':
+            if self._ssl_context is None:
+                import ssl
+                self._ssl_context = ssl.create_default_context()
+            return http.client.HTTPSConnection(netloc, timeout=timeout, context=self._ssl_context), False
+        return http.client.HTTPConnection(netloc, timeout=timeout), False
+
+    def _checkin(self, key: tuple, conn) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self._per_host_max:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _send(self, key: tuple, path: str, headers: dict, timeout: int):
+        import http.client
+        conn, reused = self._checkout(key, timeout)
+        try:
+            conn.request('GET', path, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+        # 复用的 keep-alive 连接可能已被服务端关闭：换新连接重试一次
+        conn, _ = self._checkout_new(key, timeout)
+        try:
+            conn.request('GET', path, headers=headers)
+            return conn, conn.getresponse()
+        except BaseException:
+            conn.close()
+            raise
+
+    def _checkout_new(self, key: tuple, timeout: int):
+        with self._lock:
+            stale = self._idle.pop(key, [])
+        for c in stale:
+            c.close()
+        return self._checkout(key, timeout)
+
+    @contextlib.contextmanager
+    def open(self, url: str, headers: dict, timeout: int):
+        """GET url，产出可 .read(n) 的响应（.headers.get 可用）；读完后连接回池复用。"""
+        from urllib.parse import urlsplit, urljoin
+        headers = {**headers, 'Connection': 'keep-alive'}
+        for _ in range(self.MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            key = (parts.scheme.lower(), parts.netloc)
+            path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+            limiter = self._limiter(parts.hostname or parts.netloc)
+            limiter.acquire()
+            try:
+                conn, resp = self._send(key, path, headers, timeout)
+            except BaseException as e:
+                limiter.release(False if _is_network_error(e) else None)
+                raise
+            location = resp.getheader('Location')
+            if resp.status in (301, 302, 303, 307, 308) and location:
+                resp.read()
+                self._checkin(key, conn)
+                limiter.release(None)
+                url = urljoin(url, location)
+                continue
+            if resp.status >= 400:
+                resp.read()
+                self._checkin(key, conn)
+                limiter.release(None)
+                raise OSError(f"HTTP Error {resp.status}: {resp.reason}")
+            ok = None
+            try:
+                yield resp
+                ok = True
+            except BaseException as e:
+                # 只有读响应时的网络 / 协议错误才算下载失败；其余异常（写盘失败、提前退出）不影响并发上限
+                if _is_network_error(e):
+                    ok = False
+                raise
+            finally:
+                if ok and resp.isclosed():
+                    self._checkin(key, conn)
+                else:
+                    conn.close()
+                limiter.release(ok)
+            return
+        raise OSError(f"重定向次数过多: {url}")
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for c in conns:
+                c.close()
+
+
+class _UrllibEngine:
+    """旧行为：每个文件一个 urllib 连接（支持系统代理）。"""
+
+    @contextlib.contextmanager
+    def open(self, url: str, headers: dict, timeout: int):
+        import urllib.request
+        req = urllib.request.Request(url, headers=headers)
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            yield response
+
+    def close(self) -> None:
+        pass
+
+
+_download_engine = None
+
+
+def set_download_engine(engine) -> None:
+    """替换下载引擎：需提供 open(url, headers, timeout) 上下文管理器（产出响应）与 close()。"""
+    global _download_engine
+    _download_engine = engine
+
+
+def get_download_engine():
+    global _download_engine
+    if _download_engine is None:
+        import urllib.request
+        want = os.environ.get("JIANYING_DOWNLOAD_ENGINE", "pooled").lower()
+        proxies = urllib.request.getproxies()
+        if want == "urllib" or proxies.get("http") or proxies.get("https"):
+            _download_engine = _UrllibEngine()
+        else:
+            _download_engine = _PooledHttpEngine()
+    return _download_engine
+
+
+def _download_worker_count(download_plan: list) -> int:
+    """按 host 分布决定下载线程数：每个 host 最多 DOWNLOAD_PER_HOST_MAX 个，本地/data 任务最多 4 个，总数不超过 DOWNLOAD_MAX_WORKERS。"""
+    from collections import Counter
+    hosts = Counter()
+    local = 0
+    for t in download_plan:
+        if t.get("local_src") and os.path.isfile(t["local_src"]):
+            local += 1
+            continue
+        url = t.get("url") or ""
+        if url.startswith(('http://', 'https://')):
+            hosts[urlparse(url).netloc] += 1
+        else:
+            local += 1
+    n = sum(min(c, DOWNLOAD_PER_HOST_MAX) for c in hosts.values()) + min(local, 4)
+    return max(1, min(DOWNLOAD_MAX_WORKERS, n))
+
+
 def _download_file(url: str, dest_path: str, timeout: int = 120, max_retries: int = 3,
                    local_source_path: str = None) -> bool:
     """下载文件到本地，支持 http/https/data:/本地路径，Railway 环境默认 120s 超时+3次重试
@@ -212,8 +724,6 @@ def _download_file(url: str, dest_path: str, timeout: int = 120, max_retries: in
         local_source_path: 若提供且文件存在，优先从该本地路径复制（跳过下载），
                            用于利用前端已缓存的媒体文件。
     """
-    import time as _time
-
     # ── 本地缓存优先：local_source_path 存在则直接复制 ──────────────────────────
     if local_source_path and os.path.isfile(local_source_path):
         if os.path.exists(dest_path):
@@ -228,6 +738,61 @@ def _download_file(url: str, dest_path: str, timeout: int = 120, max_retries: in
             print(f"[jianying_export] [LOCAL_COPY] 失败 {copy_err}: {local_source_path} → {dest_path}", file=sys.stderr, flush=True)
             # 回退到 URL 下载
 
+    # ── 全局媒体缓存：同一 URL 在所有草稿 / batch / 重试之间只下载一次 ──────────────
+    if url.startswith(('http://', 'https://')) and _media_cache_root():
+        with _url_locks.hold(url):
+            if _link_from_media_cache(url, dest_path):
+                return True
+            return _download_file_attempts(url, dest_path, timeout, max_retries)
+    return _download_file_attempts(url, dest_path, timeout, max_retries)
+
+
+def _link_from_media_cache(url: str, dest_path: str) -> bool:
+    """URL 命中全局缓存时把缓存对象链接到 dest_path（无扩展名时补上缓存记录的扩展名）。"""
+    hit = media_cache_lookup(url)
+    if not hit:
+        return False
+    obj, ext = hit
+    if ext and '.' not in os.path.basename(dest_path):
+        dest_path += ext
+    try:
+        _link_or_copy(obj, dest_path)
+    except OSError as e:
+        print(f"[jianying_export] [MEDIA_CACHE] 链接失败 {e}: {obj} → {dest_path}，改为重新下载", file=sys.stderr, flush=True)
+        return False
+    print(f"[jianying_export] [MEDIA_CACHE] 命中 {os.path.basename(dest_path)}", file=sys.stderr, flush=True)
+    return True
+
+
+def _save_download(chunks, dest_path: str, url: str = None) -> None:
+    """把下载内容（bytes 块迭代器）写入 dest_path。
+
+    缓存可用时边写边算 sha256，先收进全局缓存（url 不为空时同时记 URL 索引），再链接进草稿目录。
+    """
+    tmp = media_cache_tmp_path()
+    if not tmp:
+        with open(dest_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        return
+    try:
+        h = hashlib.sha256()
+        with open(tmp, 'wb') as f:
+            for chunk in chunks:
+                h.update(chunk)
+                f.write(chunk)
+        obj = media_cache_put(tmp, h.hexdigest(), os.path.splitext(dest_path)[1], url=url)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    _link_or_copy(obj, dest_path)
+
+
+def _download_file_attempts(url: str, dest_path: str, timeout: int, max_retries: int) -> bool:
+    """_download_file 的实际下载循环（本地路径 / data:URL / http，带重试）。"""
+    import time as _time
+
+    last_err = None
     for attempt in range(max_retries):
         try:
             # ── 本地文件路径：直接复制，避免误走 urllib ──────────────────────
@@ -256,39 +821,12 @@ def _download_file(url: str, dest_path: str, timeout: int = 120, max_retries: in
                     return False
 
             if url.startswith('data:'):
-                # data:image/png;base64,iVBORw0KG...
-                header, data = url.split(',', 1)
-                import base64
-                # 提取 mime type
-                mime_match = re.search(r'data:([^;]+)', header)
-                ext = '.png'
-                if mime_match:
-                    mime = mime_match.group(1)
-                    ext_map = {
-                        'image/png': '.png',
-                        'image/jpeg': '.jpg',
-                        'image/jpg': '.jpg',
-                        'image/gif': '.gif',
-                        'image/webp': '.webp',
-                        'audio/wav': '.wav',
-                        'audio/mpeg': '.mp3',
-                        'audio/mp3': '.mp3',
-                        'audio/mp4': '.m4a',
-                        'audio/x-m4a': '.m4a',
-                        'audio/flac': '.flac',
-                        'audio/ogg': '.ogg',
-                        'audio/webm': '.webm',
-                        'video/mp4': '.mp4',
-                        'video/quicktime': '.mov',
-                        'video/webm': '.webm',
-                    }
-                    ext = ext_map.get(mime, ext)
-                # 如果文件没有扩展名，加上推断的扩展名
+                # data:image/png;base64,iVBORw0KG...（分块解码写盘，不整体 b64decode）
+                header = url[:url.index(',')]
+                # 如果文件没有扩展名，加上从 MIME 推断的扩展名
                 if '.' not in os.path.basename(dest_path):
-                    dest_path += ext
-                binary_data = base64.b64decode(data)
-                with open(dest_path, 'wb') as f:
-                    f.write(binary_data)
+                    dest_path += _data_url_ext(header)
+                _save_download(_iter_data_url(url), dest_path)
                 # Railway 环境：定期清理临时文件防止磁盘满
                 if platform.system() == "Linux":
                     disk_ok, disk_free = check_disk_space()
@@ -296,22 +834,9 @@ def _download_file(url: str, dest_path: str, timeout: int = 120, max_retries: in
                         cleanup_temp_files()
                 return True
 
-            # HTTP/HTTPS 下载
-            import urllib.request
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            }
-            # 常见站点的特殊 headers
-            if 'runninghub.ai' in url.lower() or 'runninghub.cn' in url.lower():
-                headers['Referer'] = 'https://www.runninghub.ai/'
-                timeout = max(timeout, 180)  # RunningHub 文件较大，增加超时
-            elif 'api.openlux.ai' in url.lower() or 'openlux.ai' in url.lower():
-                headers['Referer'] = 'https://api.openlux.ai/'
-            elif 'jianying' in url.lower():
-                headers['Referer'] = 'https://lv.ulikecom.com/'
-
-            req = urllib.request.Request(url, headers=headers)
-            with urllib.request.urlopen(req, timeout=timeout) as response:
+            # HTTP/HTTPS 下载（经下载引擎：按 host 复用 keep-alive 连接 + 自适应并发上限）
+            headers, req_timeout = _download_headers(url, timeout)
+            with get_download_engine().open(url, headers, req_timeout) as response:
                 content_type = response.headers.get('Content-Type', '')
                 # 根据 Content-Type 自动推断扩展名
                 if '.' not in os.path.basename(dest_path):
@@ -336,8 +861,7 @@ def _download_file(url: str, dest_path: str, timeout: int = 120, max_retries: in
                     ext = ct_map.get(content_type.split(';')[0].strip(), '')
                     if ext:
                         dest_path += ext
-                with open(dest_path, 'wb') as f:
-                    shutil.copyfileobj(response, f)
+                _save_download(iter(lambda: response.read(1 << 20), b''), dest_path, url=url)
             return True
         except Exception as e:
             last_err = e
@@ -474,79 +998,174 @@ def _timestamp_us() -> int:
     return int(time.time() * 1_000_000)
 
 
-def _make_id() -> str:
-    return str(uuid.uuid4()).upper()
+# seed 构建的草稿时间戳：取 SOURCE_DATE_EPOCH（秒），未设置时固定为 2024-01-01 00:00:00 UTC
+_SEEDED_BUILD_EPOCH = 1_704_067_200
 
 
-def _read_image_dimensions(path: str, fallback_w: int, fallback_h: int) -> tuple:
-    """读取 PNG/JPEG 宽高，失败则返回画布尺寸。"""
+def _build_timestamp_us(seed=None) -> int:
+    """草稿 create_time / update_time。指定 seed 时返回固定值，保证同一输入的草稿逐字节相同。"""
+    if seed is None:
+        return _timestamp_us()
     try:
-        with open(path, "rb") as f:
-            head = f.read(32)
-        if len(head) >= 24 and head[:8] == b"\x89PNG\r\n\x1a\n":
-            import struct
-            w, h = struct.unpack(">II", head[16:24])
-            if w > 0 and h > 0:
-                return w, h
-        if len(head) >= 2 and head[:2] == b"\xff\xd8":
-            with open(path, "rb") as f:
-                data = f.read()
-            i = 2
-            while i + 9 < len(data):
-                if data[i] != 0xFF:
-                    break
-                marker = data[i + 1]
-                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
-                    h = (data[i + 5] << 8) | data[i + 6]
-                    w = (data[i + 7] << 8) | data[i + 8]
-                    if w > 0 and h > 0:
-                        return w, h
-                seg_len = (data[i + 2] << 8) | data[i + 3]
-                i += 2 + seg_len
-    except Exception:
-        pass
-    return fallback_w, fallback_h
+        epoch = int(os.environ.get("SOURCE_DATE_EPOCH", "") or _SEEDED_BUILD_EPOCH)
+    except ValueError:
+        epoch = _SEEDED_BUILD_EPOCH
+    return epoch * 1_000_000
 
 
-def _ffprobe_duration_us(path: str):
-    """音频/视频时长（微秒），失败返回 None。部分 FLAC 仅 stream 有 duration，format 会为 N/A。"""
-    try:
-        r = subprocess.run(
-            [
-                "ffprobe",
-                "-v",
-                "error",
-                "-show_entries",
-                "format=duration",
-                "-show_entries",
-                "stream=duration",
-                "-of",
-                "json",
-                path,
-            ],
-            capture_output=True,
-            text=True,
-            timeout=60,
-        )
-        if r.returncode != 0 or not (r.stdout or "").strip():
+# 素材 / 片段 / 关键帧 id：共享的批量分配器（draft_ids.py），JIANYING_ID_SEED 可让 id 可复现
+_make_id = draft_ids.make_id
+
+
+# ---- 图片头部探测（只读文件头，不读整张图片）----
+_IMAGE_HEAD_BYTES = 64
+_JPEG_MAX_SEGMENTS = 256
+_HEIF_META_MAX_BYTES = 1024 * 1024
+# EXIF Orientation 5~8 表示图片需旋转 90°/270° 显示，宽高互换
+_EXIF_ORIENTATION_SWAP = {5, 6, 7, 8}
+
+
+def _exif_orientation(app1: bytes) -> int:
+    """从 JPEG APP1 段（"Exif\\0\\0" + TIFF）中读取 IFD0 的 Orientation（0x0112），没有则返回 1。"""
+    if not app1.startswith(b"Exif\x00\x00"):
+        return 1
+    tiff = app1[6:]
+    if tiff[:2] == b"II":
+        end = "<"
+    elif tiff[:2] == b"MM":
+        end = ">"
+    else:
+        return 1
+    ifd = struct.unpack(end + "I", tiff[4:8])[0]
+    count = struct.unpack(end + "H", tiff[ifd : ifd + 2])[0]
+    for k in range(count):
+        e = ifd + 2 + k * 12
+        if e + 12 > len(tiff):
+            break
+        tag = struct.unpack(end + "H", tiff[e : e + 2])[0]
+        if tag == 0x0112:
+            return struct.unpack(end + "H", tiff[e + 8 : e + 10])[0]
+    return 1
+
+
+def _probe_jpeg(f) -> typing.Optional[dict]:
+    """逐段 seek 遍历 JPEG marker：只读 APP1(EXIF) 与 SOFn（含 progressive SOF2），其余段直接跳过。"""
+    f.seek(2)
+    orientation = 1
+    for _ in range(_JPEG_MAX_SEGMENTS):
+        b = f.read(1)
+        while b == b"\xff":  # 跳过填充字节
+            b = f.read(1)
+        if not b:
             return None
-        data = json.loads(r.stdout or "{}")
-        fmt = data.get("format") or {}
-        fd = float(fmt.get("duration") or 0)
-        if fd > 0:
-            return max(1, int(fd * 1_000_000))
-        best = 0.0
-        for s in data.get("streams") or []:
-            d = float(s.get("duration") or 0)
-            if d > best:
-                best = d
-        if best > 0:
-            return max(1, int(best * 1_000_000))
-    except Exception:
+        marker = b[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # 无长度的独立 marker
+            continue
+        if marker in (0xD9, 0xDA):  # EOI / SOS 之后是图像数据，找不到 SOF 就放弃
+            return None
+        seg = f.read(2)
+        if len(seg) < 2:
+            return None
+        seg_len = struct.unpack(">H", seg)[0]
+        if seg_len < 2:
+            return None
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            sof = f.read(5)
+            if len(sof) < 5:
+                return None
+            h, w = struct.unpack(">HH", sof[1:5])
+            return {"format": "jpeg", "width": w, "height": h, "orientation": orientation}
+        if marker == 0xE1 and orientation == 1:
+            try:
+                orientation = _exif_orientation(f.read(seg_len - 2))
+            except (struct.error, IndexError):
+                orientation = 1
+            continue
+        f.seek(seg_len - 2, os.SEEK_CUR)
+    return None
+
+
+def _probe_heif(f) -> typing.Optional[dict]:
+    """AVIF / HEIF：读取顶层 meta box，取最大的 ispe（主图 / grid 画布）宽高；irot（逆时针 90° 倍数）折算成 EXIF 方向。"""
+    meta = _read_top_level_box(f, b"meta", _HEIF_META_MAX_BYTES)
+    if not meta:
+        return None
+    best = (0, 0)
+    orientation = 1
+    # meta 是 full box：跳过 4 字节 version/flags
+    for btype, ps, pe in _iter_boxes(meta, 4):
+        if btype != b"iprp":
+            continue
+        for t2, p2, e2 in _iter_boxes(meta, ps, pe):
+            if t2 != b"ipco":
+                continue
+            for t3, p3, e3 in _iter_boxes(meta, p2, e2):
+                if t3 == b"ispe" and p3 + 12 <= e3:
+                    w, h = struct.unpack(">II", meta[p3 + 4 : p3 + 12])
+                    if w * h > best[0] * best[1]:
+                        best = (w, h)
+                elif t3 == b"irot" and p3 < e3 and orientation == 1:
+                    orientation = (1, 8, 3, 6)[meta[p3] & 0x03]
+    if not best[0]:
+        return None
+    return {"format": "avif", "width": best[0], "height": best[1], "orientation": orientation}
+
+
+def probe_image_header(path: str) -> typing.Optional[dict]:
+    """只读文件头识别 PNG / JPEG / WebP / GIF / AVIF(HEIF)，返回
+    {"format", "width", "height", "orientation"}（宽高为编码尺寸，orientation 为 EXIF 方向 1~8）；
+    无法识别时返回 None。每个文件通常只读几 KB。
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(_IMAGE_HEAD_BYTES)
+            if head[:8] == b"\x89PNG\r\n\x1a\n" and len(head) >= 24:
+                w, h = struct.unpack(">II", head[16:24])
+                return {"format": "png", "width": w, "height": h, "orientation": 1}
+            if head[:2] == b"\xff\xd8":
+                return _probe_jpeg(f)
+            if head[:6] in (b"GIF87a", b"GIF89a") and len(head) >= 10:
+                w, h = struct.unpack("<HH", head[6:10])
+                return {"format": "gif", "width": w, "height": h, "orientation": 1}
+            if head[:4] == b"RIFF" and head[8:12] == b"WEBP" and len(head) >= 30:
+                chunk = head[12:16]
+                if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+                    w, h = struct.unpack("<HH", head[26:30])
+                    w, h = w & 0x3FFF, h & 0x3FFF
+                elif chunk == b"VP8L" and head[20] == 0x2F:
+                    bits = struct.unpack("<I", head[21:25])[0]
+                    w, h = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+                elif chunk == b"VP8X":
+                    w = int.from_bytes(head[24:27], "little") + 1
+                    h = int.from_bytes(head[27:30], "little") + 1
+                else:
+                    return None
+                return {"format": "webp", "width": w, "height": h, "orientation": 1}
+            if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis", b"heic", b"heix", b"mif1", b"msf1"):
+                return _probe_heif(f)
+    except (OSError, struct.error, IndexError):
         pass
     return None
 
 
+def _read_image_dimensions(path: str, fallback_w: int, fallback_h: int) -> tuple:
+    """读取图片显示宽高（EXIF 方向为 90°/270° 时宽高互换），失败则返回画布尺寸。"""
+    info = probe_image_header(path)
+    if not info or info["width"] <= 0 or info["height"] <= 0:
+        return fallback_w, fallback_h
+    if info.get("orientation") in _EXIF_ORIENTATION_SWAP:
+        return info["height"], info["width"]
+    return info["width"], info["height"]
+
+
+def _ffprobe_duration_us(path: str):
+    """音频/视频时长（微秒），失败返回 None。部分 FLAC 仅 stream 有 duration，format 会为 N/A。
+
+    结果来自 probe_media()（带持久化元数据缓存，同内容文件不重复调用 ffprobe）。
+    """
+    return probe_media(path).get("duration_us")
+
+
 def _process_audio_for_export(audio_path: str, silence_pad_ms: int = 50) -> bool:
     """
     给音频文件末尾追加一段极小的静音缓冲（默认 50ms，可配置）。
@@ -674,119 +1293,360 @@ def _process_audio_for_export(audio_path: str, silence_pad_ms: int = 50) -> bool
 
 
 
-def _mp4_box_duration(path: str) -> typing.Optional[int]:
-    """直接解析 MP4 文件的视频轨道 moov>trak>mdia>mdhd box，返回时长微秒数。
+# ---- MP4 / MOV（ISO-BMFF）box 解析 ----
+# 只 seek 读取顶层 box 头，找到 moov 后只读 moov 本身（通常几十 KB ~ 几 MB），不读 mdat。
+# 可独立作为主探测手段（无需 ffprobe）：时长 / 宽高 / 编码 / 帧率 / 旋转角 / 采样率 / 声道。
+_ISOBMFF_TOP_LEVEL = {b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot", b"uuid", b"styp", b"sidx", b"moof", b"meta"}
+_ISOBMFF_CONTAINERS = {b"trak", b"mdia", b"minf", b"stbl", b"mvex", b"edts"}
+_MOOV_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _iter_boxes(buf: bytes, start: int = 0, end: int = None):
+    """遍历 buf[start:end] 内的同级 box，产出 (type, payload_start, payload_end)。"""
+    end = len(buf) if end is None else end
+    i = start
+    while i + 8 <= end:
+        size, btype = struct.unpack(">I4s", buf[i : i + 8])
+        hdr = 8
+        if size == 1:
+            if i + 16 > end:
+                return
+            size = struct.unpack(">Q", buf[i + 8 : i + 16])[0]
+            hdr = 16
+        elif size == 0:
+            size = end - i
+        if size < hdr or i + size > end:
+            return
+        yield btype, i + hdr, i + size
+        i += size
+
+
+def _read_top_level_box(f, wanted: bytes, max_bytes: int) -> typing.Optional[bytes]:
+    """按顶层 box 头 seek 到 wanted 并读出其内容；不是 ISO-BMFF 文件、找不到或超过 max_bytes 时返回 None。"""
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    pos = 0
+    first = True
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        head = f.read(16)
+        if len(head) < 8:
+            return None
+        size, btype = struct.unpack(">I4s", head[:8])
+        if first and btype not in _ISOBMFF_TOP_LEVEL:
+            return None
+        first = False
+        hdr = 8
+        if size == 1:
+            if len(head) < 16:
+                return None
+            size = struct.unpack(">Q", head[8:16])[0]
+            hdr = 16
+        elif size == 0:
+            size = file_size - pos
+        if size < hdr:
+            return None
+        if btype == wanted:
+            if size - hdr > max_bytes:
+                return None
+            f.seek(pos + hdr)
+            data = f.read(size - hdr)
+            return data if len(data) == size - hdr else None
+        pos += size
+    return None
+
+
+def _parse_trak(buf: bytes, start: int, end: int) -> dict:
+    """解析单个 trak：handler / 时长 / 宽高 / 编码 / 帧率 / 旋转角 / 采样率 / 声道。"""
+    trak: dict = {}
+
+    def walk(s: int, e: int) -> None:
+        for btype, ps, pe in _iter_boxes(buf, s, e):
+            if btype in _ISOBMFF_CONTAINERS:
+                walk(ps, pe)
+            elif btype == b"tkhd":
+                v = buf[ps]
+                m = ps + (52 if v == 1 else 40)
+                if m + 44 <= pe:
+                    a, b = struct.unpack(">ii", buf[m : m + 8])
+                    trak["rotation"] = int(round(math.degrees(math.atan2(b, a)))) % 360
+                    w, h = struct.unpack(">II", buf[m + 36 : m + 44])
+                    trak["tkhd_w"], trak["tkhd_h"] = w >> 16, h >> 16
+            elif btype == b"mdhd":
+                v = buf[ps]
+                if v == 1:
+                    ts, dur = struct.unpack(">IQ", buf[ps + 20 : ps + 32])
+                else:
+                    ts, dur = struct.unpack(">II", buf[ps + 12 : ps + 20])
+                trak["timescale"], trak["duration"] = ts, dur
+            elif btype == b"hdlr":
+                trak["handler"] = buf[ps + 8 : ps + 12]
+            elif btype == b"stsd":
+                # 只看第一个 sample entry
+                for etype, es, ee in _iter_boxes(buf, ps + 8, pe):
+                    trak["codec"] = etype.decode("ascii", errors="replace").strip()
+                    if trak.get("handler") == b"vide" and es + 28 <= ee:
+                        trak["width"], trak["height"] = struct.unpack(">HH", buf[es + 24 : es + 28])
+                    elif trak.get("handler") == b"soun" and es + 28 <= ee:
+                        trak["channels"] = struct.unpack(">H", buf[es + 16 : es + 18])[0]
+                        trak["sample_rate"] = struct.unpack(">I", buf[es + 24 : es + 28])[0] >> 16
+                    break
+            elif btype == b"stts":
+                n = struct.unpack(">I", buf[ps + 4 : ps + 8])[0]
+                samples = delta_sum = 0
+                for k in range(min(n, (pe - ps - 8) // 8)):
+                    c, d = struct.unpack(">II", buf[ps + 8 + k * 8 : ps + 16 + k * 8])
+                    samples += c
+                    delta_sum += c * d
+                trak["samples"], trak["delta_sum"] = samples, delta_sum
+
+    walk(start, end)
+    return trak
+
+
+def _mp4_box_meta(path: str) -> typing.Optional[dict]:
+    """解析 MP4 / MOV 的 moov，返回与 probe_media() 同结构的元数据；非 ISO-BMFF 或解析失败返回 None。
 
-    注意：只取视频轨道（hdlr.handler_type == "vide"），忽略音频轨道，
+    视频时长只取视频轨道（hdlr.handler_type == "vide"）的 mdhd，
     防止音频轨道时长（5s）覆盖视频轨道时长（9s）。
+    额外字段：codec（sample entry 类型，如 avc1 / hvc1）、fps、rotation（tkhd 矩阵，顺时针度数）。
     """
     try:
         with open(path, "rb") as f:
-            data = f.read()
+            moov = _read_top_level_box(f, b"moov", _MOOV_MAX_BYTES)
+    except OSError:
+        return None
+    if not moov:
+        return None
+    try:
+        movie_ts = movie_dur = fragment_dur = 0
+        traks = []
+        for btype, ps, pe in _iter_boxes(moov):
+            if btype == b"mvhd":
+                v = moov[ps]
+                if v == 1:
+                    movie_ts, movie_dur = struct.unpack(">IQ", moov[ps + 20 : ps + 32])
+                else:
+                    movie_ts, movie_dur = struct.unpack(">II", moov[ps + 12 : ps + 20])
+            elif btype == b"trak":
+                traks.append(_parse_trak(moov, ps, pe))
+            elif btype == b"mvex":
+                # 分片 MP4：mdhd 时长可能为 0，用 mehd.fragment_duration（mvhd 时间刻度）
+                for t2, p2, _ in _iter_boxes(moov, ps, pe):
+                    if t2 == b"mehd":
+                        fmt = ">Q" if moov[p2] == 1 else ">I"
+                        fragment_dur = struct.unpack(fmt, moov[p2 + 4 : p2 + 4 + struct.calcsize(fmt)])[0]
+    except (struct.error, IndexError):
+        return None
+
+    meta: dict = {}
+    movie_dur = movie_dur or fragment_dur
+    if movie_ts > 0 and movie_dur > 0:
+        meta["duration_us"] = max(1, int(movie_dur / movie_ts * 1_000_000))
+
+    def _trak_us(t: dict) -> int:
+        ts, dur = t.get("timescale") or 0, t.get("duration") or 0
+        if ts > 0 and dur > 0:
+            return int(dur / ts * 1_000_000)
+        if movie_ts > 0 and fragment_dur > 0:
+            return int(fragment_dur / movie_ts * 1_000_000)
+        return 0
+
+    vt = next((t for t in traks if t.get("handler") == b"vide"), None)
+    if vt:
+        meta["width"] = int(vt.get("width") or vt.get("tkhd_w") or 0)
+        meta["height"] = int(vt.get("height") or vt.get("tkhd_h") or 0)
+        meta["rotation"] = int(vt.get("rotation") or 0)
+        if vt.get("codec"):
+            meta["codec"] = vt["codec"]
+        if vt.get("samples") and vt.get("delta_sum") and vt.get("timescale"):
+            meta["fps"] = round(vt["samples"] * vt["timescale"] / vt["delta_sum"], 3)
+        vd = _trak_us(vt)
+        if vd > 0:
+            meta["video_duration_us"] = max(33_333, vd)
+    at = next((t for t in traks if t.get("handler") == b"soun"), None)
+    if at:
+        if at.get("sample_rate"):
+            meta["sample_rate"] = int(at["sample_rate"])
+        if at.get("channels"):
+            meta["channels"] = int(at["channels"])
+        if not vt and at.get("codec"):
+            meta["codec"] = at["codec"]
+    if "duration_us" not in meta:
+        best = max([_trak_us(t) for t in traks] or [0])
+        if best > 0:
+            meta["duration_us"] = best
+    return meta
+
+
+# ---- 媒体元数据服务（MP4 box 解析 / ffprobe + 持久化缓存）----
+# MP4 / MOV 先用 _mp4_box_meta 纯 Python 解析（不启动子进程）；其余格式或解析不出时长时，
+# 每个文件只调用一次 ffprobe（一次取齐时长 / 宽高 / 采样率 / 声道）。结果写入
+# <get_persistent_dir()>/media_meta.sqlite，键为内容指纹（整个文件的 sha256）+ 文件大小：
+# 大小相同、只有中间不同的文件（如 moov 与结尾相同的重新编码 MP4）不会共用元数据。
+# 全量哈希记在同库的 file_digest 表，按 (设备, inode) 存，大小与 mtime_ns 不变时直接复用，不重新读文件；
+# 全局媒体缓存命中时会 touch 对象（LRU），硬链接到草稿的文件 mtime 随之变化，此时重新哈希一次。
+# mtime 不进元数据的键，只作记录。探测失败（如 ffprobe 不可用）不写缓存，下次仍会重试。
+_MEDIA_HASH_CHUNK = 1 << 20
+# 探测线程数：ffprobe 本身是子进程，线程只负责等待，因此用线程池而非进程池
+PROBE_WORKERS = max(1, int(os.environ.get("JIANYING_PROBE_WORKERS", "0") or 0) or min(8, max(2, os.cpu_count() or 2)))
+_media_meta_db = None
+_media_meta_db_lock = threading.Lock()
+
+
+def _media_fingerprint(path: str) -> typing.Optional[tuple]:
+    """返回 (内容指纹, 文件大小, mtime_ns)，内容指纹为整个文件的 sha256；文件不可读时返回 None。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    digest = _file_digest_get(stamp)
+    if digest is None:
+        h = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(_MEDIA_HASH_CHUNK), b""):
+                    h.update(chunk)
+        except OSError:
+            return None
+        digest = h.hexdigest()
+        _file_digest_put(stamp, digest)
+    return digest, st.st_size, st.st_mtime_ns
+
+
+def _media_meta_conn():
+    """惰性打开元数据缓存库（多线程共用一个连接，由 _media_meta_db_lock 串行化；WAL 支持多进程）。"""
+    global _media_meta_db
+    if _media_meta_db is None:
+        _media_meta_db = False
+        if os.environ.get("JIANYING_MEDIA_META_CACHE", "1") != "0":
+            try:
+                import sqlite3
+                db_path = os.path.join(get_persistent_dir(), "media_meta.sqlite")
+                conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS media_meta ("
+                    " fingerprint TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER,"
+                    " meta TEXT NOT NULL, probed_at INTEGER NOT NULL,"
+                    " PRIMARY KEY (fingerprint, size))"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS file_digest ("
+                    " dev INTEGER NOT NULL, ino INTEGER NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+                    " digest TEXT NOT NULL, PRIMARY KEY (dev, ino))"
+                )
+                conn.commit()
+                _media_meta_db = conn
+            except Exception as e:
+                print(f"[jianying_export] [MEDIA_META] 元数据缓存不可用，跳过缓存: {e}", file=sys.stderr, flush=True)
+    return _media_meta_db or None
+
 
-        moov_idx = data.find(b"moov")
-        if moov_idx < 0:
+def _file_digest_get(stamp: tuple) -> typing.Optional[str]:
+    """stamp = (dev, ino, size, mtime_ns)；该 inode 上次哈希时大小与 mtime 都相同才返回记录的 sha256。"""
+    with _media_meta_db_lock:
+        conn = _media_meta_conn()
+        if not conn:
             return None
-        moov_size = struct.unpack(">I", data[moov_idx - 4 : moov_idx])[0]
-        moov_data = data[moov_idx + 4 : moov_idx + moov_size]
-
-        i = 0
-        while i <= len(moov_data) - 8:
-            s = struct.unpack(">I", moov_data[i : i + 4])[0]
-            t = moov_data[i + 4 : i + 8].decode("ascii", errors="?")
-            if s == 0 or s < 8:
-                i += 1
-                continue
+        try:
+            row = conn.execute(
+                "SELECT digest FROM file_digest WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?", stamp
+            ).fetchone()
+        except Exception:
+            return None
+    return row[0] if row else None
 
-            if t == "trak":
-                trak_data = moov_data[i + 8 : i + s]
-
-                # 检查 hdlr，确认是视频轨道
-                is_video_track = False
-                k_check = 0
-                while k_check <= len(trak_data) - 8:
-                    s_kc = struct.unpack(">I", trak_data[k_check : k_check + 4])[0]
-                    t_kc = trak_data[k_check + 4 : k_check + 8].decode("ascii", errors="?")
-                    if s_kc == 0 or s_kc < 8:
-                        k_check += 1
-                        continue
-                    if t_kc == "mdia":
-                        mdia_check = trak_data[k_check + 8 : k_check + s_kc]
-                        k2 = 0
-                        while k2 <= len(mdia_check) - 8:
-                            s_k2 = struct.unpack(">I", mdia_check[k2 : k2 + 4])[0]
-                            t_k2 = mdia_check[k2 + 4 : k2 + 8].decode("ascii", errors="?")
-                            if s_k2 == 0 or s_k2 < 8:
-                                k2 += 1
-                                continue
-                            if t_k2 == "hdlr":
-                                hdlr_data = mdia_check[k2 + 8 : k2 + s_k2]
-                                if len(hdlr_data) >= 12:
-                                    handler_type = hdlr_data[8:12]
-                                    if handler_type == b"vide":
-                                        is_video_track = True
-                                break
-                            k2 += s_k2
-                        break
-                    k_check += s_kc
-                if not is_video_track:
-                    i += s
-                    continue
-
-                # 在视频轨道中找 mdia>mdhd
-                j = 0
-                while j <= len(trak_data) - 8:
-                    s2 = struct.unpack(">I", trak_data[j : j + 4])[0]
-                    t2 = trak_data[j + 4 : j + 8].decode("ascii", errors="?")
-                    if s2 == 0 or s2 < 8:
-                        j += 1
-                        continue
-                    if t2 == "mdia":
-                        mdia_data = trak_data[j + 8 : j + s2]
-                        k = 0
-                        while k <= len(mdia_data) - 8:
-                            s3 = struct.unpack(">I", mdia_data[k : k + 4])[0]
-                            t3 = mdia_data[k + 4 : k + 8].decode("ascii", errors="?")
-                            if s3 == 0 or s3 < 8:
-                                k += 1
-                                continue
-                            if t3 == "mdhd":
-                                p = k + 8
-                                v = mdia_data[p]
-                                if v == 0:
-                                    ts = struct.unpack(">I", mdia_data[p + 12 : p + 16])[0]
-                                    dur = struct.unpack(">I", mdia_data[p + 16 : p + 20])[0]
-                                else:
-                                    ts = struct.unpack(">I", mdia_data[p + 20 : p + 24])[0]
-                                    dur = struct.unpack(">Q", mdia_data[p + 24 : p + 32])[0]
-                                if ts > 0:
-                                    return int(dur / ts * 1_000_000)
-                            k += s3
-                    j += s2
-            i += s
-    except Exception:
-        pass
-    return None
 
-def _ffprobe_video_meta(path: str):
-    """返回 (duration_us, width, height)，失败则为 (None, 0, 0)。
+def _file_digest_put(stamp: tuple, digest: str) -> None:
+    with _media_meta_db_lock:
+        conn = _media_meta_conn()
+        if not conn:
+            return
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO file_digest (dev, ino, size, mtime_ns, digest) VALUES (?, ?, ?, ?, ?)",
+                (*stamp, digest),
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"[jianying_export] [MEDIA_META] 写入文件哈希失败: {e}", file=sys.stderr, flush=True)
+
+
+def _media_meta_cache_get(fp: tuple) -> typing.Optional[dict]:
+    with _media_meta_db_lock:
+        conn = _media_meta_conn()
+        if not conn:
+            return None
+        try:
+            row = conn.execute(
+                "SELECT meta FROM media_meta WHERE fingerprint = ? AND size = ?", (fp[0], fp[1])
+            ).fetchone()
+        except Exception:
+            return None
+    if not row:
+        return None
+    try:
+        return json.loads(row[0])
+    except ValueError:
+        return None
+
+
+def _media_meta_cache_put(fp: tuple, meta: dict) -> None:
+    with _media_meta_db_lock:
+        conn = _media_meta_conn()
+        if not conn:
+            return
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO media_meta (fingerprint, size, mtime_ns, meta, probed_at) VALUES (?, ?, ?, ?, ?)",
+                (fp[0], fp[1], fp[2], json.dumps(meta), int(time.time())),
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"[jianying_export] [MEDIA_META] 写入缓存失败: {e}", file=sys.stderr, flush=True)
+
+
+def probe_media(path: str) -> dict:
+    """探测媒体元数据（带持久化缓存）。
+
+    返回 dict（探测不到的字段缺省）：
+      duration_us        文件时长（format.duration，缺失时取最长 stream.duration）
+      video_duration_us  视频轨时长（MP4 视频轨 mdhd 优先，其次见 _ffprobe_media），仅视频文件
+      width / height     首个视频流宽高
+      sample_rate / channels  首个音频流采样率 / 声道数
+      codec / fps / rotation  仅 MP4 / MOV 解析可得
+    """
+    fp = _media_fingerprint(path)
+    if fp:
+        cached = _media_meta_cache_get(fp)
+        if cached is not None:
+            return cached
+    meta = _mp4_box_meta(path)
+    if not meta or not (meta.get("duration_us") or meta.get("video_duration_us")):
+        meta = _ffprobe_media(path)
+    if fp and (meta.get("duration_us") or meta.get("video_duration_us")):
+        _media_meta_cache_put(fp, meta)
+    return meta
+
+
+def _ffprobe_media(path: str) -> dict:
+    """单次 ffprobe 取齐所有元数据（MP4 box 解析失败或非 MP4 时使用）。视频轨时长优先级：
 
-    优先级：
     1. ffprobe stream.duration（部分 AI 视频用此字段）
     2. ffprobe format.duration（标准字段）
     3. nb_read_frames / avg_frame_rate（metadata 损坏时的兜底）
-    4. _mp4_box_duration（只取视频轨道，防止音频轨道时长覆盖）
     """
+    meta: dict = {}
     try:
         r = subprocess.run(
             [
                 "ffprobe",
                 "-v",
                 "error",
-                "-select_streams",
-                "v:0",
                 "-show_entries",
-                "stream=width,height,duration,nb_read_frames,avg_frame_rate",
+                "stream=codec_type,width,height,duration,nb_read_frames,avg_frame_rate,sample_rate,channels",
                 "-show_entries",
                 "format=duration",
                 "-of",
@@ -797,27 +1657,54 @@ def _ffprobe_video_meta(path: str):
             text=True,
             timeout=90,
         )
-        if r.returncode != 0:
-            # ffprobe 失败，尝试 MP4 box 解析
-            mp4_dur = _mp4_box_duration(path)
-            if mp4_dur:
-                return mp4_dur, 0, 0
-            return None, 0, 0
+    except Exception:
+        r = None
+    if r is None or r.returncode != 0 or not (r.stdout or "").strip():
+        return meta
+    try:
         data = json.loads(r.stdout or "{}")
-        st = (data.get("streams") or [{}])[0]
-        fmt = data.get("format") or {}
-        w = int(st.get("width") or 0)
-        h = int(st.get("height") or 0)
+    except ValueError:
+        return meta
+
+    streams = data.get("streams") or []
+    fmt = data.get("format") or {}
 
+    def _f(v) -> float:
+        try:
+            return float(v or 0)
+        except (TypeError, ValueError):
+            return 0.0
+
+    # 文件时长：format.duration → 最长 stream.duration
+    fd = _f(fmt.get("duration"))
+    if fd <= 0:
+        fd = max([_f(st.get("duration")) for st in streams] or [0.0])
+    if fd > 0:
+        meta["duration_us"] = max(1, int(fd * 1_000_000))
+
+    ast = next((st for st in streams if st.get("codec_type") == "audio"), None)
+    if ast:
+        try:
+            if ast.get("sample_rate"):
+                meta["sample_rate"] = int(ast["sample_rate"])
+            if ast.get("channels"):
+                meta["channels"] = int(ast["channels"])
+        except (TypeError, ValueError):
+            pass
+
+    vst = next((st for st in streams if st.get("codec_type") == "video"), None)
+    if vst:
+        meta["width"] = int(vst.get("width") or 0)
+        meta["height"] = int(vst.get("height") or 0)
         # 1) stream.duration
-        d = float(st.get("duration") or 0)
+        d = _f(vst.get("duration"))
         # 2) format.duration 兜底
         if d <= 0:
-            d = float(fmt.get("duration") or 0)
+            d = _f(fmt.get("duration"))
         # 3) nb_read_frames / avg_frame_rate 兜底
         if d <= 0:
-            nb_frames_str = st.get("nb_read_frames")
-            fps_str = st.get("avg_frame_rate")
+            nb_frames_str = vst.get("nb_read_frames")
+            fps_str = vst.get("avg_frame_rate")
             if nb_frames_str and fps_str:
                 try:
                     nb_frames = float(nb_frames_str)
@@ -829,18 +1716,36 @@ def _ffprobe_video_meta(path: str):
                 except (ValueError, ZeroDivisionError):
                     pass
 
-        ffprobe_d = d
+        if d > 0:
+            meta["video_duration_us"] = max(33_333, int(d * 1_000_000))
+    return meta
 
-        # 4) MP4 box 解析：只取视频轨道，防止音频轨道时长覆盖
-        mp4_dur_us = _mp4_box_duration(path)
-        if mp4_dur_us and mp4_dur_us > 0:
-            d = mp4_dur_us / 1_000_000
-            print(f"[ffprobe] duration via MP4 box (video track): {d:.3f}s (overrides ffprobe={ffprobe_d:.3f}s)", file=sys.stderr)
 
-        du = max(33_333, int(d * 1_000_000)) if d > 0 else None
-        return du, w, h
-    except Exception:
-        return None, 0, 0
+def _ffprobe_video_meta(path: str):
+    """返回 (duration_us, width, height)，失败则为 (None, 0, 0)。时长优先级见 _ffprobe_media。"""
+    meta = probe_media(path)
+    return meta.get("video_duration_us"), int(meta.get("width") or 0), int(meta.get("height") or 0)
+
+
+class ProbedMedia(typing.NamedTuple):
+    """已下载并探测过的媒体描述：组装 row 与生成草稿 JSON 时直接使用，不再按路径重新探测。"""
+
+    kind: str  # video / image / audio
+    abs_path: str
+    duration_us: typing.Optional[int] = None  # 探测到的真实时长；None 表示未探测到（图片恒为 None）
+    width: int = 0
+    height: int = 0
+
+
+def describe_media(kind: str, path: str, fallback_w: int = 0, fallback_h: int = 0) -> ProbedMedia:
+    """按类型探测单个媒体文件，返回 ProbedMedia。"""
+    if kind == "video":
+        vd, vw, vh = _ffprobe_video_meta(path)
+        return ProbedMedia(kind, path, vd, vw, vh)
+    if kind == "image":
+        iw, ih = _read_image_dimensions(path, fallback_w, fallback_h)
+        return ProbedMedia(kind, path, None, iw, ih)
+    return ProbedMedia(kind, path, _ffprobe_duration_us(path))
 
 
 # 视频入场动画（pyJianYingDraft metadata/video_intro，免费项；duration_us 与元数据一致）
@@ -1117,11 +2022,11 @@ def _build_keyframe_list(property_type: str, keyframes: list) -> dict:
     }
 
 
-def _build_ken_burns_zoom(dur_us: int, direction: str = None) -> list[dict]:
+def _build_ken_burns_zoom(dur_us: int, direction: str = None, rng=None) -> list[dict]:
     """
     Ken Burns 缓慢放大效果（图片关键帧动画）。
     基于 pyJianYingDraft KeyframeProperty.uniform_scale。
-    direction: "in" | "out" | None（随机）
+    direction: "in" | "out" | None（随机，取自 rng；默认 random 模块）
     返回 common_keyframes 列表（可直接赋值给 segment["common_keyframes"]）。
 
     缩放原理：uniform_scale 值为 1.0 时为原始大小。
@@ -1130,7 +2035,7 @@ def _build_ken_burns_zoom(dur_us: int, direction: str = None) -> list[dict]:
     - 过程略有偏移模拟真实相机运动
     """
     if direction is None:
-        direction = random.choice(["in", "out"])
+        direction = (rng or random).choice(["in", "out"])
     # 留出前后各 10% 时间作为缓入缓出区间
     hold_start = int(dur_us * 0.05)
     hold_end = int(dur_us * 0.90)
@@ -1194,48 +2099,493 @@ def _build_audio_fade_out(seg_end_us: int, fade_dur_us: int = 500_000) -> list[d
     ]
 
 
-def _load_lv59_template() -> dict:
-    tpl_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jianying_draft_content_template.json")
-    with open(tpl_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+_LV59_TEMPLATE_TEXT: typing.Optional[str] = None
 
 
-def _build_lv59_main_script(
-    draft_id: str,
-    now_us: int,
-    width: int,
-    height: int,
-    fps: int,
-    total_duration: int,
-    prepared_shots: list,
-    draft_display_name: str = "",
-    random_transitions: bool = False,
-    random_filters: bool = False,
-    total_shots: int = 0,
-) -> dict:
-    """
-    剪映专业版 5.9 macOS 主时间线格式：根目录 draft_info.json / draft_content.json
-    使用 materials + tracks（与 pyJianYingDraft 模板一致），不能用仅 timelines/entity_list 的旧格式。
-    """
-    content = _load_lv59_template()
-    mats = content["materials"]
-    for k in mats:
-        if isinstance(mats[k], list):
-            mats[k] = []
+def _load_lv59_template() -> dict:
+    """读取剪映 5.9 模板；原文只读一次（常驻 worker 多任务复用），每次返回新的 dict。"""
+    global _LV59_TEMPLATE_TEXT
+    if _LV59_TEMPLATE_TEXT is None:
+        tpl_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jianying_draft_content_template.json")
+        with open(tpl_path, "r", encoding="utf-8") as f:
+            _LV59_TEMPLATE_TEXT = f.read()
+    return json.loads(_LV59_TEMPLATE_TEXT)
+
+
+# ---- 剪映 5.9 时间线模型（__slots__ 对象，写出时才展开为 JSON）----
+# 每个素材 / 片段只保存真正随镜头变化的字段；clip、hdr_settings、responsive_layout 等
+# 常量子结构全局只有一份（只读，不要原地修改），由 encode_draft_json 的 default 钩子
+# 在序列化时展开成 lv59 JSON，键顺序与原先的 dict 字面量一致。
+_LV59_CROP = {
+    "lower_left_x": 0.0,
+    "lower_left_y": 1.0,
+    "lower_right_x": 1.0,
+    "lower_right_y": 1.0,
+    "upper_left_x": 0.0,
+    "upper_left_y": 0.0,
+    "upper_right_x": 1.0,
+    "upper_right_y": 0.0,
+}
+_LV59_MATTING = {
+    "flag": 0,
+    "has_use_quick_brush": False,
+    "has_use_quick_eraser": False,
+    "interactiveTime": (),
+    "path": "",
+    "strokes": (),
+}
+_LV59_STABLE = {"matrix_path": "", "stable_level": 0, "time_range": {"duration": 0, "start": 0}}
+_LV59_VIDEO_ALGORITHM = {
+    "algorithms": (),
+    "complement_frame_config": None,
+    "deflicker": None,
+    "gameplay_configs": (),
+    "motion_blur_config": None,
+    "noise_reduction": None,
+    "path": "",
+    "quality_enhance": None,
+    "time_range": None,
+}
+_LV59_AI_BEATS = {
+    "beat_speed_infos": (),
+    "beats_path": "",
+    "beats_url": "",
+    "melody_path": "",
+    "melody_percents": (0.0,),
+    "melody_url": "",
+}
+_LV59_CLIP_VIDEO = {
+    "alpha": 1.0,
+    "flip": {"horizontal": False, "vertical": False},
+    "rotation": 0.0,
+    "scale": {"x": 1.0, "y": 1.0},
+    "transform": {"x": 0.0, "y": 0.0},
+}
+_LV59_CLIP_CAPTION = {**_LV59_CLIP_VIDEO, "transform": {"x": 0.0, "y": -0.8}}
+_LV59_HDR_SETTINGS = {"intensity": 1.0, "mode": 1, "nits": 1000}
+_LV59_RESPONSIVE_LAYOUT = {
+    "enable": False,
+    "horizontal_pos_layout": 0,
+    "size_layout": 0,
+    "target_follow": "",
+    "vertical_pos_layout": 0,
+}
+_LV59_UNIFORM_SCALE_ON = {"on": True, "value": 1.0}
+_LV59_UNIFORM_SCALE_OFF = {"on": False, "value": 1.0}
+
+
+class _Lv59Node:
+    """时间线模型节点基类：to_json() 返回该节点的 lv59 JSON（dict）。"""
+
+    __slots__ = ()
+
+    def to_json(self) -> dict:
+        raise NotImplementedError
+
+
+class _Lv59Speed(_Lv59Node):
+    __slots__ = ("id", "speed")
+
+    def __init__(self, id: str, speed: float = 1.0):
+        self.id = id
+        self.speed = speed
+
+    def to_json(self) -> dict:
+        return {"curve_speed": None, "id": self.id, "mode": 0, "speed": self.speed, "type": "speed"}
+
+
+class _Lv59Canvas(_Lv59Node):
+    __slots__ = ("id",)
+
+    def __init__(self, id: str):
+        self.id = id
+
+    def to_json(self) -> dict:
+        return {
+            "album_image": "",
+            "blur": 0.0,
+            "color": "",
+            "id": self.id,
+            "image": "",
+            "image_id": "",
+            "image_name": "",
+            "source_platform": 0,
+            "team_id": "",
+            "type": "canvas_color",
+        }
 
-    video_track_id = _make_id()
-    audio_track_id = _make_id()
-    text_track_id = _make_id()
 
-    video_segments = []
-    audio_segments = []
-    text_segments = []
-    # 记录每个镜头「最后一个 segment」在 video_segments 中的下标（用于在镜头边界处挂转场/特效）
-    shot_last_seg_idx: list[int] = []
-    # 每个镜头最后一个 segment 的视频时长（秒），用于转场时长上限
-    shot_last_seg_dur: list[int] = []
+class _Lv59Animation(_Lv59Node):
+    __slots__ = ("id", "animations")
+
+    def __init__(self, id: str, animations: list = ()):
+        self.id = id
+        self.animations = animations
+
+    def to_json(self) -> dict:
+        return {
+            "animations": self.animations,
+            "id": self.id,
+            "multi_language_current": "none",
+            "type": "sticker_animation",
+        }
+
+
+class _Lv59SoundChannelMapping(_Lv59Node):
+    __slots__ = ("id",)
+
+    def __init__(self, id: str):
+        self.id = id
+
+    def to_json(self) -> dict:
+        return {"audio_channel_mapping": 0, "id": self.id, "is_config_open": False, "type": "none"}
+
+
+class _Lv59VocalSeparation(_Lv59Node):
+    __slots__ = ("id",)
+
+    def __init__(self, id: str):
+        self.id = id
+
+    def to_json(self) -> dict:
+        return {"choice": 0, "id": self.id, "production_path": "", "time_range": None, "type": "vocal_separation"}
+
+
+class _Lv59Beats(_Lv59Node):
+    __slots__ = ("id",)
+
+    def __init__(self, id: str):
+        self.id = id
+
+    def to_json(self) -> dict:
+        return {
+            "ai_beats": _LV59_AI_BEATS,
+            "enable_ai_beats": False,
+            "gear": 404,
+            "gear_count": 0,
+            "id": self.id,
+            "mode": 404,
+            "type": "beats",
+            "user_beats": (),
+            "user_delete_ai_beats": None,
+        }
+
+
+class _Lv59VideoMaterial(_Lv59Node):
+    """videos 素材：视频或图片（图片 type=photo、无音频）。"""
+
+    __slots__ = ("id", "path", "name", "duration", "width", "height", "is_video")
+
+    def __init__(self, id: str, path: str, name: str, duration: int, width: int, height: int, is_video: bool):
+        self.id = id
+        self.path = path
+        self.name = name
+        self.duration = duration
+        self.width = width
+        self.height = height
+        self.is_video = is_video
+
+    def to_json(self) -> dict:
+        return {
+            "aigc_type": "none",
+            "audio_fade": None,
+            "cartoon_path": "",
+            "category_id": "",
+            "category_name": "local",
+            "check_flag": 63487,
+            "crop": _LV59_CROP,
+            "crop_ratio": "free",
+            "crop_scale": 1.0,
+            "duration": self.duration,
+            "extra_type_option": 0,
+            "formula_id": "",
+            "freeze": None,
+            "has_audio": self.is_video,
+            "height": self.height,
+            "id": self.id,
+            "intensifies_audio_path": "",
+            "intensifies_path": "",
+            "is_ai_generate_content": False,
+            "is_copyright": False,
+            "is_text_edit_overdub": False,
+            "is_unified_beauty_mode": False,
+            "local_id": "",
+            "local_material_id": "",
+            "material_id": "",
+            "material_name": self.name,
+            "material_url": "",
+            "matting": _LV59_MATTING,
+            "media_path": "",
+            "object_locked": None,
+            "origin_material_id": "",
+            "path": self.path,
+            "picture_from": "none",
+            "picture_set_category_id": "",
+            "picture_set_category_name": "",
+            "request_id": "",
+            "reverse_intensifies_path": "",
+            "reverse_path": "",
+            "smart_motion": None,
+            "source": 0,
+            "source_platform": 0,
+            "stable": _LV59_STABLE,
+            "team_id": "",
+            "type": "video" if self.is_video else "photo",
+            "video_algorithm": _LV59_VIDEO_ALGORITHM,
+            "width": self.width,
+        }
+
+
+class _Lv59AudioMaterial(_Lv59Node):
+    __slots__ = ("id", "path", "name", "duration", "local_material_id", "music_id")
+
+    def __init__(self, id: str, path: str, name: str, duration: int, local_material_id: str, music_id: str):
+        self.id = id
+        self.path = path
+        self.name = name
+        self.duration = duration
+        self.local_material_id = local_material_id
+        self.music_id = music_id
+
+    def to_json(self) -> dict:
+        return {
+            "app_id": 0,
+            "category_id": "",
+            "category_name": "local",
+            "check_flag": 1,
+            "copyright_limit_type": "none",
+            "duration": self.duration,
+            "effect_id": "",
+            "formula_id": "",
+            "id": self.id,
+            "intensifies_path": "",
+            "is_ai_clone_tone": False,
+            "is_text_edit_overdub": False,
+            "is_ugc": False,
+            "local_material_id": self.local_material_id,
+            "music_id": self.music_id,
+            "name": self.name,
+            "path": self.path,
+            "query": "",
+            "request_id": "",
+            "resource_id": "",
+            "search_id": "",
+            "source_from": "",
+            "source_platform": 0,
+            "team_id": "",
+            "text_id": "",
+            "tone_category_id": "",
+            "tone_category_name": "",
+            "tone_effect_id": "",
+            "tone_effect_name": "",
+            "tone_platform": "",
+            "tone_second_category_id": "",
+            "tone_second_category_name": "",
+            "tone_speaker": "",
+            "tone_type": "",
+            "type": "extract_music",
+            "video_id": "",
+            "wave_points": (),
+        }
+
+
+class _Lv59TextMaterial(_Lv59Node):
+    """字幕素材：content 是内嵌的样式 JSON 字符串，写出时才生成。"""
+
+    __slots__ = ("id", "text")
+
+    def __init__(self, id: str, text: str):
+        self.id = id
+        self.text = text
+
+    def to_json(self) -> dict:
+        content_obj = {
+            "styles": [
+                {
+                    "fill": {
+                        "alpha": 1.0,
+                        "content": {
+                            "render_type": "solid",
+                            "solid": {"alpha": 1.0, "color": [1.0, 1.0, 1.0]},
+                        },
+                    },
+                    "range": [0, len(self.text)],
+                    "size": 8.0,
+                    "bold": False,
+                    "italic": False,
+                    "underline": False,
+                    "strokes": [],
+                }
+            ],
+            "text": self.text,
+        }
+        return {
+            "id": self.id,
+            "content": json.dumps(content_obj, ensure_ascii=False),
+            "typesetting": 0,
+            "alignment": 1,
+            "letter_spacing": 0.0,
+            "line_spacing": 0.02,
+            "line_feed": 1,
+            "line_max_width": 0.82,
+            "force_apply_line_max_width": False,
+            "check_flag": 7,
+            "type": "subtitle",
+            "global_alpha": 1.0,
+        }
+
+
+class _Lv59Segment(_Lv59Node):
+    """
+    轨道片段。kind 为 "video" | "audio" | "text"，决定 clip / hdr / uniform_scale 等按类型固定的字段。
+    start / duration 即 target_timerange；src_duration 为 None 时 source_timerange 为 null（字幕）。
+    """
+
+    __slots__ = (
+        "kind", "id", "material_id", "start", "duration", "src_duration",
+        "speed", "volume", "extra_material_refs", "common_keyframes",
+    )
+
+    def __init__(
+        self,
+        kind: str,
+        id: str,
+        material_id: str,
+        start: int,
+        duration: int,
+        src_duration: typing.Optional[int],
+        extra_material_refs: list,
+        common_keyframes: list = None,
+        speed: float = 1.0,
+        volume: float = 1.0,
+    ):
+        self.kind = kind
+        self.id = id
+        self.material_id = material_id
+        self.start = start
+        self.duration = duration
+        self.src_duration = src_duration
+        self.speed = speed
+        self.volume = volume
+        self.extra_material_refs = extra_material_refs
+        self.common_keyframes = common_keyframes or []
+
+    def to_json(self) -> dict:
+        kind = self.kind
+        if kind == "video":
+            clip, hdr = _LV59_CLIP_VIDEO, _LV59_HDR_SETTINGS
+            uniform_scale = _LV59_UNIFORM_SCALE_OFF if self.common_keyframes else _LV59_UNIFORM_SCALE_ON
+        elif kind == "text":
+            clip, hdr, uniform_scale = _LV59_CLIP_CAPTION, _LV59_HDR_SETTINGS, _LV59_UNIFORM_SCALE_ON
+        else:
+            clip = hdr = uniform_scale = None
+        visual = kind != "audio"
+        return {
+            "caption_info": None,
+            "cartoon": False,
+            "clip": clip,
+            "common_keyframes": self.common_keyframes,
+            "enable_adjust": visual,
+            "enable_color_correct_adjust": False,
+            "enable_color_curves": True,
+            "enable_color_match_adjust": False,
+            "enable_color_wheels": True,
+            "enable_lut": visual,
+            "enable_smart_color_adjust": False,
+            "extra_material_refs": self.extra_material_refs,
+            "group_id": "",
+            "hdr_settings": hdr,
+            "id": self.id,
+            "intensifies_audio": False,
+            "is_placeholder": False,
+            "is_tone_modify": False,
+            "keyframe_refs": (),
+            "last_nonzero_volume": 1.0,
+            "material_id": self.material_id,
+            "render_index": 15000 if kind == "text" else 0,
+            "responsive_layout": _LV59_RESPONSIVE_LAYOUT,
+            "reverse": False,
+            "source_timerange": (
+                None if self.src_duration is None else {"start": 0, "duration": self.src_duration}
+            ),
+            "speed": self.speed,
+            "target_timerange": {"start": self.start, "duration": self.duration},
+            "template_id": "",
+            "template_scene": "default",
+            "track_attribute": 0,
+            "track_render_index": 0,
+            "uniform_scale": uniform_scale,
+            "visible": True,
+            "volume": self.volume,
+        }
+
+
+def _lv59_json_default(obj):
+    """encode_draft_json 的 default 钩子：把时间线模型节点展开为 JSON。"""
+    if isinstance(obj, _Lv59Node):
+        return obj.to_json()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _lv59_plain(obj):
+    """把含模型节点的草稿脚本转成纯 dict / list（需要按 dict 读写已生成脚本时使用）。"""
+    return json.loads(encode_draft_json(obj, compact=True))
+
+
+def _build_lv59_main_script(
+    draft_id: str,
+    now_us: int,
+    width: int,
+    height: int,
+    fps: int,
+    total_duration: int,
+    prepared_shots: list,
+    draft_display_name: str = "",
+    random_transitions: bool = False,
+    random_filters: bool = False,
+    total_shots: int = 0,
+    rng=None,
+    ids: draft_ids.ReplayAllocator = None,
+    track_ids: tuple = None,
+) -> dict:
+    """
+    剪映专业版 5.9 macOS 主时间线格式：根目录 draft_info.json / draft_content.json
+    使用 materials + tracks（与 pyJianYingDraft 模板一致），不能用仅 timelines/entity_list 的旧格式。
+    返回的脚本中素材与片段是时间线模型节点（_Lv59Node），交给 write_draft_json 写出；
+    需要按 dict 访问时先用 _lv59_plain() 展开。
+    rng: 随机转场 / 滤镜 / 特效 / 入场动画 / Ken Burns 方向的随机源（random.Random），默认 random 模块；
+         row 带 rng_seed 时该镜头改用 random.Random(rng_seed)。
+    ids: 传入时（且已通过 draft_ids.use_allocator 生效）每个镜头先重放 row["replay_ids"]，
+         实际用到的 id 写回 row["ids"]（镜头清单，见 create_draft_on_mac 增量重建）。
+    track_ids: (视频, 音频, 字幕) 轨道 id，增量重建时沿用原草稿的轨道。
+    """
+    rng = rng or random
+    content = _load_lv59_template()
+    mats = content["materials"]
+    for k in mats:
+        if isinstance(mats[k], list):
+            mats[k] = []
+
+    if track_ids:
+        video_track_id, audio_track_id, text_track_id = track_ids
+    else:
+        video_track_id = _make_id()
+        audio_track_id = _make_id()
+        text_track_id = _make_id()
+    if random_filters:
+        mats.setdefault("filters", [])
+        mats.setdefault("video_effects", [])
+
+    video_segments = []
+    audio_segments = []
+    text_segments = []
 
     for i, row in enumerate(prepared_shots):
+        if ids is not None:
+            ids.begin(row.get("replay_ids"))
+        shot_rng = random.Random(row["rng_seed"]) if row.get("rng_seed") is not None else rng
+        # 本镜头在 video_segments 中的起始下标
+        shot_seg_start = len(video_segments)
         start_us = row["start_us"]
         dur_us = row["duration_us"]
         media_kind = row.get("media_kind") or "photo"
@@ -1249,89 +2599,14 @@ def _build_lv59_main_script(
             iw, ih = int(row["image_w"]), int(row["image_h"])
             mat_duration = 10800000000
             is_video = False
-        has_tts = bool(row.get("audio_abs") and os.path.isfile(str(row.get("audio_abs"))))
+        # audio_media 仅在音频下载成功时存在（见 create_draft_on_mac 组装 row）
+        audio_media: typing.Optional[ProbedMedia] = row.get("audio_media")
+        has_tts = audio_media is not None
         base_name = os.path.basename(media_path)
 
         vid_mat_id = _make_id()
         mats["videos"].append(
-            {
-                "aigc_type": "none",
-                "audio_fade": None,
-                "cartoon_path": "",
-                "category_id": "",
-                "category_name": "local",
-                "check_flag": 63487,
-                "crop": {
-                    "lower_left_x": 0.0,
-                    "lower_left_y": 1.0,
-                    "lower_right_x": 1.0,
-                    "lower_right_y": 1.0,
-                    "upper_left_x": 0.0,
-                    "upper_left_y": 0.0,
-                    "upper_right_x": 1.0,
-                    "upper_right_y": 0.0,
-                },
-                "crop_ratio": "free",
-                "crop_scale": 1.0,
-                "duration": mat_duration,
-                "extra_type_option": 0,
-                "formula_id": "",
-                "freeze": None,
-                "has_audio": is_video,
-                "height": ih,
-                "id": vid_mat_id,
-                "intensifies_audio_path": "",
-                "intensifies_path": "",
-                "is_ai_generate_content": False,
-                "is_copyright": False,
-                "is_text_edit_overdub": False,
-                "is_unified_beauty_mode": False,
-                "local_id": "",
-                "local_material_id": "",
-                "material_id": "",
-                "material_name": base_name,
-                "material_url": "",
-                "matting": {
-                    "flag": 0,
-                    "has_use_quick_brush": False,
-                    "has_use_quick_eraser": False,
-                    "interactiveTime": [],
-                    "path": "",
-                    "strokes": [],
-                },
-                "media_path": "",
-                "object_locked": None,
-                "origin_material_id": "",
-                "path": media_path,
-                "picture_from": "none",
-                "picture_set_category_id": "",
-                "picture_set_category_name": "",
-                "request_id": "",
-                "reverse_intensifies_path": "",
-                "reverse_path": "",
-                "smart_motion": None,
-                "source": 0,
-                "source_platform": 0,
-                "stable": {
-                    "matrix_path": "",
-                    "stable_level": 0,
-                    "time_range": {"duration": 0, "start": 0},
-                },
-                "team_id": "",
-                "type": "video" if is_video else "photo",
-                "video_algorithm": {
-                    "algorithms": [],
-                    "complement_frame_config": None,
-                    "deflicker": None,
-                    "gameplay_configs": [],
-                    "motion_blur_config": None,
-                    "noise_reduction": None,
-                    "path": "",
-                    "quality_enhance": None,
-                    "time_range": None,
-                },
-                "width": iw,
-            }
+            _Lv59VideoMaterial(vid_mat_id, media_path, base_name, mat_duration, iw, ih, is_video)
         )
 
         def _append_one_video_segment(
@@ -1349,91 +2624,36 @@ def _build_lv59_main_script(
             ma_id = _make_id()
             scm_id = _make_id()
             vs_id = _make_id()
-            mats["speeds"].append({"curve_speed": None, "id": sp_id, "mode": 0, "speed": speed, "type": "speed"})
-            mats["canvases"].append(
-                {
-                    "album_image": "",
-                    "blur": 0.0,
-                    "color": "",
-                    "id": cv_id,
-                    "image": "",
-                    "image_id": "",
-                    "image_name": "",
-                    "source_platform": 0,
-                    "team_id": "",
-                    "type": "canvas_color",
-                }
-            )
+            mats["speeds"].append(_Lv59Speed(sp_id, speed))
+            mats["canvases"].append(_Lv59Canvas(cv_id))
             video_ani_list: list = []
             if intro_clip_us is not None and (random_transitions or random_filters):
-                _aspec = random.choice(_LV59_INTRO_ANIMATION_PRESETS)
+                _aspec = shot_rng.choice(_LV59_INTRO_ANIMATION_PRESETS)
                 video_ani_list.append(_build_video_intro_animation_json(_aspec, intro_clip_us))
-            mats["material_animations"].append(
-                {"animations": video_ani_list, "id": ma_id, "multi_language_current": "none", "type": "sticker_animation"}
-            )
-            mats["sound_channel_mappings"].append(
-                {"audio_channel_mapping": 0, "id": scm_id, "is_config_open": False, "type": "none"}
-            )
-            mats["vocal_separations"].append(
-                {"choice": 0, "id": vs_id, "production_path": "", "time_range": None, "type": "vocal_separation"}
-            )
+            mats["material_animations"].append(_Lv59Animation(ma_id, video_ani_list))
+            mats["sound_channel_mappings"].append(_Lv59SoundChannelMapping(scm_id))
+            mats["vocal_separations"].append(_Lv59VocalSeparation(vs_id))
             vseg_id = _make_id()
             video_segments.append(
-                {
-                    "caption_info": None,
-                    "cartoon": False,
-                    "clip": {
-                        "alpha": 1.0,
-                        "flip": {"horizontal": False, "vertical": False},
-                        "rotation": 0.0,
-                        "scale": {"x": 1.0, "y": 1.0},
-                        "transform": {"x": 0.0, "y": 0.0},
-                    },
-                    "common_keyframes": common_keyframes or [],
-                    "enable_adjust": True,
-                    "enable_color_correct_adjust": False,
-                    "enable_color_curves": True,
-                    "enable_color_match_adjust": False,
-                    "enable_color_wheels": True,
-                    "enable_lut": True,
-                    "enable_smart_color_adjust": False,
-                    "extra_material_refs": [sp_id, cv_id, ma_id, scm_id, vs_id],
-                    "group_id": "",
-                    "hdr_settings": {"intensity": 1.0, "mode": 1, "nits": 1000},
-                    "id": vseg_id,
-                    "intensifies_audio": False,
-                    "is_placeholder": False,
-                    "is_tone_modify": False,
-                    "keyframe_refs": [],
-                    "last_nonzero_volume": 1.0,
-                    "material_id": vid_mat_id,
-                    "render_index": 0,
-                    "responsive_layout": {
-                        "enable": False,
-                        "horizontal_pos_layout": 0,
-                        "size_layout": 0,
-                        "target_follow": "",
-                        "vertical_pos_layout": 0,
-                    },
-                    "reverse": False,
-                    "source_timerange": {"start": 0, "duration": src_dur},
-                    "speed": speed,
-                    "target_timerange": {"start": t_start, "duration": tgt_dur},
-                    "template_id": "",
-                    "template_scene": "default",
-                    "track_attribute": 0,
-                    "track_render_index": 0,
-                    "uniform_scale": {"on": not common_keyframes, "value": 1.0},
-                    "visible": True,
-                    "volume": vol,
-                }
+                _Lv59Segment(
+                    "video",
+                    vseg_id,
+                    vid_mat_id,
+                    t_start,
+                    tgt_dur,
+                    src_dur,
+                    [sp_id, cv_id, ma_id, scm_id, vs_id],
+                    common_keyframes=common_keyframes,
+                    speed=speed,
+                    volume=vol,
+                )
             )
 
         if not is_video:
             src_dur = max(33_333, int(dur_us))
             # Ken Burns 缓慢放大效果（仅图片）：随机方向，随机时长缩放
             kb_dur = int(dur_us)
-            kb_keyframes = _build_ken_burns_zoom(kb_dur)
+            kb_keyframes = _build_ken_burns_zoom(kb_dur, rng=shot_rng)
             _append_one_video_segment(
                 t_start=int(start_us),
                 src_dur=src_dur,
@@ -1442,8 +2662,6 @@ def _build_lv59_main_script(
                 intro_clip_us=int(dur_us),
                 common_keyframes=kb_keyframes,
             )
-            shot_last_seg_idx.append(len(video_segments) - 1)
-            shot_last_seg_dur.append(int(dur_us))
         else:
             # ── 视频对齐逻辑（按音频时长对齐）────────────────────────────────
             # mat_d = 视频素材总时长（微秒），由 ffprobe + MP4 box 探测。
@@ -1459,7 +2677,7 @@ def _build_lv59_main_script(
 
             if mat_d >= slot_d:
                 # 情况 1：视频足够长，只取前面 slot_d 秒，无循环
-                kb_kfs = _build_ken_burns_zoom(slot_d) if random_transitions or random_filters else None
+                kb_kfs = _build_ken_burns_zoom(slot_d, rng=shot_rng) if random_transitions or random_filters else None
                 _append_one_video_segment(
                     t_start=int(start_us),
                     src_dur=slot_d,
@@ -1469,13 +2687,11 @@ def _build_lv59_main_script(
                     common_keyframes=kb_kfs,
                     speed=1.0,
                 )
-                shot_last_seg_idx.append(len(video_segments) - 1)
-                shot_last_seg_dur.append(slot_d)
             else:
                 # 情况 2：视频不够，调速拉长（不循环，不重复）
                 spd = mat_d / slot_d
                 spd = max(0.1, min(spd, 1.0))   # 限制 speed 范围 [0.1, 1.0]
-                kb_kfs = _build_ken_burns_zoom(slot_d) if random_transitions or random_filters else None
+                kb_kfs = _build_ken_burns_zoom(slot_d, rng=shot_rng) if random_transitions or random_filters else None
                 _append_one_video_segment(
                     t_start=int(start_us),
                     src_dur=mat_d,
@@ -1485,93 +2701,37 @@ def _build_lv59_main_script(
                     common_keyframes=kb_kfs,
                     speed=spd,
                 )
-                shot_last_seg_idx.append(len(video_segments) - 1)
-                shot_last_seg_dur.append(slot_d)
 
         apath = row.get("audio_abs")
-        if apath and os.path.isfile(apath):
-            # 直接探测原始音频时长，不做任何处理
-            orig_dur = _ffprobe_duration_us(apath)
+        if apath and audio_media is not None:
+            # 使用下载阶段已探测的原始音频时长，不做任何处理
+            orig_dur = audio_media.duration_us
             if orig_dur and orig_dur > 0:
                 adur = int(orig_dur)
             else:
                 adur = max(33_333, int(row.get("audio_duration_us", 0) or dur_us))
             adur = max(adur, int(dur_us))
             aud_mat_id = _make_id()
-            lm = uuid.uuid4().hex
-            music_id = str(uuid.uuid4())
+            lm = draft_ids.make_hex()
+            music_id = draft_ids.make_uuid()
             mats["audios"].append(
-                {
-                    "app_id": 0,
-                    "category_id": "",
-                    "category_name": "local",
-                    "check_flag": 1,
-                    "copyright_limit_type": "none",
-                    "duration": adur,  # ← 用处理后（含静音垫）的真实时长
-                    "effect_id": "",
-                    "formula_id": "",
-                    "id": aud_mat_id,
-                    "intensifies_path": "",
-                    "is_ai_clone_tone": False,
-                    "is_text_edit_overdub": False,
-                    "is_ugc": False,
-                    "local_material_id": lm,
-                    "music_id": music_id,
-                    "name": os.path.basename(apath),
-                    "path": row.get("audio_client_path") or apath,
-                    "query": "",
-                    "request_id": "",
-                    "resource_id": "",
-                    "search_id": "",
-                    "source_from": "",
-                    "source_platform": 0,
-                    "team_id": "",
-                    "text_id": "",
-                    "tone_category_id": "",
-                    "tone_category_name": "",
-                    "tone_effect_id": "",
-                    "tone_effect_name": "",
-                    "tone_platform": "",
-                    "tone_second_category_id": "",
-                    "tone_second_category_name": "",
-                    "tone_speaker": "",
-                    "tone_type": "",
-                    "type": "extract_music",
-                    "video_id": "",
-                    "wave_points": [],
-                }
+                _Lv59AudioMaterial(
+                    aud_mat_id,
+                    row.get("audio_client_path") or apath,
+                    os.path.basename(apath),
+                    adur,  # ← 用处理后（含静音垫）的真实时长
+                    lm,
+                    music_id,
+                )
             )
             asp_id = _make_id()
             beat_id = _make_id()
             ascm_id = _make_id()
             avs_id = _make_id()
-            mats["speeds"].append({"curve_speed": None, "id": asp_id, "mode": 0, "speed": 1.0, "type": "speed"})
-            mats["beats"].append(
-                {
-                    "ai_beats": {
-                        "beat_speed_infos": [],
-                        "beats_path": "",
-                        "beats_url": "",
-                        "melody_path": "",
-                        "melody_percents": [0.0],
-                        "melody_url": "",
-                    },
-                    "enable_ai_beats": False,
-                    "gear": 404,
-                    "gear_count": 0,
-                    "id": beat_id,
-                    "mode": 404,
-                    "type": "beats",
-                    "user_beats": [],
-                    "user_delete_ai_beats": None,
-                }
-            )
-            mats["sound_channel_mappings"].append(
-                {"audio_channel_mapping": 0, "id": ascm_id, "is_config_open": False, "type": "none"}
-            )
-            mats["vocal_separations"].append(
-                {"choice": 0, "id": avs_id, "production_path": "", "time_range": None, "type": "vocal_separation"}
-            )
+            mats["speeds"].append(_Lv59Speed(asp_id))
+            mats["beats"].append(_Lv59Beats(beat_id))
+            mats["sound_channel_mappings"].append(_Lv59SoundChannelMapping(ascm_id))
+            mats["vocal_separations"].append(_Lv59VocalSeparation(avs_id))
             aseg_id = _make_id()
             # 音频只取真实素材时长，避免 target 长于 source 时尾部出现噪声/破音
             use_src = max(33_333, int(adur))
@@ -1585,48 +2745,16 @@ def _build_lv59_main_script(
             audio_common_kfs: list = []  # 空列表 = 无音量 keyframe = 全程音量 1.0
 
             audio_segments.append(
-                {
-                    "caption_info": None,
-                    "cartoon": False,
-                    "clip": None,
-                    "common_keyframes": audio_common_kfs,
-                    "enable_adjust": False,
-                    "enable_color_correct_adjust": False,
-                    "enable_color_curves": True,
-                    "enable_color_match_adjust": False,
-                    "enable_color_wheels": True,
-                    "enable_lut": False,
-                    "enable_smart_color_adjust": False,
-                    "extra_material_refs": [asp_id, beat_id, ascm_id, avs_id],
-                    "group_id": "",
-                    "hdr_settings": None,
-                    "id": aseg_id,
-                    "intensifies_audio": False,
-                    "is_placeholder": False,
-                    "is_tone_modify": False,
-                    "keyframe_refs": [],
-                    "last_nonzero_volume": 1.0,
-                    "material_id": aud_mat_id,
-                    "render_index": 0,
-                    "responsive_layout": {
-                        "enable": False,
-                        "horizontal_pos_layout": 0,
-                        "size_layout": 0,
-                        "target_follow": "",
-                        "vertical_pos_layout": 0,
-                    },
-                    "reverse": False,
-                    "source_timerange": {"start": 0, "duration": use_src},
-                    "speed": 1.0,
-                    "target_timerange": {"start": start_us, "duration": audio_target_dur},
-                    "template_id": "",
-                    "template_scene": "default",
-                    "track_attribute": 0,
-                    "track_render_index": 0,
-                    "uniform_scale": None,
-                    "visible": True,
-                    "volume": 1.0,
-                }
+                _Lv59Segment(
+                    "audio",
+                    aseg_id,
+                    aud_mat_id,
+                    start_us,
+                    audio_target_dur,
+                    use_src,
+                    [asp_id, beat_id, ascm_id, avs_id],
+                    common_keyframes=audio_common_kfs,
+                )
             )
 
         cap = (row.get("caption") or "").strip()
@@ -1642,102 +2770,117 @@ def _build_lv59_main_script(
                 cdu = chunk_durs[ci] if ci < len(chunk_durs) else max(33_333, dur_us - (t_cursor - start_us))
                 txt_mat_id = _make_id()
                 txt_anim_id = _make_id()
-                mats["material_animations"].append(
+                mats["material_animations"].append(_Lv59Animation(txt_anim_id))
+                mats["texts"].append(_Lv59TextMaterial(txt_mat_id, chunk))
+                tseg_id = _make_id()
+                text_segments.append(
+                    _Lv59Segment("text", tseg_id, txt_mat_id, t_cursor, cdu, None, [txt_anim_id])
+                )
+                t_cursor += cdu
+
+        # ── 滤镜 / 视频特效挂在本镜头第一个 segment 上，转场挂在最后一个 segment 上（通往下一个镜头）──
+        # 随机选择与 id 只取决于本镜头（shot_rng / ids 重放），增量重建时未改动镜头的结果不变；
+        # 转场最后选，在后面追加镜头不会改变已有镜头的滤镜 / 特效
+        if shot_seg_start < len(video_segments):
+            first_seg = video_segments[shot_seg_start]
+            last_seg = video_segments[-1]
+            if random_filters:
+                # ── 滤镜素材 ──
+                f_name, f_eff_id, f_res_id = shot_rng.choice(_LV59_FILTER_PRESETS)
+                fid = _make_id()
+                mats["filters"].append(
                     {
-                        "animations": [],
-                        "id": txt_anim_id,
-                        "multi_language_current": "none",
-                        "type": "sticker_animation",
+                        "adjust_params": [],
+                        "algorithm_artifact_path": "",
+                        "apply_target_type": 0,
+                        "bloom_params": None,
+                        "category_id": "",
+                        "category_name": "",
+                        "color_match_info": {
+                            "source_feature_path": "",
+                            "target_feature_path": "",
+                            "target_image_path": "",
+                        },
+                        "effect_id": f_eff_id,
+                        "enable_skin_tone_correction": False,
+                        "exclusion_group": [],
+                        "face_adjust_params": [],
+                        "formula_id": "",
+                        "id": fid,
+                        "intensity_key": "",
+                        "multi_language_current": "",
+                        "name": f_name,
+                        "panel_id": "",
+                        "platform": "all",
+                        "resource_id": f_res_id,
+                        "source_platform": 1,
+                        "sub_type": "none",
+                        "time_range": None,
+                        "type": "filter",
+                        "value": 1.0,
+                        "version": "",
                     }
                 )
-                content_obj = {
-                    "styles": [
-                        {
-                            "fill": {
-                                "alpha": 1.0,
-                                "content": {
-                                    "render_type": "solid",
-                                    "solid": {"alpha": 1.0, "color": [1.0, 1.0, 1.0]},
-                                },
-                            },
-                            "range": [0, len(chunk)],
-                            "size": 8.0,
-                            "bold": False,
-                            "italic": False,
-                            "underline": False,
-                            "strokes": [],
-                        }
-                    ],
-                    "text": chunk,
-                }
-                mats["texts"].append(
+                first_seg.extra_material_refs.append(fid)
+
+                # ── 视频画面特效（效果更明显）──
+                fx_name, fx_eff_id, fx_res_id, fx_params = shot_rng.choice(_LV59_VIDEO_EFFECT_PRESETS)
+                vfx_id = _make_id()
+                adjust_params = [
                     {
-                        "id": txt_mat_id,
-                        "content": json.dumps(content_obj, ensure_ascii=False),
-                        "typesetting": 0,
-                        "alignment": 1,
-                        "letter_spacing": 0.0,
-                        "line_spacing": 0.02,
-                        "line_feed": 1,
-                        "line_max_width": 0.82,
-                        "force_apply_line_max_width": False,
-                        "check_flag": 7,
-                        "type": "subtitle",
-                        "global_alpha": 1.0,
+                        "param_key": p["param_key"],
+                        "param_value": p["param_value"],
                     }
-                )
-                tseg_id = _make_id()
-                text_segments.append(
+                    for p in fx_params
+                ]
+                mats["video_effects"].append(
                     {
-                        "caption_info": None,
-                        "cartoon": False,
-                        "clip": {
-                            "alpha": 1.0,
-                            "flip": {"horizontal": False, "vertical": False},
-                            "rotation": 0.0,
-                            "scale": {"x": 1.0, "y": 1.0},
-                            "transform": {"x": 0.0, "y": -0.8},
-                        },
+                        "adjust_params": adjust_params,
+                        "apply_target_type": 0,
+                        "apply_time_range": None,
+                        "category_id": "",
+                        "category_name": "",
                         "common_keyframes": [],
-                        "enable_adjust": True,
-                        "enable_color_correct_adjust": False,
-                        "enable_color_curves": True,
-                        "enable_color_match_adjust": False,
-                        "enable_color_wheels": True,
-                        "enable_lut": True,
-                        "enable_smart_color_adjust": False,
-                        "extra_material_refs": [txt_anim_id],
-                        "group_id": "",
-                        "hdr_settings": {"intensity": 1.0, "mode": 1, "nits": 1000},
-                        "id": tseg_id,
-                        "intensifies_audio": False,
-                        "is_placeholder": False,
-                        "is_tone_modify": False,
-                        "keyframe_refs": [],
-                        "last_nonzero_volume": 1.0,
-                        "material_id": txt_mat_id,
-                        "render_index": 15000,
-                        "responsive_layout": {
-                            "enable": False,
-                            "horizontal_pos_layout": 0,
-                            "size_layout": 0,
-                            "target_follow": "",
-                            "vertical_pos_layout": 0,
-                        },
-                        "reverse": False,
-                        "source_timerange": None,
-                        "speed": 1.0,
-                        "target_timerange": {"start": t_cursor, "duration": cdu},
-                        "template_id": "",
-                        "template_scene": "default",
-                        "track_attribute": 0,
+                        "disable_effect_faces": [],
+                        "effect_id": fx_eff_id,
+                        "formula_id": "",
+                        "id": vfx_id,
+                        "name": fx_name,
+                        "platform": "all",
+                        "render_index": 11000,
+                        "resource_id": fx_res_id,
+                        "source_platform": 0,
+                        "time_range": None,
                         "track_render_index": 0,
-                        "uniform_scale": {"on": True, "value": 1.0},
-                        "visible": True,
-                        "volume": 1.0,
+                        "type": "video_effect",
+                        "value": 1.0,
+                        "version": "",
                     }
                 )
-                t_cursor += cdu
+                first_seg.extra_material_refs.append(vfx_id)
+            if random_transitions and i < len(prepared_shots) - 1:
+                seg_dur = last_seg.duration
+                name, eff_id, res_id, dur_us_t, is_ov = shot_rng.choice(_LV59_TRANSITION_PRESETS)
+                # 转场时长不超过前一个镜头末段时长（防止越界）
+                real_dur = min(dur_us_t, int(seg_dur) if seg_dur else 500_000)
+                tid = _make_id()
+                mats["transitions"].append(
+                    {
+                        "category_id": "",
+                        "category_name": "",
+                        "duration": real_dur,
+                        "effect_id": eff_id,
+                        "id": tid,
+                        "is_overlap": is_ov,
+                        "name": name,
+                        "platform": "all",
+                        "resource_id": res_id,
+                        "type": "transition",
+                    }
+                )
+                last_seg.extra_material_refs.append(tid)
+        if ids is not None:
+            row["ids"] = ids.end()
 
     # ── 调试日志：输出特效/转场写入情况 ──
     _trans_count = sum(1 for t in mats.get("transitions", []) if t.get("type") == "transition")
@@ -1747,124 +2890,6 @@ def _build_lv59_main_script(
         f"[jianying_export] segments={len(video_segments)}, shots={len(prepared_shots)}, "
         f"transitions={_trans_count}, filters={_filt_count}, video_effects={_vfx_count}"
     )
-    # ── 转场：只挂在「镜头边界」的前一个 segment 上（多段循环拼接只在最后一段之后转场）
-    # 转场时长不超过前一个镜头末段的实际时长，避免越界
-    if random_transitions and len(shot_last_seg_idx) > 1:
-        for s in range(1, len(shot_last_seg_idx)):
-            prev_shot_last = shot_last_seg_idx[s - 1]
-            seg = video_segments[prev_shot_last]
-            t_range = seg.get("target_timerange", {})
-            seg_dur = t_range.get("duration", 0) if isinstance(t_range, dict) else 0
-            name, eff_id, res_id, dur_us_t, is_ov = random.choice(_LV59_TRANSITION_PRESETS)
-            # 转场时长不超过前一个镜头末段时长（防止越界）
-            real_dur = min(dur_us_t, int(seg_dur) if seg_dur else 500_000)
-            tid = _make_id()
-            mats["transitions"].append(
-                {
-                    "category_id": "",
-                    "category_name": "",
-                    "duration": real_dur,
-                    "effect_id": eff_id,
-                    "id": tid,
-                    "is_overlap": is_ov,
-                    "name": name,
-                    "platform": "all",
-                    "resource_id": res_id,
-                    "type": "transition",
-                }
-            )
-            video_segments[prev_shot_last]["extra_material_refs"].append(tid)
-
-    # 滤镜 / 视频特效：只在每个镜头「第一个」segment 上应用（多段拼接时只在开头）
-    if random_filters and shot_last_seg_idx:
-        mats.setdefault("filters", [])
-        mats.setdefault("video_effects", [])
-
-        # 每个镜头的第一个 segment：下标 = shot_last_seg_idx[i-1] + 1（首个镜头用 0）
-        first_seg_of_shot: list[int] = []
-        for k in range(len(shot_last_seg_idx)):
-            if k == 0:
-                first_seg_of_shot.append(0)
-            else:
-                first_seg_of_shot.append(shot_last_seg_idx[k - 1] + 1)
-
-        for seg_idx in first_seg_of_shot:
-            if seg_idx >= len(video_segments):
-                continue
-            seg = video_segments[seg_idx]
-            # ── 滤镜素材 ──
-            f_name, f_eff_id, f_res_id = random.choice(_LV59_FILTER_PRESETS)
-            fid = _make_id()
-            mats["filters"].append(
-                {
-                    "adjust_params": [],
-                    "algorithm_artifact_path": "",
-                    "apply_target_type": 0,
-                    "bloom_params": None,
-                    "category_id": "",
-                    "category_name": "",
-                    "color_match_info": {
-                        "source_feature_path": "",
-                        "target_feature_path": "",
-                        "target_image_path": "",
-                    },
-                    "effect_id": f_eff_id,
-                    "enable_skin_tone_correction": False,
-                    "exclusion_group": [],
-                    "face_adjust_params": [],
-                    "formula_id": "",
-                    "id": fid,
-                    "intensity_key": "",
-                    "multi_language_current": "",
-                    "name": f_name,
-                    "panel_id": "",
-                    "platform": "all",
-                    "resource_id": f_res_id,
-                    "source_platform": 1,
-                    "sub_type": "none",
-                    "time_range": None,
-                    "type": "filter",
-                    "value": 1.0,
-                    "version": "",
-                }
-            )
-            seg["extra_material_refs"].append(fid)
-
-            # ── 视频画面特效（效果更明显）──
-            fx_name, fx_eff_id, fx_res_id, fx_params = random.choice(_LV59_VIDEO_EFFECT_PRESETS)
-            vfx_id = _make_id()
-            adjust_params = [
-                {
-                    "param_key": p["param_key"],
-                    "param_value": p["param_value"],
-                }
-                for p in fx_params
-            ]
-            mats["video_effects"].append(
-                {
-                    "adjust_params": adjust_params,
-                    "apply_target_type": 0,
-                    "apply_time_range": None,
-                    "category_id": "",
-                    "category_name": "",
-                    "common_keyframes": [],
-                    "disable_effect_faces": [],
-                    "effect_id": fx_eff_id,
-                    "formula_id": "",
-                    "id": vfx_id,
-                    "name": fx_name,
-                    "platform": "all",
-                    "render_index": 11000,
-                    "resource_id": fx_res_id,
-                    "source_platform": 0,
-                    "time_range": None,
-                    "track_render_index": 0,
-                    "type": "video_effect",
-                    "value": 1.0,
-                    "version": "",
-                }
-            )
-            seg["extra_material_refs"].append(vfx_id)
 
     tracks = []
     if video_segments:
@@ -1927,11 +2952,118 @@ def _build_lv59_main_script(
     return content
 
 
+# ---- 草稿 JSON 写出（序列化一次，写多个目标）----
+# 根目录 draft_info.json / draft_content.json 与 Timelines/<id>/draft_info.json 内容完全相同：
+# 只序列化一次，第一个目标原子写入，其余目标在 Linux（服务端，之后会打 ZIP）上硬链接到它，
+# 其他平台（剪映直接读写草稿目录）写入同样的字节。
+# 安装了 orjson 时默认用它编码（JIANYING_JSON_ENCODER=json 强制标准库）；
+# JIANYING_DRAFT_JSON_COMPACT=1 时输出无缩进的紧凑 JSON。
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+DRAFT_JSON_COMPACT = os.environ.get("JIANYING_DRAFT_JSON_COMPACT", "0") == "1"
+DRAFT_JSON_ENCODER = os.environ.get("JIANYING_JSON_ENCODER", "auto").strip().lower()
+
+
+def encode_draft_json(obj, compact: bool = None) -> bytes:
+    """把草稿 JSON 编码为 UTF-8 字节（非 ASCII 字符原样输出，与 ensure_ascii=False 一致）。
+    时间线模型节点（_Lv59Node）在这里才展开为 JSON。"""
+    compact = DRAFT_JSON_COMPACT if compact is None else compact
+    if _orjson is not None and DRAFT_JSON_ENCODER != "json":
+        try:
+            return _orjson.dumps(
+                obj, default=_lv59_json_default, option=0 if compact else _orjson.OPT_INDENT_2
+            )
+        except TypeError:
+            pass  # orjson 不支持的值（如超过 64 位的整数）回退到标准库
+    if compact:
+        return json.dumps(
+            obj, ensure_ascii=False, separators=(",", ":"), default=_lv59_json_default
+        ).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, indent=2, default=_lv59_json_default).encode("utf-8")
+
+
+def write_draft_json(obj, paths: list, compact: bool = None) -> int:
+    """序列化 obj 一次并写入 paths 中的每个文件（已存在的文件被原子替换）。返回写入的字节数。"""
+    data = encode_draft_json(obj, compact)
+    first = None
+    for path in paths:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if first is not None and platform.system() == "Linux":
+            try:
+                _link_or_copy(first, path)
+                continue
+            except OSError:
+                pass
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        first = first or path
+    return len(data)
+
+
 # ---- 核心草稿生成 ----
 
+# ---- 镜头清单（增量重建）----
+# 草稿目录下的 .shot_manifest.json 记录每个镜头的输入哈希、媒体（相对路径 + 探测结果）和生成时用到的 id。
+# 再次导出到同一草稿目录（或指定 base_draft）时按哈希比对：未改动的镜头不再下载 / 探测，
+# 沿用原文件、原素材 / 片段 id 和原随机转场 / 滤镜 / 特效；只有改动的镜头重新处理，start_us 照常从头累积。
+_SHOT_MANIFEST_NAME = ".shot_manifest.json"
+_SHOT_MANIFEST_VERSION = 1
+
+
+def _shot_media_key(url: str) -> str:
+    """媒体身份：data:URL 按内容哈希，本地文件按内容指纹，其余（http 等）取 URL 本身。"""
+    if url.startswith("data:"):
+        return "data:" + hashlib.sha256(url.encode("utf-8")).hexdigest()
+    if not url.startswith(("http://", "https://", "blob:")) and os.path.isfile(url):
+        fp = _media_fingerprint(url)
+        if fp:
+            return "file:" + fp[0]
+    return url
+
+
+def _shot_hash(caption: str, base_dur: int, client_audio_us, media_keys: dict) -> str:
+    """镜头输入哈希：只包含影响该镜头产物的字段。"""
+    material = {
+        "caption": caption,
+        "base_dur": base_dur,
+        "client_audio_us": client_audio_us,
+        "media": media_keys,
+    }
+    raw = json.dumps(material, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def load_shot_manifest(draft_folder: str) -> typing.Optional[dict]:
+    """读取草稿目录的镜头清单；不存在、损坏或版本不符时返回 None（按全新构建处理）。"""
+    try:
+        with open(os.path.join(draft_folder, _SHOT_MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != _SHOT_MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def _write_shot_manifest(draft_folder: str, manifest: dict) -> None:
+    path = os.path.join(draft_folder, _SHOT_MANIFEST_NAME)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
 def create_draft_on_mac(
     draft_name: str,
-    shots: list,
+    shots: typing.Iterable[dict],
     output_dir: str = None,
     fps: int = 30,
     width: int = 1920,
@@ -1940,13 +3072,17 @@ def create_draft_on_mac(
     random_filters: bool = False,
     path_map_root: str = None,
     force_draft_folder_name: str = None,
-    # 追加模式：继续已有草稿目录的导出
-    append_to_draft: str = None,
-    append_timeline_offset: int = 0,
     # 媒体只模式：只下载媒体文件，不生成完整草稿 JSON
     media_only: bool = False,
     # 本地媒体缓存路径映射：{ url: local_absolute_path }，优先从本地文件复制而非重新下载
     local_media_paths: list = None,
+    # 确定性构建：同一 seed + 同一输入 → 逐字节相同的草稿
+    seed: typing.Union[int, str, None] = None,
+    # 增量重建：从该草稿目录的镜头清单复用未改动的镜头（输出到已有草稿目录时自动使用该目录自身的清单）
+    base_draft: str = None,
+    # 边生成边打包 ZIP（<输出目录>/<草稿目录名><zip_part_suffix>.zip），媒体就绪即写入
+    package_zip: bool = False,
+    zip_part_suffix: str = None,
 ) -> dict:
     """
     创建剪映草稿：
@@ -1954,11 +3090,28 @@ def create_draft_on_mac(
       2. 下载每个镜头的图片/音频到本地（优先使用 local_media_paths 中的本地缓存）
       3. 写入根目录 draft_info.json 与 draft_content.json（剪映 5.9 主时间线格式）
 
+    shots: 镜头列表，或边接收边产出镜头的迭代器（流式 ingest，见 read_streamed_job）
     force_draft_folder_name: 强制使用该名称作为草稿目录名（分批导出时用于统一目录结构）
-    append_to_draft: 追加模式，传入已有草稿目录路径，新镜头将从 append_timeline_offset 开始
-    append_timeline_offset: 追加模式下，新镜头开始的时间线偏移（微秒）
     local_media_paths: 格式 [{url: str, localPath: str}]，优先从本地路径复制文件
+    seed: 指定后 id、随机转场/滤镜/特效/动画、媒体随机文件名和时间戳都由 seed 决定（见 _build_timestamp_us）；
+          此时不读取镜头清单（base_draft 与已有目录的清单都不用），同一 seed + 同一输入总是生成相同的草稿
+    base_draft: 另一个带镜头清单的草稿目录，未改动镜头的媒体以硬链接 / 复制方式复用（见 .shot_manifest.json）
+    package_zip: 同时生成草稿 ZIP：媒体下载 + 探测完成后立即写入（已压缩媒体不再 DEFLATE），
+                 收尾时补齐 JSON 等其余文件；结果带 zip_path，打包失败时带 zip_error（草稿目录不受影响）
+    zip_part_suffix: 分批导出的分段后缀（如 "_part1"），草稿目录与 ZIP 都带此后缀，各分段互不覆盖
+
+    输出目录已有同名（同分段后缀）草稿时在原目录上增量重建：按镜头清单比对，只下载 / 探测改动过的镜头，
+    沿用原草稿 id、轨道 id 与未改动镜头的素材 / 片段 id。不再被引用的旧媒体文件留在目录里（不删除别人可能
+    正在读的文件），列在结果的 stale_media 中，不写入 ZIP。
     """
+    # seed 构建使用独立的 id 分配器和随机源，不影响同进程内的其他任务
+    if seed is not None:
+        build_ids = draft_ids.IdAllocator(seed)
+        build_rng = random.Random(seed)
+    else:
+        build_ids = draft_ids.current()
+        build_rng = random
+
     # 构建 URL → 本地路径查找表
     local_path_map: dict = {}
     if local_media_paths and isinstance(local_media_paths, list):
@@ -1966,19 +3119,6 @@ def create_draft_on_mac(
             if isinstance(entry, dict) and entry.get("url") and entry.get("localPath"):
                 local_path_map[str(entry["url"])] = str(entry["localPath"])
         print(f"[jianying_export] 本地媒体缓存映射: {len(local_path_map)} 个 URL", file=sys.stderr, flush=True)
-    # 调试信息必须写 stderr，stdout 仅用于 JSON（否则 Node 会把整段 stdout 当响应体）
-    for i, shot in enumerate(shots):
-        audio_url = shot.get("audioUrl") or shot.get("voiceoverAudioUrl")
-        image_url = shot.get("imageUrl") or (shot.get("imageUrls", [None])[0] if shot.get("imageUrls") else None)
-        vu = shot.get("videoUrls")
-        video_url = shot.get("videoUrl") or shot.get("video_url")
-        if vu and isinstance(vu, list) and len(vu) > 0:
-            video_url = vu[-1]
-        print(
-            f"[jianying_export] 镜头{i}: video={bool(video_url and str(video_url).strip())}, audio={bool(audio_url and str(audio_url).strip())}, image={bool(image_url and str(image_url).strip())}",
-            file=sys.stderr,
-            flush=True,
-        )
     if output_dir is None:
         output_dir = get_mac_draft_dir()
 
@@ -1989,25 +3129,29 @@ def create_draft_on_mac(
     else:
         safe_name = "".join(c for c in draft_name if c not in '/\\:*?"<>|').strip() or "未命名"
     draft_folder_name = safe_name
+    # 分批导出的每个分段落在各自的目录（<草稿目录名><zip_part_suffix>），
+    # 同一 batch 的后一段不会在前一段目录上增量重建、清掉前一段的媒体；
+    # 草稿名（客户端映射路径、剪映显示名）仍统一为 draft_folder_name
+    folder_suffix = "".join(c for c in str(zip_part_suffix or "") if c not in '/\\:*?"<>|')
 
     # 检查是否追加模式（已有草稿目录）
     append_mode_init = False
     if output_dir:
         # 每次请求使用相同的目录名
-        existing_check = os.path.join(output_dir, draft_folder_name, "draft_content.json")
+        existing_check = os.path.join(output_dir, draft_folder_name + folder_suffix, "draft_content.json")
         if os.path.exists(existing_check):
             append_mode_init = True
-            print(f"[jianying_export] 检测到已有草稿，将进入追加模式: {existing_check}", file=sys.stderr, flush=True)
+            print(f"[jianying_export] 检测到已有草稿，将在原目录增量重建: {existing_check}", file=sys.stderr, flush=True)
         else:
-            print(f"[jianying_export] 新建草稿目录: {draft_folder_name}", file=sys.stderr, flush=True)
+            print(f"[jianying_export] 新建草稿目录: {draft_folder_name}{folder_suffix}", file=sys.stderr, flush=True)
 
-    draft_folder = os.path.join(output_dir, draft_folder_name)
+    draft_folder = os.path.join(output_dir, draft_folder_name + folder_suffix)
     # 非追加模式时，如果目录已存在则添加后缀
     if not append_mode_init:
         counter = 1
         while os.path.exists(draft_folder):
             draft_folder_name = f"{safe_name}_{counter}"
-            draft_folder = os.path.join(output_dir, draft_folder_name)
+            draft_folder = os.path.join(output_dir, draft_folder_name + folder_suffix)
             counter += 1
 
     def _ensure_dirs():
@@ -2038,11 +3182,11 @@ def create_draft_on_mac(
         if e.errno == 1:  # Operation not permitted
             output_dir = _get_writable_output_dir()
             draft_folder_name = safe_name
-            draft_folder = os.path.join(output_dir, draft_folder_name)
+            draft_folder = os.path.join(output_dir, draft_folder_name + folder_suffix)
             counter = 1
             while os.path.exists(draft_folder):
                 draft_folder_name = f"{safe_name}_{counter}"
-                draft_folder = os.path.join(output_dir, draft_folder_name)
+                draft_folder = os.path.join(output_dir, draft_folder_name + folder_suffix)
                 counter += 1
             try:
                 _ensure_dirs()
@@ -2051,9 +3195,65 @@ def create_draft_on_mac(
         else:
             raise
 
-    draft_id = _make_id()
-    now_us = _timestamp_us()
-    timeline_id = _make_id()
+    draft_id = build_ids.next_id()
+    now_us = _build_timestamp_us(seed)
+    timeline_id = build_ids.next_id()
+
+    # ---- 镜头清单：与上次构建比对 ----
+    manifest_src = draft_folder if append_mode_init else base_draft
+    # seed 构建不沿用旧清单：旧清单的盐、id 与媒体文件名来自另一次构建，会让同一 seed + 同一输入的产物
+    # 随缓存里已有的草稿而变；seed 构建本身只取决于输入，全量重建即可逐字节复现
+    prior_manifest = load_shot_manifest(manifest_src) if manifest_src and seed is None else None
+    # 输入哈希 → 旧镜头条目（同一哈希可能出现多次，按顺序各认领一次）
+    prior_by_hash: dict = {}
+    # (kind, 媒体 key) → 旧媒体条目；画布尺寸变化时不复用探测结果（图片尺寸兜底依赖画布）
+    prior_media: dict = {}
+    track_ids = None
+    if prior_manifest:
+        for entry in prior_manifest.get("shots", []):
+            prior_by_hash.setdefault(entry.get("hash"), []).append(entry)
+            if prior_manifest.get("canvas") == [width, height]:
+                for kind, m in (entry.get("media") or {}).items():
+                    prior_media.setdefault((kind, m.get("key")), m)
+        if manifest_src == draft_folder:
+            draft_id = prior_manifest.get("draft_id") or draft_id
+            timeline_id = prior_manifest.get("timeline_id") or timeline_id
+            track_ids = tuple(prior_manifest.get("track_ids") or ()) or None
+        print(
+            f"[jianying_export] 镜头清单: {len(prior_manifest.get('shots', []))} 个旧镜头，{len(prior_media)} 个可复用媒体",
+            file=sys.stderr,
+            flush=True,
+        )
+    # ---- 流式打包（见 zip_packager）----
+    # seed 构建不提前写入：下载完成顺序不固定，收尾时按目录排序统一写入，ZIP 逐字节可复现
+    packager = None
+    zip_error = None
+    if package_zip and not media_only:
+        zip_path = os.path.join(os.path.dirname(draft_folder), f"{draft_folder_name}{zip_part_suffix or ''}.zip")
+        try:
+            packager = zip_packager.DraftZipWriter(
+                zip_path,
+                date_time=time.gmtime(now_us // 1_000_000)[:6] if seed is not None else None,
+            )
+        except OSError as e:
+            zip_error = str(e)
+
+    def _package_media(path: str) -> None:
+        """已下载并探测完的媒体立即写入 ZIP（主线程调用，与仍在进行的下载重叠）。"""
+        nonlocal packager, zip_error
+        if packager is None or seed is not None:
+            return
+        try:
+            packager.add_file(path, os.path.relpath(path, draft_folder))
+        except Exception as e:
+            zip_error = str(e)
+            packager.abort()
+            packager = None
+
+    # 镜头随机源的盐：沿用旧清单的，保证未改动镜头的随机选择不变
+    shot_salt = (prior_manifest or {}).get("salt") or (str(seed) if seed is not None else build_ids.next_hex())
+    if track_ids is None:
+        track_ids = (build_ids.next_id(), build_ids.next_id(), build_ids.next_id())
 
     mapped_root_abs = None
     if path_map_root and str(path_map_root).strip():
@@ -2073,21 +3273,69 @@ def create_draft_on_mac(
             return _safe_abs_for_jianying(local_abs_path)
 
     # ---- 下载资源，组装剪映 5.9 主脚本所需镜头行（绝对路径）----
-    # 关键：start_us 必须在阶段 C（后处理）算，那时每个 row 的 duration_us 才有正确值
+    # 关键：start_us 必须在组装 row 时算，那时每个 row 的 duration_us 才有正确值
     # 这里只做：收集下载计划、收集 shot 元数据（不累积 start_us，避免重置为 0）
-    prepared_shots: list[dict] = []
-    timeline_cursor = 0
-    total_shots = len(shots)
-    report_progress(5, f"开始处理 {total_shots} 个镜头...")
-    print(f"[jianying_export] 开始处理 {total_shots} 个镜头...", file=sys.stderr, flush=True)
+    # shots 可以是列表，也可以是边接收边产出镜头的迭代器（PayloadReader.iter_events 流式 ingest），
+    # 后者不等 payload 全部到达就开始下载，镜头总数在迭代结束后才知道
+    streaming = not isinstance(shots, (list, tuple))
+    if streaming:
+        report_progress(5, "开始接收并处理镜头...")
+        print("[jianying_export] 流式接收镜头，边接收边下载...", file=sys.stderr, flush=True)
+    else:
+        report_progress(5, f"开始处理 {len(shots)} 个镜头...")
+        print(f"[jianying_export] 开始处理 {len(shots)} 个镜头...", file=sys.stderr, flush=True)
 
-    # ── 阶段 A：枚举所有 shot，整理下载计划 ───────────────────────────────────
-    # 把每个 shot 的视频/图片/音频 URL 收集成 (shot_idx, kind, url, dest_path, local_src) 列表
-    # 然后一次性用 ThreadPoolExecutor 并行下载，大幅缩短下载等待时间
+    # ── 阶段 A：枚举 shot，整理下载计划 ──────────────────────────────────────
+    # 把每个 shot 的视频/图片/音频 URL 收集成 (shot_idx, kind, url, dest_path, local_src) 任务，
+    # 交给下面的 ThreadPoolExecutor 并行下载，大幅缩短下载等待时间
     download_plan: list[dict] = []
     shot_meta: list[dict] = []  # 每个 shot 的元数据（不含媒体文件，下载后再填充 row）
+    # 每个镜头还有多少个（下载 + 探测）未完成
+    pending_by_shot: list[int] = []
+    dl_by_shot: dict[tuple[int, str], dict] = {}
+    reused_shots = 0
+    # 本次新下载的目标路径（复用的旧文件不能被新下载覆盖）
+    planned_dests: set = set()
+
+    def _claim_dest(dest: str) -> str:
+        """新下载的目标路径：与已有文件（旧媒体）或本次已分配的路径重名时加随机前缀。"""
+        if dest in planned_dests or os.path.exists(dest):
+            folder, name = os.path.split(dest)
+            dest = os.path.join(folder, f"{build_ids.next_hex()[:8]}_{name}")
+        planned_dests.add(dest)
+        return dest
+
+    def _reuse_media(i: int, kind: str, meta: dict) -> bool:
+        """镜头清单里有同一媒体且文件仍在时直接登记为已下载 + 已探测，返回是否复用成功。"""
+        key = meta["media_keys"].get(kind)
+        # 优先用认领到的旧镜头自己的文件（同一 URL 在多个镜头里各有一份文件）
+        m = ((meta["prior"] or {}).get("media") or {}).get(kind)
+        if not m or m.get("key") != key or not prior_media:
+            m = prior_media.get((kind, key))
+        if not m or not m.get("probe"):
+            return False
+        dest = os.path.join(draft_folder, m["dest"])
+        src = os.path.join(manifest_src, m["dest"])
+        if dest in planned_dests:
+            return False
+        try:
+            if os.path.abspath(src) != os.path.abspath(dest):
+                _link_or_copy(src, dest)
+            elif not os.path.isfile(dest):
+                return False
+        except OSError:
+            return False
+        duration_us, w, h = m["probe"]
+        dl_by_shot[(i, kind)] = {
+            "shot_idx": i, "kind": kind, "url": meta[f"{kind}_url"], "dest": dest, "ok": True,
+            "probe": ProbedMedia(kind, _safe_abs_for_jianying(dest), duration_us, w, h),
+        }
+        meta[f"{kind}_dest"] = dest
+        return True
 
-    for i, shot in enumerate(shots):
+    def _plan_shot(i: int, shot: dict) -> list:
+        """登记第 i 个镜头的元数据，返回它的下载任务（同时追加到 download_plan）。"""
+        plan_start = len(download_plan)
         base_dur = int(float(shot.get("duration", 5)) * 1_000_000)
 
         vu = shot.get("videoUrls")
@@ -2120,13 +3368,27 @@ def create_draft_on_mac(
             "audio_url": str(audio_url).strip() if audio_url and str(audio_url).strip() else None,
             "client_audio_us": client_audio_us,
         }
+        nonlocal reused_shots
+        meta["media_keys"] = {
+            k: _shot_media_key(meta[f"{k}_url"]) for k in ("video", "image", "audio") if meta[f"{k}_url"]
+        }
+        meta["hash"] = _shot_hash(
+            (shot.get("caption") or "").strip(), base_dur, client_audio_us, meta["media_keys"]
+        )
+        claimed = prior_by_hash.get(meta["hash"])
+        prior = claimed.pop(0) if claimed else None
+        meta["prior"] = prior
+        meta["replay_ids"] = prior.get("ids") if prior else None
+        reused_shots += prior is not None
 
         # 视频：仅当 image_url 缺失或明确给出 video 时走视频（保持原行为：video_url 优先于 image_url）
-        if meta["video_url"]:
-            vname = _safe_filename(meta["video_url"])
+        if meta["video_url"] and _reuse_media(i, "video", meta):
+            pass
+        elif meta["video_url"]:
+            vname = _safe_filename(meta["video_url"], build_ids)
             if not re.search(r"\.(mp4|mov|webm|m4v)$", vname, re.I):
                 vname = f"{vname}.mp4" if "." not in vname else re.sub(r"[^.]+$", "mp4", vname)
-            dest = os.path.join(draft_folder, "Resources", "video", vname)
+            dest = _claim_dest(os.path.join(draft_folder, "Resources", "video", vname))
             download_plan.append({
                 "shot_idx": i, "kind": "video", "url": meta["video_url"], "dest": dest,
                 "local_src": local_path_map.get(meta["video_url"]),
@@ -2134,9 +3396,11 @@ def create_draft_on_mac(
             meta["video_dest"] = dest
 
         # 图片：仅在没有 video 时使用（与原逻辑一致）
-        if not meta["video_url"] and meta["image_url"]:
-            img_filename = _safe_filename(meta["image_url"])
-            dest = os.path.join(draft_folder, "Resources", "image", img_filename)
+        if not meta["video_url"] and meta["image_url"] and _reuse_media(i, "image", meta):
+            pass
+        elif not meta["video_url"] and meta["image_url"]:
+            img_filename = _safe_filename(meta["image_url"], build_ids)
+            dest = _claim_dest(os.path.join(draft_folder, "Resources", "image", img_filename))
             download_plan.append({
                 "shot_idx": i, "kind": "image", "url": meta["image_url"], "dest": dest,
                 "local_src": local_path_map.get(meta["image_url"]),
@@ -2144,9 +3408,11 @@ def create_draft_on_mac(
             meta["image_dest"] = dest
 
         # 音频
-        if meta["audio_url"]:
-            audio_filename = _safe_filename(meta["audio_url"])
-            dest = os.path.join(draft_folder, "Resources", "audio", audio_filename)
+        if meta["audio_url"] and _reuse_media(i, "audio", meta):
+            pass
+        elif meta["audio_url"]:
+            audio_filename = _safe_filename(meta["audio_url"], build_ids)
+            dest = _claim_dest(os.path.join(draft_folder, "Resources", "audio", audio_filename))
             download_plan.append({
                 "shot_idx": i, "kind": "audio", "url": meta["audio_url"], "dest": dest,
                 "local_src": local_path_map.get(meta["audio_url"]),
@@ -2154,61 +3420,56 @@ def create_draft_on_mac(
             meta["audio_dest"] = dest
 
         shot_meta.append(meta)
-
-    # ── 阶段 B：并行下载所有媒体（ThreadPoolExecutor 8 worker）─────────────────
-    # 30 个 shot × 平均 2 个文件 = 60 个下载任务，串行 60×3s=180s，并行 8 worker 约 23s
-    _MAX_DOWNLOAD_WORKERS = 8
-    total_downloads = len(download_plan)
+        tasks = download_plan[plan_start:]
+        pending_by_shot.append(len(tasks))
+        # 调试信息必须写 stderr，stdout 仅用于 JSON（否则 Node 会把整段 stdout 当响应体）
+        print(
+            f"[jianying_export] 镜头{i}: video={bool(meta['video_url'])}, audio={bool(meta['audio_url'])}, image={bool(meta['image_url'])}",
+            file=sys.stderr,
+            flush=True,
+        )
+        return tasks
+
+    # ── 阶段 B + C：下载 → 探测 → 组装 row 流水线 ───────────────────────────────
+    # 下载线程池（线程数按 host 分布自适应，同 host 并发由下载引擎限流）每完成一个文件，
+    # 立即交给探测线程池（ffprobe / 图片头解析），不再等所有下载结束后逐个串行探测；
+    # 镜头 row 按顺序组装：前面的镜头全部就绪后就立即累积 timeline_cursor。
+    # 流式输入时 host 分布未知，线程数取上限（同 host 并发仍由下载引擎的 _HostLimiter 控制）
+    if streaming:
+        _MAX_DOWNLOAD_WORKERS = DOWNLOAD_MAX_WORKERS
+    else:
+        for i, shot in enumerate(shots):
+            _plan_shot(i, shot)
+        _MAX_DOWNLOAD_WORKERS = _download_worker_count(download_plan)
+    _PROBE_WORKERS = PROBE_WORKERS
 
     def _download_one(task: dict) -> dict:
         """单个下载任务：返回带 ok 字段的结果。线程内调用，无共享状态。"""
         ok = _download_file(task["url"], task["dest"], local_source_path=task.get("local_src"))
         return {**task, "ok": ok}
 
-    download_results: list[dict] = []
-    if total_downloads > 0:
-        report_progress(8, f"开始并行下载 {total_downloads} 个媒体文件（{_MAX_DOWNLOAD_WORKERS} 并发）...")
-        print(f"[jianying_export] 并行下载 {total_downloads} 个媒体文件，{_MAX_DOWNLOAD_WORKERS} 并发...", file=sys.stderr, flush=True)
-        # 优先用 ThreadPoolExecutor；缺失时降级到顺序执行
+    def _probe_one(res: dict) -> dict:
+        """下载成功的文件立即探测元数据，结果写入 res["probe"]（探测线程内调用）。"""
+        if not res.get("ok"):
+            return res
+        path = _safe_abs_for_jianying(res["dest"])
         try:
-            from concurrent.futures import ThreadPoolExecutor, as_completed
-            with ThreadPoolExecutor(max_workers=_MAX_DOWNLOAD_WORKERS) as pool:
-                futures = {pool.submit(_download_one, t): t for t in download_plan}
-                completed = 0
-                for fut in as_completed(futures):
-                    res = fut.result()
-                    download_results.append(res)
-                    completed += 1
-                    # 下载阶段占总进度的 8% - 70%（62 个百分点）
-                    dl_progress = 8 + int((completed / max(total_downloads, 1)) * 62)
-                    report_progress(dl_progress, f"已下载 {completed}/{total_downloads} 媒体...")
-        except ImportError:
-            # 极老 Python 兼容：顺序下载
-            for t in download_plan:
-                download_results.append(_download_one(t))
+            res["probe"] = describe_media(res["kind"], path, width, height)
+        except Exception as e:
+            print(f"[jianying_export] 镜头{res['shot_idx']} {res['kind']} 探测失败: {e}", file=sys.stderr, flush=True)
+        return res
 
-    # 把下载结果按 (shot_idx, kind) 索引起来，供阶段 C 查询
-    dl_by_shot: dict[tuple[int, str], dict] = {}
-    for r in download_results:
-        dl_by_shot[(r["shot_idx"], r["kind"])] = r
-    # 汇总下载结果（替代原顺序循环里逐 shot 打印的日志）
-    failed = [r for r in download_results if not r.get("ok")]
-    if failed:
-        for f in failed[:10]:  # 最多打印前 10 个失败项，避免刷屏
-            print(f"[jianying_export] 镜头{f['shot_idx']} {f['kind']} 下载失败: {f['url'][:80]}", file=sys.stderr, flush=True)
-    print(f"[jianying_export] 下载汇总: 总 {total_downloads} 个，成功 {total_downloads - len(failed)}，失败 {len(failed)}", file=sys.stderr, flush=True)
+    download_results: list[dict] = []
 
-    # ── 阶段 C：处理每个 shot（探测时长、追加音频静音垫、构造 row）────────────
     prepared_shots: list[dict] = []
-    # ⚠️ 关键：timeline_cursor 必须在阶段 C 重新从 0 开始累积，
+    # ⚠️ 关键：timeline_cursor 必须在组装 row 时从 0 开始累积，
     # 阶段 A 只做下载计划收集，不应预设 start_us
     timeline_cursor = 0
-    report_progress(72, "媒体下载完成，开始后处理...")
-    for i, meta in enumerate(shot_meta):
-        # 处理进度占 72% - 75%（探测和静音垫都很快）
-        proc_progress = 72 + int((i / max(total_shots, 1)) * 3)
-        report_progress(proc_progress, f"处理镜头 {i+1}/{total_shots}...")
 
+    def _assemble_row(i: int) -> None:
+        """组装第 i 个镜头的 row（调用时该镜头的下载和探测都已完成，且前序镜头已组装）。"""
+        nonlocal timeline_cursor
+        meta = shot_meta[i]
         base_dur = meta["base_dur"]
         # 正确累积 start_us：每个 shot 开始 = 上一个 shot 结束
         start_us = timeline_cursor
@@ -2220,6 +3481,9 @@ def create_draft_on_mac(
             "caption": (meta["shot"].get("caption") or "").strip(),
             "audio_abs": None,
             "audio_duration_us": None,
+            # 增量重建：未改动镜头重放原 id；随机源只取决于镜头内容
+            "replay_ids": meta["replay_ids"],
+            "rng_seed": f"{shot_salt}:{meta['hash']}",
         }
 
         # ---- 视频 ----
@@ -2231,7 +3495,8 @@ def create_draft_on_mac(
             use_video = True
         if use_video and local_video_path:
             vabs = _safe_abs_for_jianying(local_video_path)
-            vd, vw, vh = _ffprobe_video_meta(vabs)
+            vprobe = vres.get("probe") or ProbedMedia("video", vabs)
+            vd, vw, vh = vprobe.duration_us, vprobe.width, vprobe.height
             if vd:
                 duration_us = vd
             row["media_kind"] = "video"
@@ -2247,10 +3512,14 @@ def create_draft_on_mac(
             ires = dl_by_shot.get((i, "image"))
             if ires and ires.get("ok"):
                 local_image_path = ires["dest"]
-            if not local_image_path:
-                local_image_path = _placeholder_shot_image_path(draft_folder, i, width, height)
-            img_abs = _safe_abs_for_jianying(local_image_path)
-            iw, ih = _read_image_dimensions(img_abs, width, height)
+            if local_image_path and ires.get("probe"):
+                iw, ih = ires["probe"].width, ires["probe"].height
+                img_abs = _safe_abs_for_jianying(local_image_path)
+            else:
+                if not local_image_path:
+                    local_image_path = _placeholder_shot_image_path(draft_folder, i, width, height)
+                img_abs = _safe_abs_for_jianying(local_image_path)
+                iw, ih = _read_image_dimensions(img_abs, width, height)
             row["media_kind"] = "photo"
             row["image_abs"] = img_abs
             row["image_client_path"] = _material_path_for_client(img_abs)
@@ -2265,7 +3534,9 @@ def create_draft_on_mac(
             # 时长通过 ffprobe 探测真实值（前端已通过 audioDurationExact 传递了估算值作为兜底）。
             row["audio_abs"] = _safe_abs_for_jianying(lap)
             row["audio_client_path"] = _material_path_for_client(row["audio_abs"])
-            probe_us = _ffprobe_duration_us(row["audio_abs"])
+            # 探测结果随 row 传给 _build_lv59_main_script，生成 JSON 时不再重复 ffprobe
+            row["audio_media"] = ares.get("probe") or ProbedMedia("audio", row["audio_abs"])
+            probe_us = row["audio_media"].duration_us
             if probe_us:
                 row["audio_duration_us"] = int(probe_us)
             else:
@@ -2296,6 +3567,81 @@ def create_draft_on_mac(
             import gc
             gc.collect()
 
+    def _assemble_ready_rows() -> None:
+        """按顺序组装所有已就绪的镜头（遇到第一个未就绪的镜头就停）。"""
+        while len(prepared_shots) < len(shot_meta) and pending_by_shot[len(prepared_shots)] == 0:
+            _assemble_row(len(prepared_shots))
+
+    _assemble_ready_rows()
+    if streaming or download_plan:
+        if not streaming:
+            report_progress(8, f"开始并行下载 {len(download_plan)} 个媒体文件（{_MAX_DOWNLOAD_WORKERS} 并发，边下载边探测）...")
+        print(f"[jianying_export] 并行下载 {'(流式)' if streaming else len(download_plan)} 个媒体文件，{_MAX_DOWNLOAD_WORKERS} 并发，探测 {_PROBE_WORKERS} 并发...", file=sys.stderr, flush=True)
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        downloaded = probed = 0
+        with ThreadPoolExecutor(max_workers=_MAX_DOWNLOAD_WORKERS) as dl_pool, \
+                ThreadPoolExecutor(max_workers=_PROBE_WORKERS) as probe_pool:
+            stage_of: dict = {}
+            in_flight: set = set()
+
+            def _drain(block: bool) -> None:
+                """处理已完成的下载 / 探测；block=False 时只收割当前已完成的，不等待。"""
+                nonlocal in_flight, downloaded, probed
+                while in_flight:
+                    done, in_flight = wait(in_flight, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+                    if not done:
+                        return
+                    total_downloads = len(download_plan)
+                    for fut in done:
+                        res = fut.result()
+                        if stage_of.pop(fut) == "download":
+                            downloaded += 1
+                            download_results.append(res)
+                            pf = probe_pool.submit(_probe_one, res)
+                            stage_of[pf] = "probe"
+                            in_flight.add(pf)
+                        else:
+                            probed += 1
+                            dl_by_shot[(res["shot_idx"], res["kind"])] = res
+                            if res.get("ok"):
+                                _package_media(res["dest"])
+                            pending_by_shot[res["shot_idx"]] -= 1
+                            _assemble_ready_rows()
+                        # 下载 + 探测占总进度的 8% - 75%
+                        pipe_progress = 8 + int(((downloaded + probed) / (2 * total_downloads)) * 67)
+                        report_progress(pipe_progress, f"已下载 {downloaded}/{total_downloads}，已探测 {probed}/{total_downloads} 媒体...")
+
+            def _submit(tasks: list) -> None:
+                for t in tasks:
+                    fut = dl_pool.submit(_download_one, t)
+                    stage_of[fut] = "download"
+                    in_flight.add(fut)
+
+            if streaming:
+                # 每收到一个镜头就提交它的下载，并顺手收割已完成的任务
+                for i, shot in enumerate(shots):
+                    _submit(_plan_shot(i, shot))
+                    _assemble_ready_rows()
+                    _drain(block=False)
+            else:
+                _submit(download_plan)
+            _drain(block=True)
+    _assemble_ready_rows()
+    total_shots = len(shot_meta)
+    total_downloads = len(download_plan)
+
+    # 汇总下载结果（替代原顺序循环里逐 shot 打印的日志）
+    failed = [r for r in download_results if not r.get("ok")]
+    if failed:
+        for f in failed[:10]:  # 最多打印前 10 个失败项，避免刷屏
+            print(f"[jianying_export] 镜头{f['shot_idx']} {f['kind']} 下载失败: {f['url'][:80]}", file=sys.stderr, flush=True)
+    print(f"[jianying_export] 下载汇总: 总 {total_downloads} 个，成功 {total_downloads - len(failed)}，失败 {len(failed)}", file=sys.stderr, flush=True)
+    if total_downloads > 0:
+        try:
+            evict_media_cache()
+        except Exception as e:
+            print(f"[jianying_export] [MEDIA_CACHE] 淘汰失败（不影响导出）: {e}", file=sys.stderr, flush=True)
+
     # 调试：汇总每个镜头的音频信息
     for i, r in enumerate(prepared_shots):
         print(f"[jianying_export] 镜头{i} 汇总: audio_abs={r.get('audio_abs','无')} audio_dur_us={r.get('audio_duration_us','无')} timeline_dur_us={r.get('duration_us','无')}", file=sys.stderr, flush=True)
@@ -2308,27 +3654,75 @@ def create_draft_on_mac(
 
     report_progress(84, "生成草稿内容...")
 
-    lv59_script = _build_lv59_main_script(
-        draft_id=draft_id,
-        now_us=now_us,
-        width=width,
-        height=height,
-        fps=fps,
-        total_duration=total_duration,
-        prepared_shots=prepared_shots,
-        draft_display_name=draft_folder_name,
-        random_transitions=random_transitions,
-        random_filters=random_filters,
-        total_shots=total_shots,
-    )
+    shot_ids = draft_ids.ReplayAllocator(build_ids)
+    with draft_ids.use_allocator(shot_ids):
+        lv59_script = _build_lv59_main_script(
+            draft_id=draft_id,
+            now_us=now_us,
+            width=width,
+            height=height,
+            fps=fps,
+            total_duration=total_duration,
+            prepared_shots=prepared_shots,
+            draft_display_name=draft_folder_name,
+            random_transitions=random_transitions,
+            random_filters=random_filters,
+            total_shots=total_shots,
+            rng=build_rng,
+            ids=shot_ids,
+            track_ids=track_ids,
+        )
 
     # 剪映 5.9 mac：主时间线读根目录 draft_info.json（materials + tracks），与 draft_content.json 同构
+    # Timelines/<id>/draft_info.json 与根目录脚本一致（避免部分版本只读子目录），三处一次写出
     root_info_path = os.path.join(draft_folder, "draft_info.json")
     content_path = os.path.join(draft_folder, "draft_content.json")
-    with open(root_info_path, "w", encoding="utf-8") as f:
-        json.dump(lv59_script, f, ensure_ascii=False, indent=2)
-    with open(content_path, "w", encoding="utf-8") as f:
-        json.dump(lv59_script, f, ensure_ascii=False, indent=2)
+    timeline_dir = os.path.join(draft_folder, "Timelines", timeline_id)
+    draft_info_path = os.path.join(timeline_dir, "draft_info.json")
+    write_draft_json(lv59_script, [content_path, root_info_path, draft_info_path])
+
+    # ---- 镜头清单（供下次增量重建）----
+    manifest_shots = []
+    for i, row in enumerate(prepared_shots):
+        media = {}
+        for kind in ("video", "image", "audio"):
+            res = dl_by_shot.get((i, kind))
+            if res and res.get("ok"):
+                probe = res.get("probe")
+                media[kind] = {
+                    "key": shot_meta[i]["media_keys"][kind],
+                    "dest": os.path.relpath(res["dest"], draft_folder),
+                    "probe": [probe.duration_us, probe.width, probe.height] if probe else None,
+                }
+        manifest_shots.append({"hash": shot_meta[i]["hash"], "media": media, "ids": row.get("ids", [])})
+    try:
+        _write_shot_manifest(draft_folder, {
+            "version": _SHOT_MANIFEST_VERSION,
+            "draft_id": draft_id,
+            "timeline_id": timeline_id,
+            "track_ids": list(track_ids),
+            "salt": shot_salt,
+            "canvas": [width, height],
+            "shots": manifest_shots,
+        })
+    except OSError as e:
+        print(f"[jianying_export] 写入镜头清单失败（下次导出将全量重建）: {e}", file=sys.stderr, flush=True)
+    # 旧清单引用、新清单不再引用的媒体文件（被替换的图片 / 配音等）：目录不是本次创建的，
+    # 其他任务可能仍在打包 / 下载其中的文件，因此不删除，只是不再写入本次的 ZIP
+    stale_media: list = []
+    if prior_manifest and manifest_src == draft_folder:
+        keep = {m["dest"] for entry in manifest_shots for m in entry["media"].values()}
+        for entry in prior_manifest.get("shots", []):
+            for m in (entry.get("media") or {}).values():
+                rel = m.get("dest")
+                if rel and rel not in keep and not os.path.isabs(rel) and not rel.startswith(".."):
+                    stale_media.append(os.path.normpath(rel))
+                    keep.add(rel)
+        print(
+            f"[jianying_export] 增量重建：复用 {reused_shots}/{total_shots} 个镜头，重新处理 {total_shots - reused_shots} 个",
+            file=sys.stderr,
+            flush=True,
+        )
 
     materials_count = len(lv59_script.get("materials", {}).get("videos", [])) + len(
         lv59_script.get("materials", {}).get("audios", [])
@@ -2408,7 +3802,7 @@ def create_draft_on_mac(
         f.write(f"cloud_last_modify_platform=mac\n")
         f.write(f"draft_create_time={int(now_us / 1_000_000)}\n")
         f.write(f"draft_last_edit_time={int(now_us / 1_000_000)}\n")
-        f.write(f"real_edit_keys={len(shots)}\n")
+        f.write(f"real_edit_keys={total_shots}\n")
         f.write(f"real_edit_seconds={total_duration // 1_000_000}\n")
 
     # ---- draft_agency_config.json ----
@@ -2462,14 +3856,7 @@ def create_draft_on_mac(
     with open(proj_path, "w", encoding="utf-8") as f:
         json.dump(project_json, f, ensure_ascii=False, indent=2)
 
-    # ---- Timelines/<id>/ 目录（与根目录脚本一致，避免部分版本只读子目录）----
-    timeline_dir = os.path.join(draft_folder, "Timelines", timeline_id)
-    os.makedirs(timeline_dir, exist_ok=True)
-
-    draft_info_path = os.path.join(timeline_dir, "draft_info.json")
-    with open(draft_info_path, "w", encoding="utf-8") as f:
-        json.dump(lv59_script, f, ensure_ascii=False, indent=2)
-
+    # ---- Timelines/<id>/ 目录（draft_info.json 已与根目录脚本一起写出）----
     # attachment_editing.json
     attach_edit = {
         "segment_video_config": {},
@@ -2507,148 +3894,348 @@ def create_draft_on_mac(
             "media_only": True,
         }
 
-    # ---- 检查是否需要追加到已有草稿（分批合并模式）----
-    append_mode = False
-    existing_draft_info = None
-    existing_draft_folder = None
-
-    if output_dir:
-        # 检查持久化目录是否已有草稿
-        existing_draft_path = os.path.join(output_dir, draft_folder_name)
-        existing_info_path = os.path.join(existing_draft_path, "draft_content.json")
-
-        if os.path.exists(existing_info_path):
-            try:
-                with open(existing_info_path, "r", encoding="utf-8") as f:
-                    existing_draft_info = json.load(f)
-                existing_draft_folder = existing_draft_path
-                append_mode = True
-                print(f"[jianying_export] 追加模式：发现已有草稿 {existing_draft_path}，将追加 {len(prepared_shots)} 个镜头", file=sys.stderr, flush=True)
-            except Exception as e:
-                print(f"[jianying_export] 读取已有草稿失败: {e}，将创建新草稿", file=sys.stderr, flush=True)
-
-    # ---- 追加模式：合并到已有草稿 ----
-    if append_mode and existing_draft_info:
-        # 读取已有的 materials 和 tracks
-        existing_materials = existing_draft_info.get("materials", {})
-        existing_tracks = existing_draft_info.get("tracks", [])
-
-        # 追加新的 materials
-        new_materials = lv59_script.get("materials", {})
-        for mat_type in ["videos", "images", "audios"]:
-            if mat_type in new_materials:
-                if mat_type not in existing_materials:
-                    existing_materials[mat_type] = []
-                # 去重后追加（基于 id）
-                existing_ids = {m.get("id") for m in existing_materials.get(mat_type, [])}
-                for mat in new_materials[mat_type]:
-                    if mat.get("id") not in existing_ids:
-                        existing_materials[mat_type].append(mat)
-
-        # 追加新的 tracks（假设都在主轨道）
-        # 找到时间线末尾
-        timeline_end_us = 0
-        for track in existing_tracks:
-            for segment in track.get("segments", []):
-                end_us = segment.get("start_time_us", 0) + segment.get("duration_us", 0)
-                timeline_end_us = max(timeline_end_us, end_us)
-
-        # 更新新片段的 start_us
-        new_tracks = lv59_script.get("tracks", [])
-        for track in new_tracks:
-            for segment in track.get("segments", []):
-                if "start_time_us" in segment:
-                    segment["start_time_us"] += timeline_end_us
-                else:
-                    segment["start_time_us"] = timeline_end_us
-
-        # 合并 tracks
-        if new_tracks:
-            existing_tracks.extend(new_tracks)
-
-        # 重新计算总时长
-        new_end_us = 0
-        for track in existing_tracks:
-            for segment in track.get("segments", []):
-                end_us = segment.get("start_time_us", 0) + segment.get("duration_us", 0)
-                new_end_us = max(new_end_us, end_us)
-        total_duration = new_end_us
-
-        # 更新 draft_content.json
-        merged_script = {
-            **existing_draft_info,
-            "materials": existing_materials,
-            "tracks": existing_tracks,
-            "duration": total_duration,
-        }
-
-        content_path = existing_info_path
-        root_info_path = os.path.join(existing_draft_folder, "draft_info.json")
-
-        with open(root_info_path, "w", encoding="utf-8") as f:
-            json.dump(merged_script, f, ensure_ascii=False, indent=2)
-        with open(content_path, "w", encoding="utf-8") as f:
-            json.dump(merged_script, f, ensure_ascii=False, indent=2)
-
-        # 更新 Timelines 目录
-        if os.path.exists(os.path.join(existing_draft_folder, "Timelines")):
-            for timeline_file in os.listdir(os.path.join(existing_draft_folder, "Timelines")):
-                if timeline_file.endswith(".json") and timeline_file.startswith("draft_"):
-                    timeline_path = os.path.join(existing_draft_folder, "Timelines", timeline_file)
-                    with open(timeline_path, "w", encoding="utf-8") as f:
-                        json.dump(merged_script, f, ensure_ascii=False, indent=2)
-
-        # 更新 meta info
-        meta_path = os.path.join(existing_draft_folder, "draft_meta_info.json")
-        if os.path.exists(meta_path):
-            try:
-                with open(meta_path, "r", encoding="utf-8") as f:
-                    meta_info = json.load(f)
-                meta_info["update_time"] = _timestamp_us()
-                meta_info["duration"] = total_duration
-                meta_info["tm_duration"] = total_duration
-                with open(meta_path, "w", encoding="utf-8") as f:
-                    json.dump(meta_info, f, ensure_ascii=False, indent=2)
-            except Exception as e:
-                print(f"[jianying_export] 更新 meta info 失败: {e}", file=sys.stderr, flush=True)
-
-        print(f"[jianying_export] 追加完成：共 {total_duration / 1_000_000:.1f}s，{len(existing_tracks)} 条轨道", file=sys.stderr, flush=True)
-
-        return {
-            "draft_id": existing_draft_info.get("id") or draft_id,
-            "draft_name": draft_folder_name,
-            "draft_folder": existing_draft_folder,
-            "content_path": content_path,
-            "total_duration": total_duration,
-            "shots_count": len(prepared_shots),
-            "materials_count": len(existing_materials.get("videos", [])) + len(existing_materials.get("audios", [])),
-            "platform": "macOS",
-            "merged": True,
-        }
-
     # ---- 草稿封面（生成纯色占位图）----
     try:
         _generate_cover(draft_folder, width, height)
     except Exception:
         pass  # 封面可选，失败不影响草稿
 
-    return {
+    result = {
         "draft_id": draft_id,
         "draft_name": draft_folder_name,
         "draft_folder": draft_folder,
         "content_path": content_path,
         "total_duration": total_duration,
-        "shots_count": len(shots),
+        "shots_count": total_shots,
         "materials_count": materials_count,
         "platform": "macOS",
+        "reused_shots": reused_shots,
+        "stale_media": stale_media,
     }
+    if packager is not None:
+        report_progress(92, "写入 ZIP 包...")
+        try:
+            packager.add_tree(draft_folder, exclude=(_SHOT_MANIFEST_NAME, *stale_media))
+            result["zip_path"] = packager.close()
+        except Exception as e:
+            packager.abort()
+            zip_error = str(e)
+    if zip_error:
+        result["zip_error"] = zip_error
+    return result
 
 
 # ---- 统一导出入口 ----
 
+# ---- 导出结果缓存（相同请求直接返回已有草稿目录与 ZIP）----
+# 前端超时 / 刷新后常会原样重发同一个导出请求，命中时跳过下载、探测、JSON 与打包整条流水线。
+# 目录结构：<get_persistent_dir()>/export_cache/
+#   <key>/                 一次构建的全部产物：<草稿目录>/、<草稿名>.zip、result.json（batch_export 返回值）
+#   locks/<key>.lock       进程间构建锁（flock）：并发的相同请求（不同 worker）只构建一次，其余等待后直接命中
+# key：Node 侧传入的 cacheKey（对原始请求做规范化哈希，data:URL 按内容参与）；未传入且 shots 为列表时
+#     由 export_cache_key() 计算。只缓存 Linux 下完整打包的单次导出（分批 / media_only / 指定输出目录不缓存）。
+# 增量重建：未命中时只以 base_key 相同（除 shots 外的规范化输入都相同，见 export_cache_base_key）的
+#     最近一次构建作为 base_draft，同名但参数不同的请求（如默认草稿名 ContentMaster_Export）互不继承。
+# 过期与容量：result.json 的 mtime 超过 JIANYING_EXPORT_CACHE_TTL 秒视为过期；命中时 touch 刷新 LRU，
+#     总量超过 JIANYING_EXPORT_CACHE_MB 时按 LRU 淘汰。
+EXPORT_CACHE_TTL = int(os.environ.get("JIANYING_EXPORT_CACHE_TTL", "86400") or 0)
+EXPORT_CACHE_MAX_MB = int(os.environ.get("JIANYING_EXPORT_CACHE_MB", "4096") or 0)
+# 草稿结构或打包方式变化时递增，旧版本的缓存条目视为未命中
+_EXPORT_CACHE_VERSION = 1
+_export_cache_root_path: typing.Optional[str] = None
+_export_key_locks = _KeyedLocks()
+
+
+def _export_cache_root() -> typing.Optional[str]:
+    """返回导出缓存根目录；禁用（JIANYING_EXPORT_CACHE=0、TTL 或容量为 0）或不可写时返回 None。"""
+    global _export_cache_root_path
+    if _export_cache_root_path is None:
+        _export_cache_root_path = ""
+        if (
+            os.environ.get("JIANYING_EXPORT_CACHE", "1") != "0"
+            and EXPORT_CACHE_TTL > 0
+            and EXPORT_CACHE_MAX_MB > 0
+        ):
+            root = os.path.join(get_persistent_dir(), "export_cache")
+            try:
+                os.makedirs(os.path.join(root, "locks"), exist_ok=True)
+                _export_cache_root_path = root
+            except OSError as e:
+                print(f"[jianying_export] [EXPORT_CACHE] 缓存目录不可用，跳过缓存: {e}", file=sys.stderr, flush=True)
+    return _export_cache_root_path or None
+
+
+def _canonical_hash(material: dict) -> str:
+    raw = json.dumps(material, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def export_cache_key(draft_name: str, shots: list, resolution: str, fps: int, **options) -> str:
+    """请求的规范化哈希：键排序的紧凑 JSON 的 sha256（options 为影响产物的其他参数，如 seed）。"""
+    return _canonical_hash({
+        "v": _EXPORT_CACHE_VERSION,
+        "draft_name": draft_name,
+        "shots": list(shots),
+        "resolution": resolution,
+        "fps": fps,
+        "options": options,
+    })
+
+
+def export_cache_base_key(draft_name: str, resolution: str, fps: int, **options) -> str:
+    """增量重建的匹配键：与 export_cache_key 相同的规范化输入，但不含 shots。"""
+    return _canonical_hash({
+        "v": _EXPORT_CACHE_VERSION,
+        "base": True,
+        "draft_name": draft_name,
+        "resolution": resolution,
+        "fps": fps,
+        "options": options,
+    })
+
+
+def _export_cache_entry(root: str, key: str) -> str:
+    # key 来自外部（Node 的 cacheKey）时也只取安全字符，避免路径穿越
+    safe = re.sub(r"[^0-9A-Za-z_-]", "", str(key))[:128] or "_"
+    return os.path.join(root, safe)
+
+
+@contextlib.contextmanager
+def export_cache_build_lock(key: str):
+    """同一 key 的构建互斥：进程内用线程锁，进程间用 flock（无 fcntl 的平台只做进程内互斥）。"""
+    root = _export_cache_root()
+    with _export_key_locks.hold(key, on_wait=lambda: report_progress(2, "等待相同请求的构建完成...")):
+        if not root:
+            yield
+            return
+        lock_path = os.path.join(root, "locks", os.path.basename(_export_cache_entry(root, key)) + ".lock")
+        with open(lock_path, "a+b") as lf:
+            try:
+                import fcntl
+            except ImportError:
+                fcntl = None
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lf.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    report_progress(2, "等待相同请求的构建完成...")
+                    fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+            yield  # 文件关闭即释放 flock
+
+
+def export_cache_get(key: str) -> typing.Optional[dict]:
+    """查找缓存的导出结果：产物齐全且未过期时刷新 LRU 并返回（附 cache_hit=True），否则返回 None。"""
+    root = _export_cache_root()
+    if not root or not key:
+        return None
+    entry = _export_cache_entry(root, key)
+    meta_path = os.path.join(entry, "result.json")
+    try:
+        if time.time() - os.path.getmtime(meta_path) > EXPORT_CACHE_TTL:
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    result = stored.get("result") if isinstance(stored, dict) else None
+    if stored.get("v") != _EXPORT_CACHE_VERSION or not isinstance(result, dict):
+        return None
+    if not os.path.isdir(result.get("draft_folder") or "") or not os.path.isfile(result.get("zip_path") or ""):
+        return None
+    try:
+        os.utime(meta_path)
+    except OSError:
+        pass
+    result["cache_hit"] = True
+    return result
+
+
+def export_cache_put(key: str, result: dict, base_key: str = None) -> None:
+    """记录一次成功构建的结果（产物已在 key 对应的条目目录内）；base_key 供之后的增量重建匹配。"""
+    root = _export_cache_root()
+    if not root:
+        return
+    entry = _export_cache_entry(root, key)
+    meta_path = os.path.join(entry, "result.json")
+    tmp = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"v": _EXPORT_CACHE_VERSION, "key": key, "base_key": base_key, "result": result}, f, ensure_ascii=False)
+    os.replace(tmp, meta_path)
+
+
+def export_cache_base_draft(base_key: str) -> typing.Optional[str]:
+    """base_key 相同的最近一次缓存构建的草稿目录（带镜头清单），用作增量重建的 base_draft；没有时返回 None。"""
+    root = _export_cache_root()
+    if not root:
+        return None
+    best, best_stamp = None, 0.0
+    for name in os.listdir(root):
+        meta_path = os.path.join(root, name, "result.json")
+        try:
+            stamp = os.path.getmtime(meta_path)
+            if stamp <= best_stamp:
+                continue
+            with open(meta_path, "r", encoding="utf-8") as f:
+                stored = json.load(f) or {}
+            result = stored.get("result") or {}
+        except (OSError, ValueError, AttributeError):
+            continue
+        folder = result.get("draft_folder") or ""
+        if stored.get("base_key") == base_key and os.path.isfile(os.path.join(folder, _SHOT_MANIFEST_NAME)):
+            best, best_stamp = folder, stamp
+    return best
+
+
+def evict_export_cache(max_mb: int = None, ttl: int = None) -> int:
+    """删除过期条目、1 小时前中断遗留的不完整条目，总量仍超过上限时按 LRU 淘汰到上限的 90%。返回删除的条目数。"""
+    root = _export_cache_root()
+    if not root:
+        return 0
+    limit = (EXPORT_CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+    ttl = EXPORT_CACHE_TTL if ttl is None else ttl
+    now = time.time()
+    live = []
+    total = 0
+    removed = 0
+    for name in os.listdir(root):
+        entry = os.path.join(root, name)
+        if name == "locks" or not os.path.isdir(entry):
+            continue
+        try:
+            stamp = os.path.getmtime(os.path.join(entry, "result.json"))
+            expired = now - stamp > ttl
+        except OSError:
+            stamp = os.path.getmtime(entry)
+            expired = now - stamp > 3600
+        if expired:
+            shutil.rmtree(entry, ignore_errors=True)
+            removed += 1
+            continue
+        size = 0
+        for dirpath, _dirs, files in os.walk(entry):
+            for fname in files:
+                try:
+                    size += os.lstat(os.path.join(dirpath, fname)).st_size
+                except OSError:
+                    pass
+        live.append((stamp, size, entry))
+        total += size
+    if total > limit:
+        target = int(limit * 0.9)
+        for _stamp, size, entry in sorted(live):
+            if total <= target:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+    # 条目已不存在且超过 TTL 未使用的锁文件
+    lock_dir = os.path.join(root, "locks")
+    for name in os.listdir(lock_dir):
+        path = os.path.join(lock_dir, name)
+        try:
+            if not os.path.isdir(os.path.join(root, name[:-5])) and now - os.path.getmtime(path) > ttl:
+                os.remove(path)
+        except OSError:
+            pass
+    if removed:
+        print(f"[jianying_export] [EXPORT_CACHE] 淘汰 {removed} 个条目，当前 {total / (1024 * 1024):.1f}MB", file=sys.stderr, flush=True)
+    return removed
+
+
 def batch_export(
     draft_name: str,
-    shots: list,
+    shots: typing.Iterable[dict],
+    resolution: str = "1920x1080",
+    fps: int = 30,
+    output_path: str = None,
+    random_transitions: bool = False,
+    random_filters: bool = False,
+    path_map_root: str = None,
+    force_draft_folder_name: str = None,
+    zip_part_suffix: str = None,
+    batch_id: str = None,
+    is_final_batch: bool = True,
+    media_only: bool = False,
+    local_media_paths: list = None,
+    seed: typing.Union[int, str, None] = None,
+    cache_key: str = None,
+) -> dict:
+    """
+    跨平台批量导出（参数见 _batch_export_build），带导出结果缓存。
+    cache_key: 请求的规范化哈希（Node 侧计算）；未传入且 shots 为列表时自动计算。
+    相同 key 的请求命中缓存时直接返回已有草稿目录与 ZIP；并发的相同请求只构建一次。
+    """
+    kwargs = dict(
+        draft_name=draft_name,
+        shots=shots,
+        resolution=resolution,
+        fps=fps,
+        output_path=output_path,
+        random_transitions=random_transitions,
+        random_filters=random_filters,
+        path_map_root=path_map_root,
+        force_draft_folder_name=force_draft_folder_name,
+        zip_part_suffix=zip_part_suffix,
+        batch_id=batch_id,
+        is_final_batch=is_final_batch,
+        media_only=media_only,
+        local_media_paths=local_media_paths,
+        seed=seed,
+    )
+    cacheable = (
+        get_platform() == "Linux"
+        and not (output_path or batch_id or media_only or local_media_paths)
+        and is_final_batch
+        and _export_cache_root() is not None
+    )
+    options = dict(
+        random_transitions=random_transitions,
+        random_filters=random_filters,
+        path_map_root=path_map_root,
+        force_draft_folder_name=force_draft_folder_name,
+        zip_part_suffix=zip_part_suffix,
+        seed=seed,
+    )
+    if cacheable and not cache_key and isinstance(shots, (list, tuple)):
+        cache_key = export_cache_key(draft_name, shots, resolution, fps, **options)
+    if not (cacheable and cache_key):
+        return _batch_export_build(**kwargs)
+
+    with export_cache_build_lock(cache_key):
+        # 在锁内查：等待期间并发的相同请求可能刚构建完成
+        cached = export_cache_get(cache_key)
+        if cached is not None:
+            print(f"[jianying_export] [EXPORT_CACHE] 命中 {cache_key[:12]}，直接返回 {cached.get('zip_path')}", file=sys.stderr, flush=True)
+            report_progress(100, "命中导出缓存")
+            return cached
+        entry = _export_cache_entry(_export_cache_root(), cache_key)
+        # 清掉中断遗留的半成品，避免新构建进入追加模式
+        shutil.rmtree(entry, ignore_errors=True)
+        os.makedirs(entry, exist_ok=True)
+        kwargs["output_path"] = entry
+        # 未命中时以参数完全相同、只有镜头不同的上一次构建为基础增量重建（改一句字幕 / 换一张图只处理改动的镜头）
+        base_key = export_cache_base_key(draft_name, resolution, fps, **options)
+        if seed is None:
+            kwargs["base_draft"] = export_cache_base_draft(base_key)
+        result = _batch_export_build(**kwargs)
+        if result.get("success") and result.get("zip_path") and not result.get("zip_error"):
+            try:
+                export_cache_put(cache_key, result, base_key=base_key)
+                result["cache_key"] = cache_key
+            except OSError as e:
+                print(f"[jianying_export] [EXPORT_CACHE] 写入失败（不影响导出）: {e}", file=sys.stderr, flush=True)
+        else:
+            shutil.rmtree(entry, ignore_errors=True)
+    try:
+        evict_export_cache()
+    except Exception as e:
+        print(f"[jianying_export] [EXPORT_CACHE] 淘汰失败（不影响导出）: {e}", file=sys.stderr, flush=True)
+    return result
+
+
+def _batch_export_build(
+    draft_name: str,
+    shots: typing.Iterable[dict],
     resolution: str = "1920x1080",
     fps: int = 30,
     output_path: str = None,
@@ -2663,6 +4250,8 @@ def batch_export(
     media_only: bool = False,
     # 本地媒体缓存路径映射，优先从本地文件复制而非重新下载
     local_media_paths: list = None,
+    seed: typing.Union[int, str, None] = None,
+    base_draft: str = None,
 ) -> dict:
     """
     跨平台批量导出。
@@ -2675,6 +4264,8 @@ def batch_export(
     is_final_batch: 是否为最后一组（最后一组才生成完整草稿和打包）
     media_only: 是否只保存媒体文件（用于分批中间组）
     local_media_paths: 格式 [{url: str, localPath: str}]，优先从本地路径复制文件
+    seed: 确定性构建（见 create_draft_on_mac），同一 seed + 同一输入生成相同的草稿
+    base_draft: 增量重建的基础草稿目录（见 create_draft_on_mac）
     """
     system = get_platform()
 
@@ -2693,7 +4284,7 @@ def batch_export(
     result = {
         "platform": system,
         "draft_name": draft_name,
-        "shots_count": len(shots),
+        "shots_count": len(shots) if isinstance(shots, (list, tuple)) else None,
         "resolution": f"{w}x{h}",
         "fps": fps,
     }
@@ -2723,6 +4314,10 @@ def batch_export(
                 force_draft_folder_name=force_draft_folder_name,
                 media_only=media_only,
                 local_media_paths=local_media_paths,
+                seed=seed,
+                base_draft=base_draft,
+                package_zip=system == "Linux" and not media_only,
+                zip_part_suffix=zip_part_suffix,
             )
             result.update(draft_result)
 
@@ -2766,22 +4361,29 @@ def batch_export(
                 zip_path = None
                 zip_error_msg = None
                 try:
-                    # Railway 环境：先清理临时文件再打包
-                    if system == "Linux":
+                    # ZIP 已在生成草稿时边下载边写出（create_draft_on_mac package_zip）
+                    zip_path = draft_result.get("zip_path")
+                    if draft_result.get("zip_error"):
+                        raise Exception(draft_result["zip_error"])
+                    if not zip_path:
+                        # Railway 环境：先清理临时文件再打包
                         cleanup_temp_files(preserve_patterns=[batch_id] if batch_id else None)
 
-                    # 再次检查空间（留 50MB 余量）
-                    space_ok, _ = check_disk_space(50)
-                    if not space_ok:
-                        raise Exception(f"磁盘空间不足，无法创建 ZIP。当前可用: {disk_free:.1f}MB")
-
-                    # 构建 ZIP 文件名（支持分批后缀）
-                    zip_name_base = draft_result["draft_name"]
-                    if zip_part_suffix:
-                        zip_name_base = f"{zip_name_base}{zip_part_suffix}"
-                    zip_base = os.path.join(os.path.dirname(draft_result["draft_folder"]), zip_name_base)
-                    report_progress(92, "创建 ZIP 包...")
-                    zip_path = shutil.make_archive(zip_base, 'zip', root_dir=draft_result["draft_folder"])
+                        # 再次检查空间（留 50MB 余量）
+                        space_ok, _ = check_disk_space(50)
+                        if not space_ok:
+                            raise Exception(f"磁盘空间不足，无法创建 ZIP。当前可用: {disk_free:.1f}MB")
+
+                        # 构建 ZIP 文件名（支持分批后缀）
+                        zip_name_base = draft_result["draft_name"]
+                        if zip_part_suffix:
+                            zip_name_base = f"{zip_name_base}{zip_part_suffix}"
+                        zip_path = os.path.join(os.path.dirname(draft_result["draft_folder"]), f"{zip_name_base}.zip")
+                        report_progress(92, "创建 ZIP 包...")
+                        zip_packager.pack_folder(
+                            draft_result["draft_folder"], zip_path,
+                            exclude=(_SHOT_MANIFEST_NAME, *draft_result.get("stale_media", ())),
+                        )
                     result["zip_path"] = zip_path
                     result["zip_size_mb"] = os.path.getsize(zip_path) / (1024 * 1024)
                     report_progress(98, f"ZIP 创建成功: {result['zip_size_mb']:.1f}MB")
@@ -2849,12 +4451,367 @@ def batch_export(
     return result
 
 
+# ---- 输入 payload 流式读取（data:URL 边读边落盘）----
+# stdin / --serve 的任务 JSON 可能带大量内联 base64 媒体。PayloadReader 按块扫描原始字节：
+# 普通内容原样拷贝，遇到 "data:...;base64,..." 字符串值时把正文边读边解码写到 spool_dir，
+# 并在 JSON 里替换成落盘文件的本地路径（_download_file 按本地文件处理）。
+# 最终交给 json.loads 的只剩去掉媒体正文后的小 JSON，峰值内存与内联媒体大小无关。
+# iter_events 进一步把 "shots" 数组逐个镜头产出（ijson 式事件），导出可以在 payload 收完之前开始，
+# 内存里同时只有一个镜头；Node 侧序列化时把 shots（以及 --serve 任务里的 payload）放在最后，
+# 其余参数先于镜头到达。
+_INGEST_CHUNK = 1 << 20
+_DATA_URL_HEADER_MAX = 256
+_INGEST_OUT_RE = re.compile(rb'["{}\[\]]')
+_INGEST_STR_RE = re.compile(rb'["\\]')
+_INGEST_HDR_RE = re.compile(rb'[,"\\]')
+
+
+class PayloadReader:
+    """从二进制流中逐个读取顶层 JSON 对象 / 数组（--serve 模式下同一个流连续读取多个任务）。"""
+
+    def __init__(self, stream, chunk_size: int = _INGEST_CHUNK):
+        # 管道上优先用 read1：有多少读多少，不会为凑满 chunk_size 阻塞到下一个任务
+        self._read = getattr(stream, "read1", None) or stream.read
+        self._chunk_size = chunk_size
+        self._buf = b""
+        self._eof = False
+        # 落盘的 data:URL 在各自 spool 目录内按序号命名（与 Node 侧 media_0000.ext 一致，可复现）
+        self._spool_dir = None
+        self._spool_seq = 0
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        self._buf += chunk
+        return True
+
+    def read_value(self, spool_dir: str):
+        """读取下一个顶层 JSON 值；流已结束（只剩空白）时抛 EOFError。"""
+        for kind, value in self._scan(spool_dir, None):
+            if kind == "end":
+                return value
+        raise ValueError("payload JSON 不完整")
+
+    def iter_events(self, spool_dir: str, path: tuple = ("shots",)):
+        """流式读取下一个顶层对象，把 path 指向的数组（如 ("payload", "shots")）逐个元素产出：
+
+          ("head", dict)  数组开始时，此前已读到的字段（嵌套对象按原结构补齐括号）
+          ("item", dict)  数组中的每个元素（须为对象）
+          ("end", dict)   整个对象（该数组的元素已逐个产出，此处为空列表）
+
+        只按数组所在深度和最内层 key 识别 path。没有该数组时只产出 ("end", ...)。流已结束时抛 EOFError。
+        """
+        return self._scan(spool_dir, path)
+
+    def _scan(self, spool_dir: str, path: typing.Optional[tuple]):
+        key_re = None
+        if path:
+            key_re = re.compile(rb',?\s*"' + re.escape(path[-1].encode("utf-8")) + rb'"\s*:\s*$')
+        out = bytearray()
+        state = "out"
+        depth = 0
+        arr_depth = 0  # >0 表示正在逐个产出 "shots" 数组元素（数组内部的 depth）
+        arr_pos = elem_start = 0
+        buf, i = self._buf, 0
+        sink = dec = None
+        spool_path = None
+        try:
+            while True:
+                need_more = False
+                n = len(buf)
+                if state == "out":
+                    m = _INGEST_OUT_RE.search(buf, i)
+                    if m is None:
+                        out += buf[i:]
+                        i = n
+                        need_more = True
+                    else:
+                        j = m.end()
+                        c = buf[j - 1:j]
+                        out += buf[i:j]
+                        i = j
+                        if c == b'"':
+                            state = "str_start"
+                        elif c in (b"{", b"["):
+                            depth += 1
+                            if arr_depth and depth == arr_depth + 1:
+                                elem_start = len(out) - 1
+                            elif (key_re and c == b"[" and depth == len(path) + 1 and not arr_depth
+                                    and key_re.search(out, 0, len(out) - 1)):
+                                arr_depth, arr_pos = depth, len(out)
+                                head = key_re.sub(b"", bytes(out[:arr_pos - 1])) + b"}" * len(path)
+                                yield "head", json.loads(head)
+                        else:
+                            depth -= 1
+                            if arr_depth and depth == arr_depth and elem_start:
+                                item = json.loads(bytes(out[elem_start:]))
+                                del out[arr_pos:]
+                                elem_start = 0
+                                yield "item", item
+                            elif arr_depth and depth < arr_depth:
+                                arr_depth = 0
+                            if depth <= 0:
+                                self._buf = buf[i:]
+                                yield "end", json.loads(bytes(out))
+                                return
+                elif state == "str_start":
+                    if n - i < 5 and not self._eof:
+                        need_more = True
+                    else:
+                        state = "hdr" if buf[i:i + 5] == b"data:" else "str"
+                elif state == "str":
+                    m = _INGEST_STR_RE.search(buf, i)
+                    if m is None:
+                        out += buf[i:]
+                        i = n
+                        need_more = True
+                    elif buf[m.start()] == 0x22:  # "
+                        out += buf[i:m.end()]
+                        i = m.end()
+                        state = "out"
+                    elif m.start() + 1 >= n:
+                        out += buf[i:m.start()]
+                        i = m.start()
+                        need_more = True
+                    else:
+                        out += buf[i:m.start() + 2]
+                        i = m.start() + 2
+                elif state == "hdr":
+                    m = _INGEST_HDR_RE.search(buf, i, min(n, i + _DATA_URL_HEADER_MAX))
+                    if m is None:
+                        if n - i >= _DATA_URL_HEADER_MAX or self._eof:
+                            state = "str"
+                        else:
+                            need_more = True
+                    elif buf[m.start()] == 0x2C and b";base64" in buf[i:m.start()].lower():  # ,
+                        header = buf[i:m.start()].decode("ascii", errors="replace")
+                        if spool_dir != self._spool_dir:
+                            self._spool_dir, self._spool_seq = spool_dir, 0
+                        spool_path = os.path.join(
+                            spool_dir, f"media_{self._spool_seq:04d}{_data_url_ext(header, '.bin')}"
+                        )
+                        self._spool_seq += 1
+                        sink = open(spool_path, "wb")
+                        dec = _Base64Decoder()
+                        i = m.end()
+                        state = "b64"
+                    else:
+                        state = "str"
+                else:  # b64：base64 正文直接解码写盘
+                    m = _INGEST_STR_RE.search(buf, i)
+                    end = m.start() if m else n
+                    sink.write(dec.feed(buf[i:end]))
+                    i = end
+                    if m is None:
+                        need_more = True
+                    elif buf[end] == 0x22:  # 正文结束
+                        sink.write(dec.flush())
+                        sink.close()
+                        sink = None
+                        out += json.dumps(spool_path, ensure_ascii=False)[1:].encode("utf-8")
+                        i = end + 1
+                        state = "out"
+                    elif end + 1 >= n:
+                        need_more = True
+                    else:
+                        # JSON 转义：只有 \/ 在 base64 里有意义，其余（换行等）忽略
+                        if buf[end + 1] == 0x2F:
+                            sink.write(dec.feed(b"/"))
+                        i = end + 2
+                if need_more:
+                    self._buf, buf, i = buf[i:], None, 0
+                    if not self._fill():
+                        if state == "out" and depth == 0 and not bytes(out).strip():
+                            raise EOFError("payload 流已结束")
+                        if state in ("str_start", "hdr"):
+                            buf = self._buf
+                            continue
+                        raise ValueError("payload JSON 不完整")
+                    buf = self._buf
+        finally:
+            if sink is not None:
+                sink.close()
+
+
+def read_streamed_job(reader: PayloadReader, spool_dir: str, path: tuple = ("shots",)) -> tuple:
+    """读取一个任务，path 指向的数组不等收完就以迭代器形式返回。
+
+    返回 (job, drain)：job 为数组开始前已到达的字段，数组位置换成逐个产出元素的迭代器；
+    drain() 读完该任务剩余部分（导出结束后必须调用，--serve 模式下才能接着读下一个任务），
+    并对数组之后才到达、因此未参与本次导出的字段打警告；任务 JSON 不完整或无法解析时抛 ValueError
+    （此时流的读取位置已不可信）。流已结束时抛 EOFError。
+    """
+    events = reader.iter_events(spool_dir, path)
+    kind, value = next(events)
+    if kind == "end":
+        return value, lambda: None
+    job = value
+    tail: dict = {}
+
+    def _items():
+        try:
+            for kind, value in events:
+                if kind == "item":
+                    yield value
+                else:
+                    tail["end"] = value
+        except (ValueError, EOFError) as e:
+            # 导出方消费镜头时遇到的解析错误也记下来：生成器此后已结束，drain() 据此报告任务不完整
+            tail["error"] = e
+            raise
+
+    items = _items()
+    node = job
+    for k in path[:-1]:
+        node = node.setdefault(k, {})
+    node[path[-1]] = items
+
+    def drain() -> None:
+        for _ in items:
+            pass
+        if "end" not in tail:
+            raise ValueError(f"任务 JSON 不完整: {tail.get('error') or '流提前结束'}")
+        head_node, end_node = job, tail.get("end") or {}
+        for k in path[:-1]:
+            head_node, end_node = head_node.get(k) or {}, end_node.get(k) or {}
+        late = sorted(set(end_node) - set(head_node))
+        if late:
+            print(f"[jianying_export] ⚠️ 字段 {late} 在 {path[-1]} 之后才到达，本次导出未使用", file=sys.stderr, flush=True)
+
+    return job, drain
+
+
+# ---- stdin / 文件 payload → batch_export 参数 ----
+
+def _batch_export_kwargs(payload: dict, draft_name: str, resolution: str, fps: int, output: str = None) -> dict:
+    """把 Node 传入的 payload（camelCase）转换为 batch_export 的关键字参数。"""
+    payload = payload or {}
+    return {
+        "draft_name": draft_name,
+        "shots": payload.get("shots", []),
+        "resolution": resolution,
+        "fps": fps,
+        "output_path": payload.get("outputPath") or output,
+        "random_transitions": bool(payload.get("randomTransitions")),
+        "random_filters": bool(payload.get("randomVideoEffects")),
+        "path_map_root": payload.get("pathMapRoot"),
+        "force_draft_folder_name": payload.get("forceDraftFolderName"),
+        "zip_part_suffix": payload.get("zipPartSuffix"),
+        "batch_id": payload.get("batchId"),
+        "is_final_batch": bool(payload.get("isFinalBatch", True)),
+        "media_only": bool(payload.get("mediaOnly", False)),
+        "local_media_paths": payload.get("localMediaPaths") or payload.get("local_media_paths"),
+        "seed": payload.get("seed"),
+        "cache_key": payload.get("cacheKey"),
+    }
+
+
+# ---- 常驻 worker 模式（--serve）----
+# Node 侧维护若干个常驻 Python 进程，通过 stdin/stdout 的 JSON-lines 投递任务，
+# 省去每次导出都要冷启动解释器、重新 import 模块和读取模板的开销。
+#
+# 请求（stdin，一行一个）：
+#   {"id": "...", "name": "草稿名", "resolution": "1920x1080", "fps": 30, "payload": {...}}
+#   {"type": "shutdown"}
+# 响应（stdout，一行一个）：
+#   {"type": "ready", "pid": 123}
+#   {"type": "progress", "id": "...", "progress": 50, "stage": "..."}
+#   {"type": "result", "id": "...", "result": {...batch_export 返回值...}}
+#   {"type": "error", "id": "..." | null, "error": "..."}  任务 JSON 无法解析；带 id 时本进程随即退出
+# 任务执行期间的 print 全部重定向到 stderr，stdout 只承载协议消息。
+# 任务经 PayloadReader 流式读取：内联 data:URL 在读取时就落盘到本任务的临时目录（任务结束后删除），
+# payload.shots 逐个镜头交给导出流水线，任务 JSON 收完之前下载就已开始。
+
+def serve_jobs(stdin=None, stdout=None) -> int:
+    """逐行读取任务并串行执行，直到 stdin 关闭或收到 shutdown。返回已处理任务数。"""
+    import contextlib
+    import gc
+    import threading
+    import traceback
+
+    stdin = stdin or sys.stdin
+    proto_out = stdout or sys.stdout
+    write_lock = threading.Lock()
+
+    def _send(msg: dict):
+        line = json.dumps(msg, ensure_ascii=False)
+        with write_lock:
+            proto_out.write(line + "\n")
+            proto_out.flush()
+
+    reader = PayloadReader(getattr(stdin, "buffer", stdin))
+    _send({"type": "ready", "pid": os.getpid()})
+    handled = 0
+    while True:
+        spool = tempfile.TemporaryDirectory(prefix="jianying_ingest_")
+        try:
+            job, drain = read_streamed_job(reader, spool.name, ("payload", "shots"))
+        except EOFError:
+            spool.cleanup()
+            break
+        except ValueError as e:
+            spool.cleanup()
+            _send({"type": "error", "id": None, "error": f"无效的任务 JSON: {e}"})
+            continue
+        if not isinstance(job, dict) or job.get("type") == "shutdown":
+            spool.cleanup()
+            break
+
+        job_id = job.get("id")
+        set_progress_callback(
+            lambda p, s, _id=job_id: _send({"type": "progress", "id": _id, "progress": p, "stage": s})
+        )
+        kwargs = None
+        drain_error = None
+        try:
+            kwargs = _batch_export_kwargs(
+                job.get("payload"),
+                draft_name=job.get("name") or "测试草稿",
+                resolution=job.get("resolution") or "1920x1080",
+                fps=int(job.get("fps") or 30),
+                output=job.get("output"),
+            )
+            with contextlib.redirect_stdout(sys.stderr):
+                result = batch_export(**kwargs)
+        except Exception as e:
+            result = {
+                "success": False,
+                "error": str(e),
+                "traceback": traceback.format_exc(),
+                "message": f"❌ 草稿生成失败：{e}",
+            }
+        finally:
+            set_progress_callback(None)
+            try:
+                drain()
+            except ValueError as e:
+                drain_error = e
+                print(f"[jianying_export] 任务 JSON 读取失败: {e}", file=sys.stderr, flush=True)
+            job = kwargs = None
+            spool.cleanup()
+            gc.collect()
+        handled += 1
+        if drain_error is not None:
+            # 任务只读到一部分：结果不可信，stdin 也已错位，报错后退出，由 Node 侧换一个新进程
+            _send({"type": "error", "id": job_id, "error": f"任务 JSON 读取失败: {drain_error}"})
+            break
+        _send({"type": "result", "id": job_id, "result": result})
+    return handled
+
+
 # ---- 命令行调试入口 ----
 if __name__ == "__main__":
     import argparse, sys as _sys
     parser = argparse.ArgumentParser(description="剪映草稿导出工具")
     parser.add_argument("--list", action="store_true", help="列出所有草稿")
     parser.add_argument("--list-json", action="store_true", help="列出所有草稿（JSON）")
+    parser.add_argument("--serve", action="store_true", help="常驻 worker 模式：stdin/stdout JSON-lines 接收导出任务")
     parser.add_argument("--name", type=str, default="测试草稿", help="草稿名称")
     parser.add_argument("--shots", type=str, default="[]", help="镜头 JSON（命令行参数方式）")
     parser.add_argument("--shots-json-stdin", action="store_true", help="镜头 JSON 从 stdin 读取（避免 E2BIG）")
@@ -2869,69 +4826,28 @@ if __name__ == "__main__":
         print(json.dumps({"error": "list_drafts 需要完全磁盘访问权限"}, ensure_ascii=False))
     elif args.list:
         print("list_drafts 需要完全磁盘访问权限")
+    elif args.serve:
+        serve_jobs()
     else:
-        # 优先从文件读取，其次从 stdin，最后从命令行参数
-        shots = []
-        output_path = args.output
-        path_map_root = None
-        force_draft_folder_name = None
-        zip_part_suffix = None
-        batch_id = None
-        is_final_batch = True
-        media_only = False
-        rnd_tr = rnd_fx = False
-        
-        if args.shots_json_file:
-            # 从文件读取 JSON
-            with open(args.shots_json_file, 'r', encoding='utf-8') as f:
-                stdin_data = json.load(f)
-            shots = stdin_data.get("shots", [])
-            output_path = stdin_data.get("outputPath") or args.output
-            path_map_root = stdin_data.get("pathMapRoot")
-            force_draft_folder_name = stdin_data.get("forceDraftFolderName")
-            zip_part_suffix = stdin_data.get("zipPartSuffix")
-            batch_id = stdin_data.get("batchId")
-            is_final_batch = bool(stdin_data.get("isFinalBatch", True))
-            media_only = bool(stdin_data.get("mediaOnly", False))
-            rnd_tr = bool(stdin_data.get("randomTransitions"))
-            rnd_fx = bool(stdin_data.get("randomVideoEffects"))
-            if args.progress_callback:
-                set_progress_callback(lambda p, s: report_progress(p, s))
-        elif args.shots_json_stdin:
-            # 从 stdin 读取 JSON
-            stdin_raw = _sys.stdin.read()
-            stdin_data = json.loads(stdin_raw)
-            shots = stdin_data.get("shots", [])
-            output_path = stdin_data.get("outputPath") or args.output
-            path_map_root = stdin_data.get("pathMapRoot")
-            force_draft_folder_name = stdin_data.get("forceDraftFolderName")
-            zip_part_suffix = stdin_data.get("zipPartSuffix")
-            batch_id = stdin_data.get("batchId")
-            is_final_batch = bool(stdin_data.get("isFinalBatch", True))
-            media_only = bool(stdin_data.get("mediaOnly", False))
-            local_media_paths = stdin_data.get("localMediaPaths") or stdin_data.get("local_media_paths")
-            rnd_tr = bool(stdin_data.get("randomTransitions"))
-            rnd_fx = bool(stdin_data.get("randomVideoEffects"))
-            if args.progress_callback:
-                set_progress_callback(lambda p, s: report_progress(p, s))
-        else:
-            shots = json.loads(args.shots)
-            local_media_paths = None
-            
-        result = batch_export(
-            draft_name=args.name,
-            shots=shots,
-            resolution=args.resolution,
-            fps=args.fps,
-            output_path=output_path,
-            random_transitions=rnd_tr,
-            random_filters=rnd_fx,
-            path_map_root=path_map_root,
-            force_draft_folder_name=force_draft_folder_name,
-            zip_part_suffix=zip_part_suffix,
-            batch_id=batch_id,
-            is_final_batch=is_final_batch,
-            media_only=media_only,
-            local_media_paths=local_media_paths,
-        )
+        # 优先从文件读取，其次从 stdin，最后从命令行参数；
+        # 文件 / stdin 流式读取：内联 data:URL 读取时即落盘到 spool，镜头边读边交给导出流水线
+        with tempfile.TemporaryDirectory(prefix="jianying_ingest_") as spool_dir, contextlib.ExitStack() as stack:
+            drain = None
+            if args.shots_json_file:
+                # 从文件读取 JSON
+                src = stack.enter_context(open(args.shots_json_file, 'rb'))
+                stdin_data, drain = read_streamed_job(PayloadReader(src), spool_dir)
+            elif args.shots_json_stdin:
+                # 从 stdin 读取 JSON
+                stdin_data, drain = read_streamed_job(PayloadReader(_sys.stdin.buffer), spool_dir)
+            else:
+                stdin_data = {"shots": json.loads(args.shots)}
+            if args.progress_callback and (args.shots_json_file or args.shots_json_stdin):
+                set_progress_callback(_print_progress_line)
+
+            try:
+                result = batch_export(**_batch_export_kwargs(stdin_data, args.name, args.resolution, args.fps, args.output))
+            finally:
+                if drain:
+                    drain()
         print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -1,23 +1,35 @@
 #!/usr/bin/env python3
 """
-合并多个剪映草稿目录成一个完整的草稿
+合并多个剪映草稿目录（或分批导出的分段 ZIP）成一个完整的草稿
 用法：
-  python merge_drafts.py --name "草稿名称" --output merged.zip --resolution 1920x1080 --fps 30 folder1 folder2 ...
+  python merge_drafts.py --name "草稿名称" --output merged.zip --resolution 1920x1080 --fps 30 folder1 part2.zip ...
+  python merge_drafts.py --append merged.zip part3.zip ...      # 增量追加到已合并草稿
 """
 import argparse
+import functools
 import os
+import shutil
 import sys
 import json
-import shutil
-import zipfile
 import re
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import draft_ids
+import zip_packager
 
-def _make_id():
-    """生成随机 ID"""
-    import random
-    return ''.join(random.choices('0123456789abcdefghijklmnopqrstuvwxyz', k=24))
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+# 草稿 / 轨道 / 片段 id：与导出服务共用批量分配器，格式为剪映的大写 UUID
+_make_id = draft_ids.make_id
+
+# 并行读取 / 重映射分段草稿的进程数（JIANYING_MERGE_WORKERS，默认 CPU 核数，最多 8）
+MERGE_WORKERS = max(1, int(os.environ.get("JIANYING_MERGE_WORKERS", "0") or 0) or min(8, os.cpu_count() or 1))
 
 
 def _timestamp_us():
@@ -26,37 +38,63 @@ def _timestamp_us():
     return int(time.time() * 1_000_000)
 
 
+def _encode_json(obj) -> bytes:
+    """合并后的大 JSON（draft_content / draft_info）一次性编码为紧凑 UTF-8：
+    json.dump(indent=2) 走纯 Python 编码器，上千个片段时占合并耗时的大头；有 orjson 时优先用它。"""
+    if _orjson is not None:
+        try:
+            return _orjson.dumps(obj)
+        except TypeError:
+            pass  # orjson 不支持的值（如超过 64 位的整数）回退到标准库
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
 def _safe_name(name: str) -> str:
     """生成安全的文件夹名"""
     return "".join(c for c in name if c not in '/\\:*?"<>|').strip() or "合并草稿"
 
 
-def _deep_copy(obj):
-    """深拷贝 JSON 对象"""
-    return json.loads(json.dumps(obj))
+# 整体迁移的素材类型，以及按 ID 去重迁移的附属素材类型（顺序即写入顺序）
+_PRIMARY_MATERIAL_TYPES = ("videos", "images", "audios", "texts")
+_EXTRA_MATERIAL_TYPES = (
+    "transitions", "filters", "video_effects",
+    "material_animations", "speeds", "beats",
+    "sound_channel_mappings", "vocal_separations",
+    "canvases", "stickers", "audio_effects",
+    "audio_fades", "audio_balances",
+)
 
+# 轨道类型：merge_drafts 旧格式为 0/1/2，导出服务（剪映 5.9）写 "video" / "audio" / "text"，两种都认
+_TRACK_KINDS = {0: "video", 1: "audio", 2: "text", "video": "video", "audio": "audio", "text": "text"}
+# (类别, 旧格式类型值, 新建轨道的名称)
+_TRACK_LAYOUT = (("video", 0, "视频轨"), ("audio", 1, "音频轨"), ("text", 2, "字幕"))
 
-def _rebase_segment_ids(segment: dict, mat_id_map: dict, new_seg_id: str) -> dict:
-    """
-    复制一个 segment，重新生成 ID，替换 material_id。
-    target_start 保持不变（调用方负责加 offset）。
-    """
-    seg = _deep_copy(segment)
-    seg["id"] = new_seg_id
-    # 替换 material_id
-    old_mat_id = seg.get("material_id") or seg.get("material_source_id", "")
-    if old_mat_id in mat_id_map:
-        seg["material_id"] = mat_id_map[old_mat_id]
-    # 替换 extra_material_refs 中的 ID
-    extra_refs = seg.get("extra_material_refs") or []
-    new_extra = []
-    for ref in extra_refs:
-        if ref in mat_id_map:
-            new_extra.append(mat_id_map[ref])
-        else:
-            new_extra.append(ref)
-    seg["extra_material_refs"] = new_extra
-    return seg
+
+def _track_kind(track: dict):
+    """轨道类别 "video" / "audio" / "text"，不认识的类型返回 None"""
+    kind = track.get("type")
+    return _TRACK_KINDS.get(kind) if isinstance(kind, (int, str)) else None
+
+
+def _seg_range(seg: dict) -> tuple:
+    """片段在时间线上的 (起点, 时长)：剪映 5.9 格式读 target_timerange，旧格式读 target_start / duration"""
+    timerange = seg.get("target_timerange")
+    if isinstance(timerange, dict):
+        return int(timerange.get("start", 0) or 0), int(timerange.get("duration", 0) or 0)
+    return int(seg.get("target_start", 0) or 0), int(seg.get("duration", 0) or 0)
+
+
+def _shift_seg(seg: dict, offset: int) -> None:
+    """片段在时间线上后移 offset 微秒（按片段自己的格式改 target_timerange.start 或 target_start）"""
+    start = _seg_range(seg)[0] + offset
+    if isinstance(seg.get("target_timerange"), dict):
+        seg["target_timerange"]["start"] = start
+    else:
+        seg["target_start"] = start
+
+
+def _seg_start(seg: dict) -> int:
+    return _seg_range(seg)[0]
 
 
 def _collect_timeline_dir(folder: Path):
@@ -70,22 +108,356 @@ def _collect_timeline_dir(folder: Path):
     return None
 
 
+_MEDIA_DIRS = ("image", "audio", "video")
+
+
+class _DraftSource:
+    """
+    一个待合并的分段草稿：草稿目录，或分批导出的分段 ZIP。
+    ZIP 不解压：draft_content.json 直接从归档读入内存，媒体条目由 add_raw 原样复制进输出 ZIP。
+    ZIP 内的草稿可以在根目录，也可以包在一个顶层目录里（以 Timelines/ 所在位置为准）。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.zf = None
+        self.raw = None
+        # ZIP 内草稿根目录的前缀（草稿包在顶层目录里时非空），目录草稿为 ""
+        self.prefix = ""
+        # read_content() 实际读到的脚本文件（相对草稿根目录）
+        self.content_relpath = None
+        if path.is_file():
+            if not zipfile.is_zipfile(path):
+                raise ValueError(f"不是有效的草稿 ZIP: {path}")
+            self.zf = zipfile.ZipFile(path)
+            # 媒体原样复制走独立的文件句柄，不和 ZipFile 读 JSON 共用读写位置
+            self.raw = open(path, "rb")
+            self.prefix = self._find_prefix()
+
+    def _find_prefix(self) -> str:
+        for name in self.zf.namelist():
+            idx = name.find("Timelines/")
+            if idx == 0 or (idx > 0 and name[idx - 1] == "/"):
+                return name[:idx]
+        return ""
+
+    def timeline_dir(self):
+        """Timelines/ 下第一个子目录，返回相对草稿根目录的 "Timelines/<id>"；没有时返回 None"""
+        if self.zf is None:
+            timeline_dir = _collect_timeline_dir(self.path)
+            return f"Timelines/{timeline_dir.name}" if timeline_dir else None
+        base = f"{self.prefix}Timelines/"
+        for name in self.zf.namelist():
+            if not name.startswith(base):
+                continue
+            parts = name[len(base):].split("/", 1)
+            if len(parts) == 2 and parts[0]:
+                return f"Timelines/{parts[0]}"
+        return None
+
+    def read_bytes(self, relpath: str):
+        """读取草稿内相对根目录的文件，不存在时返回 None"""
+        if self.zf is None:
+            path = self.path / relpath
+            return path.read_bytes() if path.is_file() else None
+        try:
+            return self.zf.read(self.prefix + relpath)
+        except KeyError:
+            return None
+
+    def read_content(self):
+        """
+        读取草稿脚本，依次尝试 Timelines/<id>/draft_content.json（merge_drafts 输出）、
+        根目录 draft_content.json 与 Timelines/<id>/draft_info.json（导出服务的布局，三处内容相同）；
+        都没有时打印跳过原因并返回 None
+        """
+        timeline_dir = self.timeline_dir()
+        candidates = ["draft_content.json"]
+        if timeline_dir:
+            candidates = [f"{timeline_dir}/draft_content.json", "draft_content.json", f"{timeline_dir}/draft_info.json"]
+        for relpath in candidates:
+            data = self.read_bytes(relpath)
+            if data is not None:
+                self.content_relpath = relpath
+                return json.loads(data)
+        print(f"[merge] 跳过无 draft_content.json / draft_info.json: {self.path}", file=sys.stderr)
+        return None
+
+    def iter_media(self):
+        """
+        Resources/{image,audio,video}/ 下的直接子文件，产出 (源, 合并后的 arcname)：
+        目录时源为文件路径，ZIP 时源为 ZipInfo。
+        """
+        if self.zf is None:
+            for src_dir in _MEDIA_DIRS:
+                src = self.path / "Resources" / src_dir
+                if not src.exists():
+                    continue
+                for f in src.iterdir():
+                    if f.is_file():
+                        yield str(f), f"Resources/{src_dir}/{f.name}"
+            return
+        infos = self.zf.infolist()
+        for src_dir in _MEDIA_DIRS:
+            base = f"{self.prefix}Resources/{src_dir}/"
+            for info in infos:
+                if info.is_dir() or not info.filename.startswith(base):
+                    continue
+                name = info.filename[len(base):]
+                if name and "/" not in name:
+                    yield info, f"Resources/{src_dir}/{name}"
+
+    def close(self) -> None:
+        if self.zf is not None:
+            self.zf.close()
+            self.raw.close()
+
+
+class _FolderWriter:
+    """
+    追加到草稿目录时代替 DraftZipWriter（同样的 add_files / add_raw / add_bytes / discard / close / abort 接口）：
+    每个文件先写 <目标>.part 再原子替换；abort() 删除本次新增的文件。JSON 在媒体之后最后写入。
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = folder
+        self._added: list = []
+
+    def _open(self, arcname: str):
+        dest = self.folder / arcname
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        return dest, dest.with_name(dest.name + ".part")
+
+    def _commit(self, tmp: Path, dest: Path) -> None:
+        existed = dest.exists()
+        os.replace(tmp, dest)
+        if not existed:
+            self._added.append(dest)
+
+    def add_files(self, entries) -> int:
+        added = 0
+        for path, arcname in entries:
+            dest, tmp = self._open(arcname)
+            shutil.copyfile(path, tmp)
+            self._commit(tmp, dest)
+            added += 1
+        return added
+
+    def add_raw(self, src, info: zipfile.ZipInfo, arcname: str) -> bool:
+        """把分段 ZIP 的条目解压写成文件（边读边解压，校验 CRC）"""
+        if info.compress_type == zipfile.ZIP_DEFLATED:
+            inflater = zlib.decompressobj(-15)
+        elif info.compress_type == zipfile.ZIP_STORED:
+            inflater = None
+        else:
+            raise zipfile.BadZipFile(f"不支持的压缩方式: {info.filename}")
+        dest, tmp = self._open(arcname)
+        crc = 0
+        with open(tmp, "wb") as out:
+            for chunk in zip_packager.iter_raw_member(src, info):
+                if inflater is not None:
+                    chunk = inflater.decompress(chunk)
+                crc = zlib.crc32(chunk, crc)
+                out.write(chunk)
+            if inflater is not None:
+                chunk = inflater.flush()
+                crc = zlib.crc32(chunk, crc)
+                out.write(chunk)
+        if crc != info.CRC:
+            os.remove(tmp)
+            raise zipfile.BadZipFile(f"CRC 校验失败: {info.filename}")
+        self._commit(tmp, dest)
+        return True
+
+    def add_bytes(self, arcname: str, data: bytes) -> bool:
+        dest, tmp = self._open(arcname)
+        tmp.write_bytes(data)
+        self._commit(tmp, dest)
+        return True
+
+    def discard(self, arcname: str) -> bool:
+        return False  # 目录里直接覆盖
+
+    def close(self) -> str:
+        return str(self.folder)
+
+    def abort(self) -> None:
+        for dest in self._added:
+            try:
+                os.remove(dest)
+            except OSError:
+                pass
+
+
+def _rewrite_media_paths(materials: dict, renames: dict) -> None:
+    """
+    媒体去重 / 改名后改写素材 path：renames 为 分段内 "Resources/<类型>/<文件名>" → 合并 ZIP 内的新路径，
+    只替换 path 结尾的这一段，前面的目录部分（含 Windows 分隔符）保持不变。
+    """
+    for mat_type in _PRIMARY_MATERIAL_TYPES:
+        for mat in materials.get(mat_type) or ():
+            path = mat.get("path")
+            if not path or not isinstance(path, str):
+                continue
+            norm = path.replace("\\", "/")
+            idx = norm.rfind("Resources/")
+            if idx < 0 or (idx > 0 and norm[idx - 1] != "/"):
+                continue
+            new = renames.get(norm[idx:])
+            if new:
+                if "\\" in path:
+                    new = new.replace("/", "\\")
+                mat["path"] = path[:idx] + new
+
+
+def _load_part(path: str, id_seed: str):
+    """
+    进程池任务：读取一个分段草稿，在该分段自己的 id 命名空间（id_seed）内重映射素材 / 片段 ID，
+    并计算分段的本地时长（所有轨道中最晚结束的片段）。
+    返回 None（跳过）或 {"materials", "video", "audio", "text", "extent", "track_types"}，片段起点仍为分段内时间；
+    track_types 记录各类别轨道在源草稿里的类型值（0/1/2 或 "video" 等），合并时沿用。
+    """
+    source = _DraftSource(Path(path))
+    try:
+        content = source.read_content()
+    finally:
+        source.close()
+    if content is None:
+        return None
+
+    make_id = draft_ids.IdAllocator(seed=id_seed).next_id
+    tracks = content.get("tracks") or []
+    mats = content.get("materials") or {}
+
+    # ── 收集 materials ──────────────────────────────────────────────────────
+    # content 是刚解析出来的、之后不再使用的对象，素材与片段直接原地改 ID，不做深拷贝
+    # videos / images / audios / texts 整体迁移，transitions / filters 等附属素材按 ID 去重
+    mat_id_map: dict = {}
+    materials: dict = {}
+    for mat_type in _PRIMARY_MATERIAL_TYPES + _EXTRA_MATERIAL_TYPES:
+        bucket = materials.setdefault(mat_type, [])
+        for mat in mats.get(mat_type) or ():
+            old_id = mat.get("id", "")
+            if not old_id or old_id in mat_id_map:
+                continue
+            new_id = make_id()
+            mat_id_map[old_id] = new_id
+            mat["id"] = new_id
+            bucket.append(mat)
+
+    # ── 收集 tracks ─────────────────────────────────────────────────────────
+    part = {"materials": materials, "video": [], "audio": [], "text": [], "extent": 0, "track_types": {}}
+    extent = 0
+    for track in tracks:
+        segments = track.get("segments") or []
+        if not segments:
+            continue
+        kind = _track_kind(track)
+        target = part[kind] if kind else None
+        if kind:
+            part["track_types"].setdefault(kind, track.get("type"))
+        track_id = track.get("id") or make_id()
+
+        for seg in segments:
+            seg["id"] = make_id()
+
+            # 替换 material_id / extra_material_refs
+            old_mat_id = seg.get("material_id") or ""
+            if old_mat_id in mat_id_map:
+                seg["material_id"] = mat_id_map[old_mat_id]
+            seg["extra_material_refs"] = [
+                mat_id_map.get(ref, ref) for ref in seg.get("extra_material_refs") or ()
+            ]
+
+            # 更新 track_id（合并后需要新 ID）
+            seg["track_id"] = track_id
+
+            # 所有轨道中最晚结束的片段决定本分段的时长
+            start, duration = _seg_range(seg)
+            extent = max(extent, start + duration)
+
+            if target is not None:
+                target.append(seg)
+
+    part["extent"] = extent
+    return part
+
+
+def _load_parts(paths: list, id_seeds: list) -> list:
+    """按输入顺序返回各分段的 _load_part 结果；多个分段时在进程池中并行（JSON 解析与重映射是纯 CPU 工作）。"""
+    workers = min(MERGE_WORKERS, len(paths))
+    if workers <= 1:
+        return [_load_part(path, seed) for path, seed in zip(paths, id_seeds)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_load_part, paths, id_seeds))
+
+
+def _concat_part(part, materials: dict, segment_lists: tuple, cursor: int) -> int:
+    """
+    把一个 _load_part 结果接到合并结果末尾：素材按类型追加，片段起点加上 cursor 后追加到
+    segment_lists（视频, 音频, 字幕）；返回下一个分段的起点。part 为 None（跳过的分段）时原样返回 cursor。
+    """
+    if part is None:
+        return cursor
+    for mat_type, mats in part["materials"].items():
+        materials.setdefault(mat_type, []).extend(mats)
+    for key, target in zip(("video", "audio", "text"), segment_lists):
+        for seg in part[key]:
+            _shift_seg(seg, cursor)
+        target.extend(part[key])
+    return cursor + part["extent"]
+
+
+def _place_media(media_index: zip_packager.ContentIndex, source: _DraftSource, src, arcname: str) -> tuple:
+    """media_index.place() 的包装：src 为 iter_media() 产出的文件路径或 ZipInfo"""
+    if source.zf is None:
+        return media_index.place(arcname, os.path.getsize(src), functools.partial(open, src, "rb"))
+    return media_index.place(arcname, src.file_size, functools.partial(source.zf.open, src), crc=src.CRC)
+
+
+def _write_media(
+    writer, sources: list, parts: list, media_index: zip_packager.ContentIndex, prefix: str = "",
+) -> None:
+    """
+    各分段的媒体按内容去重后写入 writer（arcname 前加 prefix）：目录里的文件走 add_files（并行压缩），ZIP 条目原样复制。
+    同名不同内容的文件改名，相同内容只写一份，对应分段素材的 path 随之改写。
+    """
+    for source, part in zip(sources, parts):
+        renames = {}
+        fresh = []
+        for src, arcname in source.iter_media():
+            final, is_new = _place_media(media_index, source, src, arcname)
+            if final != arcname:
+                renames[arcname] = final
+            if not is_new:
+                continue
+            if source.zf is None:
+                fresh.append((src, prefix + final))
+            else:
+                writer.add_raw(source.raw, src, prefix + final)
+        writer.add_files(fresh)
+        if renames and part is not None:
+            _rewrite_media_paths(part["materials"], renames)
+
+
 def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080", fps=30):
     """
-    合并多个剪映草稿目录成一个完整的剪映草稿 ZIP。
+    合并多个剪映草稿目录成一个完整的剪映草稿 ZIP；draft_folders 中也可以直接给分段 ZIP（不解压）。
     核心逻辑：
-      1. 从每个 batch 的 draft_content.json 提取视频/音频/字幕 segments，
-         累加 target_start 时间偏移，保留完整的音频轨道。
-      2. 收集所有 materials（images/audios/videos/texts/transitions 等），
+      1. 进程池并行读取每个 batch 的 draft_content.json，提取视频/音频/字幕 segments，
+         收集所有 materials（images/audios/videos/texts/transitions 等）并在各 batch 自己的 ID 命名空间内
          重新映射 material_id，避免 ID 冲突。
+      2. 串行按顺序累加各 batch 时长作为片段起点偏移，保留完整的音频轨道。
       3. 生成完整的 merged draft_content.json，写入所有轨道和 materials。
+      4. 直接写输出 ZIP：媒体从各草稿目录流式写入、从分段 ZIP 原样复制压缩数据，JSON 作为内存条目写入，不经过临时目录。
+         媒体按内容去重：相同内容只存一份，同名不同内容改名，素材 path 随之改写。
     """
     draft_folders = [Path(p) for p in draft_folders]
 
-    # 验证所有目录都存在
+    # 验证所有目录 / ZIP 都存在
     for folder in draft_folders:
         if not folder.exists():
-            raise FileNotFoundError(f'草稿目录不存在: {folder}')
+            raise FileNotFoundError(f'草稿目录或 ZIP 不存在: {folder}')
 
     # 解析分辨率
     if "x" in resolution:
@@ -97,13 +469,14 @@ def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080",
     output_path = Path(output_zip)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # 创建临时合并目录
-    import tempfile
-    import uuid
-    temp_dir = Path(tempfile.gettempdir()) / f"merge_{uuid.uuid4().hex[:8]}"
-    temp_dir.mkdir(parents=True, exist_ok=True)
+    # 不再建临时合并目录：媒体直接从各草稿目录流式写入输出 ZIP，生成的 JSON 作为内存条目写入
+    writer = None
+    sources: list = []
 
     try:
+        for folder in draft_folders:
+            sources.append(_DraftSource(folder))
+
         # ── 阶段 1：收集所有内容 ────────────────────────────────────────────────
         all_video_segments = []
         all_audio_segments = []
@@ -118,133 +491,37 @@ def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080",
             "canvases": [], "stickers": [], "audio_effects": [],
             "audio_fades": [], "audio_balances": [],
         }
-        # ID 映射：旧 material_id → 新 material_id（避免不同 batch 间 ID 冲突）
-        mat_id_map: dict[str, str] = {}
-
-        timeline_cursor = 0  # 微秒累积
-        total_duration = 0
-
-        for folder in draft_folders:
-            timeline_dir = _collect_timeline_dir(folder)
-            if not timeline_dir:
-                print(f"[merge] 跳过无 timeline 目录: {folder}", file=sys.stderr)
-                continue
-
-            content_path = timeline_dir / "draft_content.json"
-            if not content_path.exists():
-                print(f"[merge] 跳过无 draft_content.json: {folder}", file=sys.stderr)
-                continue
-
-            with open(content_path, 'r', encoding='utf-8') as f:
-                content = json.load(f)
-
-            tracks = content.get("tracks") or []
-            mats = content.get("materials") or {}
-
-            # ── 1a. 收集 materials ───────────────────────────────────────────────
-            # videos / images / audios / texts 整体迁移（去重）
-            existing_ids = set()
-            for m_list in merged_materials.values():
-                for m in m_list:
-                    existing_ids.add(m.get("id", ""))
-
-            for mat_type in ["videos", "images", "audios", "texts"]:
-                for mat in mats.get(mat_type, []):
-                    old_id = mat.get("id", "")
-                    if not old_id or old_id in existing_ids:
-                        continue
-                    new_id = _make_id()
-                    mat_id_map[old_id] = new_id
-                    mat_copy = _deep_copy(mat)
-                    mat_copy["id"] = new_id
-                    merged_materials.setdefault(mat_type, []).append(mat_copy)
-                    existing_ids.add(new_id)
-
-            # transitions / filters / video_effects / material_animations 等按 ID 去重
-            for mat_type in ["transitions", "filters", "video_effects",
-                              "material_animations", "speeds", "beats",
-                              "sound_channel_mappings", "vocal_separations",
-                              "canvases", "stickers", "audio_effects",
-                              "audio_fades", "audio_balances"]:
-                for mat in mats.get(mat_type, []):
-                    old_id = mat.get("id", "")
-                    if not old_id:
-                        continue
-                    if old_id in existing_ids:
-                        continue
-                    new_id = _make_id()
-                    mat_id_map[old_id] = new_id
-                    mat_copy = _deep_copy(mat)
-                    mat_copy["id"] = new_id
-                    merged_materials.setdefault(mat_type, []).append(mat_copy)
-                    existing_ids.add(new_id)
-
-            # ── 1b. 收集 tracks ────────────────────────────────────────────────
-            for track in tracks:
-                track_type = track.get("type")   # 0=视频, 1=音频, 2=字幕/文字
-                track_id = track.get("id") or _make_id()
-                segments = track.get("segments") or []
-
-                if not segments:
-                    continue
-
-                # 计算本轨道所有 segment 的总时长（用于累加 timeline_cursor）
-                track_total_dur = 0
-
-                for seg in segments:
-                    new_seg_id = _make_id()
-
-                    # 处理 segment
-                    seg_copy = _deep_copy(seg)
-                    seg_id = seg_copy.get("id") or _make_id()
-                    seg_copy["id"] = new_seg_id
-
-                    # 累加 target_start 偏移（只在第一个 batch 时从 0 开始）
-                    target_start = int(seg_copy.get("target_start", 0) or 0)
-                    seg_copy["target_start"] = target_start + timeline_cursor
-
-                    # 替换 material_id
-                    old_mat_id = seg_copy.get("material_id") or ""
-                    if old_mat_id in mat_id_map:
-                        seg_copy["material_id"] = mat_id_map[old_mat_id]
-
-                    # 替换 extra_material_refs
-                    old_extra = seg_copy.get("extra_material_refs") or []
-                    new_extra = []
-                    for ref in old_extra:
-                        if ref in mat_id_map:
-                            new_extra.append(mat_id_map[ref])
-                        else:
-                            new_extra.append(ref)
-                    seg_copy["extra_material_refs"] = new_extra
-
-                    # 更新 track_id（合并后需要新 ID）
-                    seg_copy["track_id"] = track_id
-
-                    # 统计时长
-                    dur = int(seg_copy.get("duration", 0) or 0)
-                    track_total_dur = max(track_total_dur, seg_copy["target_start"] + dur)
-
-                    # 按轨道类型收集
-                    if track_type == 0:
-                        all_video_segments.append(seg_copy)
-                    elif track_type == 1:
-                        all_audio_segments.append(seg_copy)
-                    elif track_type == 2:
-                        all_text_segments.append(seg_copy)
-
-                # 所有轨道中最长的那个决定 timeline_cursor 前进多少
-                timeline_cursor = max(timeline_cursor, track_total_dur)
-                total_duration = max(total_duration, track_total_dur)
-
-        # 按 target_start 排序（确保各轨道内部顺序正确）
+        # 每个分段在进程池里独立解析、重映射 ID（各用一个 id 分配器命名空间），并算出本地时长；
+        # 这里只串行累加时间线偏移、拼接结果。分段种子取自当前分配器，JIANYING_ID_SEED 下结果仍可复现
+        id_seeds = [_make_id() for _ in draft_folders]
+        timeline_cursor = 0  # 微秒累积：前面所有分段的时长之和
+
+        parts = _load_parts([str(folder) for folder in draft_folders], id_seeds)
+        if all(part is None for part in parts):
+            raise ValueError(f'没有可合并的分段（均缺少草稿脚本）: {", ".join(map(str, draft_folders))}')
+        for part in parts:
+            timeline_cursor = _concat_part(
+                part, merged_materials, (all_video_segments, all_audio_segments, all_text_segments), timeline_cursor,
+            )
+
+        total_duration = timeline_cursor
+
+        # 按片段起点排序（确保各轨道内部顺序正确）
         for seg_list in [all_video_segments, all_audio_segments, all_text_segments]:
-            seg_list.sort(key=lambda s: s.get("target_start", 0))
-
-        # ── 阶段 2：构建合并后的目录结构 ──────────────────────────────────────
+            seg_list.sort(key=_seg_start)
+        # 轨道类型沿用分段里的写法（导出服务为 "video" 等，旧格式为 0/1/2）
+        track_types = {kind: legacy for kind, legacy, _ in _TRACK_LAYOUT}
+        for part in reversed(parts):
+            if part is not None:
+                track_types.update(part["track_types"])
+
+        # ── 阶段 2：构建合并后的目录结构（ZIP 目录条目）─────────────────────────
         safe_draft_name = _safe_name(draft_name)
-        merged_draft = temp_dir / safe_draft_name
-        merged_draft.mkdir(parents=True, exist_ok=True)
+        # 写入 <output>.part，成功后原子替换为 output；媒体原样存储，JSON 并行压缩（见 zip_packager）
+        writer = zip_packager.DraftZipWriter(str(output_path))
+
+        def _put_json(arcname: str, obj, indent=2) -> None:
+            writer.add_bytes(arcname, json.dumps(obj, ensure_ascii=False, indent=indent).encode("utf-8"))
 
         # 创建所有必需目录
         for subdir in [
@@ -257,22 +534,18 @@ def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080",
             "qr_upload", "smart_crop", "subdraft",
             "common_attachment",
         ]:
-            os.makedirs(merged_draft / subdir, exist_ok=True)
-
-        # ── 阶段 3：复制所有媒体资源文件 ───────────────────────────────────────
-        for folder in draft_folders:
-            resources_dir = folder / "Resources"
-            if not resources_dir.exists():
-                continue
-            for src_dir in ['image', 'audio', 'video']:
-                src = resources_dir / src_dir
-                if not src.exists():
-                    continue
-                for f in src.iterdir():
-                    if f.is_file():
-                        dst = merged_draft / "Resources" / src_dir / f.name
-                        if not dst.exists():
-                            shutil.copy2(f, dst)
+            writer.add_dir(subdir)
+
+        # ── 阶段 3：媒体资源文件直接从源目录 / 分段 ZIP 写入（按内容去重）────────────
+        # 各分段共用的背景音乐、角色图只存一份；同名但内容不同的文件改名，对应素材的 path 随之改写
+        media_index = zip_packager.ContentIndex()
+        _write_media(writer, sources, parts, media_index)
+        if media_index.deduped:
+            print(
+                f"[merge] 媒体去重: {media_index.deduped} 个文件，"
+                f"节省 {media_index.deduped_bytes / (1024 * 1024):.1f}MB",
+                file=sys.stderr,
+            )
 
         # ── 阶段 4：生成 draft_content.json ─────────────────────────────────────
         draft_id = _make_id()
@@ -294,7 +567,7 @@ def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080",
         if all_video_segments:
             tracks_out.append({
                 "id": video_track_id,
-                "type": 0,
+                "type": track_types["video"],
                 "name": "视频轨",
                 "segments": all_video_segments,
                 "height": 0,
@@ -303,7 +576,7 @@ def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080",
         if all_audio_segments:
             tracks_out.append({
                 "id": audio_track_id,
-                "type": 1,
+                "type": track_types["audio"],
                 "name": "音频轨",
                 "segments": all_audio_segments,
                 "height": 0,
@@ -312,7 +585,7 @@ def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080",
         if all_text_segments:
             tracks_out.append({
                 "id": text_track_id,
-                "type": 2,
+                "type": track_types["text"],
                 "name": "字幕",
                 "segments": all_text_segments,
                 "height": 0,
@@ -395,11 +668,9 @@ def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080",
         }
 
         # 写入 merged draft_content.json
-        merged_timeline_dir = merged_draft / "Timelines" / timeline_id
-        merged_timeline_dir.mkdir(parents=True, exist_ok=True)
-        content_out_path = merged_timeline_dir / "draft_content.json"
-        with open(content_out_path, 'w', encoding='utf-8') as f:
-            json.dump(draft_content, f, ensure_ascii=False, indent=2)
+        merged_timeline_dir = f"Timelines/{timeline_id}"
+        writer.add_dir(merged_timeline_dir)
+        writer.add_bytes(f"{merged_timeline_dir}/draft_content.json", _encode_json(draft_content))
 
         # ── 阶段 5：生成 Timelines/project.json ──────────────────────────────────
         project_json = {
@@ -423,21 +694,10 @@ def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080",
             "update_time": now_us,
             "version": 0,
         }
-        proj_path = merged_draft / "Timelines" / "project.json"
-        with open(proj_path, 'w', encoding='utf-8') as f:
-            json.dump(project_json, f, ensure_ascii=False, indent=2)
+        _put_json("Timelines/project.json", project_json)
 
         # ── 阶段 6：生成 draft_info.json（与 draft_content 同构，兜底用）──────
         # 剪映专业版 macOS 主要读 draft_content.json，draft_info.json 主要给移动端用
-        draft_info = _deep_copy(draft_content)
-        # draft_info 中用 target_start 而非 start_us
-        for track in draft_info.get("tracks", []):
-            for seg in track.get("segments", []):
-                if "target_start" in seg:
-                    seg["target_start_us"] = seg["target_start"]
-                if "duration" in seg:
-                    seg["duration_us"] = seg["duration"]
-
         draft_info_out = {
             "config": {
                 "video_width": width,
@@ -450,9 +710,7 @@ def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080",
                 "segments": all_video_segments,  # draft_info 只用视频 segments
             },
         }
-        draft_info_path = merged_timeline_dir / "draft_info.json"
-        with open(draft_info_path, 'w', encoding='utf-8') as f:
-            json.dump(draft_info_out, f, ensure_ascii=False, indent=2)
+        writer.add_bytes(f"{merged_timeline_dir}/draft_info.json", _encode_json(draft_info_out))
 
         # ── 阶段 7：生成 draft_meta_info.json ───────────────────────────────────
         meta_info = {
@@ -478,18 +736,18 @@ def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080",
             "draft_materials_copied_info": [],
             "draft_local_timezone": "Asia/Shanghai",
         }
-        meta_path = merged_draft / "draft_meta_info.json"
-        with open(meta_path, 'w', encoding='utf-8') as f:
-            json.dump(meta_info, f, ensure_ascii=False, indent=2)
+        _put_json("draft_meta_info.json", meta_info)
 
         # ── 阶段 8：生成其他必需文件 ────────────────────────────────────────────
-        with open(merged_draft / "draft_settings", 'w', encoding='utf-8') as f:
-            f.write("[General]\n")
-            f.write(f"cloud_last_modify_platform=mac\n")
-            f.write(f"draft_create_time={int(now_us / 1_000_000)}\n")
-            f.write(f"draft_last_edit_time={int(now_us / 1_000_000)}\n")
-            f.write(f"real_edit_keys={len(all_video_segments)}\n")
-            f.write(f"real_edit_seconds={total_duration // 1_000_000}\n")
+        draft_settings = (
+            "[General]\n"
+            "cloud_last_modify_platform=mac\n"
+            f"draft_create_time={int(now_us / 1_000_000)}\n"
+            f"draft_last_edit_time={int(now_us / 1_000_000)}\n"
+            f"real_edit_keys={len(all_video_segments)}\n"
+            f"real_edit_seconds={total_duration // 1_000_000}\n"
+        )
+        writer.add_bytes("draft_settings", draft_settings.encode("utf-8"))
 
         for fname, content in [
             ("draft_agency_config.json", {}),
@@ -497,8 +755,7 @@ def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080",
             ("key_value.json", {}),
             ("performance_opt_info.json", {}),
         ]:
-            with open(merged_draft / fname, 'w', encoding='utf-8') as f:
-                json.dump(content, f)
+            _put_json(fname, content, indent=None)
 
         # attachment_editing.json
         attach_edit = {
@@ -506,24 +763,15 @@ def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080",
             "segment_text_config": {},
             "segment_audio_config": {},
         }
-        with open(merged_timeline_dir / "attachment_editing.json", 'w', encoding='utf-8') as f:
-            json.dump(attach_edit, f, ensure_ascii=False, indent=2)
+        _put_json(f"{merged_timeline_dir}/attachment_editing.json", attach_edit)
 
         # attachment_pc_common.json
         attach_pc = {"video": {}, "text": {}, "audio": {}}
-        with open(merged_timeline_dir / "attachment_pc_common.json", 'w', encoding='utf-8') as f:
-            json.dump(attach_pc, f, ensure_ascii=False, indent=2)
+        _put_json(f"{merged_timeline_dir}/attachment_pc_common.json", attach_pc)
 
-        # ── 阶段 9：打包成 ZIP ──────────────────────────────────────────────────
-        if output_path.exists():
-            output_path.unlink()
-
-        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for root, dirs, files in os.walk(merged_draft):
-                for file in files:
-                    file_path = Path(root) / file
-                    arcname = file_path.relative_to(merged_draft)
-                    zf.write(file_path, arcname)
+        # ── 阶段 9：写出中央目录，替换为正式 ZIP ───────────────────────────────
+        writer.close()
+        writer = None
 
         zip_size = output_path.stat().st_size / (1024 * 1024)
         print(f"合并完成: {output_path}", file=sys.stderr)
@@ -540,31 +788,190 @@ def merge_drafts(draft_name, output_zip, draft_folders, resolution="1920x1080",
             "audio_segments": len(all_audio_segments),
             "text_segments": len(all_text_segments),
             "total_duration_sec": round(total_duration / 1_000_000, 2),
+            "deduped_media": media_index.deduped,
             "zip_size_mb": round(zip_size, 2),
         }
 
     finally:
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        if writer is not None:
+            writer.abort()
+        for source in sources:
+            source.close()
+
+
+def append_drafts(merged, draft_folders):
+    """
+    增量合并：把新的分段草稿接到已合并草稿（merge_drafts 输出的 ZIP，或解压后的草稿目录）末尾，已有分段不重读、不重写。
+      1. 新分段与 merge_drafts 一样并行读取、重映射 ID，从已有片段的结束位置起累加时间偏移，追加到同类型轨道。
+      2. 新分段的媒体与已有媒体一起按内容去重；ZIP 在末尾追加条目并重写中央目录，目录直接复制进 Resources。
+      3. 重写 draft_content.json / draft_info.json / draft_meta_info.json / draft_settings（时长、片段数、更新时间）。
+    每批导出后追加一次，N 个分段的总开销与 N 成线性，而不是每次全量重新合并。
+    """
+    merged = Path(merged)
+    draft_folders = [Path(p) for p in draft_folders]
+    for folder in [merged, *draft_folders]:
+        if not folder.exists():
+            raise FileNotFoundError(f'草稿目录或 ZIP 不存在: {folder}')
+
+    target = None
+    writer = None
+    sources: list = []
+
+    try:
+        # ── 读取已合并草稿 ──────────────────────────────────────────────────────
+        target = _DraftSource(merged)
+        timeline_dir = target.timeline_dir()
+        content = target.read_content()
+        if content is None:
+            raise ValueError(f'已合并草稿缺少 draft_content.json: {merged}')
+        draft_info_raw = target.read_bytes(f"{timeline_dir}/draft_info.json")
+        meta_raw = target.read_bytes("draft_meta_info.json")
+        settings_raw = target.read_bytes("draft_settings")
+
+        for folder in draft_folders:
+            sources.append(_DraftSource(folder))
+
+        tracks = content.setdefault("tracks", [])
+        materials = content.setdefault("materials", {})
+        track_by_type: dict = {}
+        timeline_cursor = 0
+        for track in tracks:
+            kind = _track_kind(track)
+            if kind:
+                track_by_type.setdefault(kind, track)
+            for seg in track.get("segments") or ():
+                start, duration = _seg_range(seg)
+                timeline_cursor = max(timeline_cursor, start + duration)
+
+        # ── 新分段：并行读取、重映射，接在已有片段之后 ─────────────────────────
+        new_segments = ([], [], [])
+        parts = _load_parts([str(folder) for folder in draft_folders], [_make_id() for _ in draft_folders])
+        if all(part is None for part in parts):
+            raise ValueError(f'没有可追加的分段（均缺少草稿脚本）: {", ".join(map(str, draft_folders))}')
+        for part in parts:
+            timeline_cursor = _concat_part(part, materials, new_segments, timeline_cursor)
+
+        # 新建轨道的类型写法跟已有轨道一致（都没有时跟新分段一致）
+        string_types = any(isinstance(t.get("type"), str) for t in track_by_type.values()) or (
+            not track_by_type
+            and any(isinstance(v, str) for part in parts if part is not None for v in part["track_types"].values())
+        )
+        for (kind, legacy_type, track_name), segs in zip(_TRACK_LAYOUT, new_segments):
+            if not segs:
+                continue
+            track = track_by_type.get(kind)
+            if track is None:
+                track_type = kind if string_types else legacy_type
+                track = {"id": _make_id(), "type": track_type, "name": track_name, "segments": [], "height": 0, "width": 0}
+                tracks.append(track)
+                track_by_type[kind] = track
+            segs.sort(key=_seg_start)
+            for seg in segs:
+                seg["track_id"] = track["id"]
+            track.setdefault("segments", []).extend(segs)
+
+        total_duration = timeline_cursor
+        now_us = _timestamp_us()
+        content["duration"] = total_duration
+        content["update_time"] = now_us
+        video_segments = (track_by_type.get("video") or {}).get("segments") or []
+
+        # ── 媒体：已有媒体先登记，新分段中内容相同的直接引用已有文件 ──────────────
+        if target.zf is None:
+            writer = _FolderWriter(merged)
+        else:
+            writer = zip_packager.DraftZipWriter(str(merged), append=True)
+        media_index = zip_packager.ContentIndex()
+        for src, arcname in target.iter_media():
+            _place_media(media_index, target, src, arcname)
+        media_index.deduped = media_index.deduped_bytes = 0
+        _write_media(writer, sources, parts, media_index, prefix=target.prefix)
+
+        # ── JSON：替换为更新后的版本 ─────────────────────────────────────────────
+        def _replace(relpath: str, data: bytes) -> None:
+            arcname = target.prefix + relpath
+            writer.discard(arcname)
+            writer.add_bytes(arcname, data)
+
+        _replace(target.content_relpath, _encode_json(content))
+        if draft_info_raw is not None:
+            draft_info = json.loads(draft_info_raw)
+            # 只更新 merge_drafts 生成的精简 draft_info（content.segments 为视频片段）
+            if isinstance(draft_info.get("content"), dict):
+                draft_info["content"]["segments"] = video_segments
+                _replace(f"{timeline_dir}/draft_info.json", _encode_json(draft_info))
+        if meta_raw is not None:
+            meta_info = json.loads(meta_raw)
+            meta_info["duration"] = meta_info["tm_duration"] = total_duration
+            meta_info["update_time"] = now_us
+            _replace("draft_meta_info.json", json.dumps(meta_info, ensure_ascii=False, indent=2).encode("utf-8"))
+        if settings_raw is not None:
+            draft_settings = settings_raw.decode("utf-8")
+            for key, value in (
+                ("draft_last_edit_time", int(now_us / 1_000_000)),
+                ("real_edit_keys", len(video_segments)),
+                ("real_edit_seconds", total_duration // 1_000_000),
+            ):
+                draft_settings = re.sub(rf"^{key}=.*$", f"{key}={value}", draft_settings, flags=re.M)
+            _replace("draft_settings", draft_settings.encode("utf-8"))
+
+        writer.close()
+        writer = None
+
+        appended = sum(part is not None for part in parts)
+        counts = [len((track_by_type.get(kind) or {}).get("segments") or ()) for kind, _, _ in _TRACK_LAYOUT]
+        print(f"追加完成: {merged}（新增 {appended} 个分段）", file=sys.stderr)
+        print(f"  总时长: {total_duration / 1_000_000:.1f}s", file=sys.stderr)
+
+        result = {
+            "success": True,
+            "appended_drafts": appended,
+            "video_segments": counts[0],
+            "audio_segments": counts[1],
+            "text_segments": counts[2],
+            "total_duration_sec": round(total_duration / 1_000_000, 2),
+            "deduped_media": media_index.deduped,
+        }
+        if target.zf is None:
+            result["draft_folder"] = str(merged)
+        else:
+            result["merged_zip"] = str(merged)
+            result["zip_size_mb"] = round(merged.stat().st_size / (1024 * 1024), 2)
+        return result
+
+    finally:
+        if writer is not None:
+            writer.abort()
+        if target is not None:
+            target.close()
+        for source in sources:
+            source.close()
 
 
 def main():
-    parser = argparse.ArgumentParser(description='合并多个剪映草稿目录')
-    parser.add_argument('--name', required=True, help='合并后的草稿名称')
-    parser.add_argument('--output', required=True, help='输出的 ZIP 文件名')
+    parser = argparse.ArgumentParser(description='合并多个剪映草稿目录（或分段 ZIP）')
+    parser.add_argument('--name', help='合并后的草稿名称')
+    parser.add_argument('--output', help='输出的 ZIP 文件名')
     parser.add_argument('--resolution', default='1920x1080', help='分辨率')
     parser.add_argument('--fps', type=int, default=30, help='帧率')
-    parser.add_argument('draft_folders', nargs='+', help='要合并的草稿目录')
+    parser.add_argument('--append', help='已合并的草稿（ZIP 或目录）：把 draft_folders 追加到它末尾，忽略 --name / --output')
+    parser.add_argument('draft_folders', nargs='+', help='要合并的草稿目录或分段 ZIP')
 
     args = parser.parse_args()
+    if not args.append and not (args.name and args.output):
+        parser.error('未指定 --append 时 --name 和 --output 必填')
 
     try:
-        result = merge_drafts(
-            draft_name=args.name,
-            output_zip=args.output,
-            draft_folders=args.draft_folders,
-            resolution=args.resolution,
-            fps=args.fps,
-        )
+        if args.append:
+            result = append_drafts(args.append, args.draft_folders)
+        else:
+            result = merge_drafts(
+                draft_name=args.name,
+                output_zip=args.output,
+                draft_folders=args.draft_folders,
+                resolution=args.resolution,
+                fps=args.fps,
+            )
         print(json.dumps(result, ensure_ascii=False))
         return 0
     except Exception as e:
@@ -5,11 +5,14 @@
   python merge_zips.py --output merged.zip part1.zip part2.zip ...
 """
 import argparse
-import os
+import contextlib
+import functools
 import sys
 import zipfile
 from pathlib import Path
 
+import zip_packager
+
 
 def merge_zips(output_path, input_paths):
     """
@@ -17,45 +20,48 @@ def merge_zips(output_path, input_paths):
     策略：
     - 所有 ZIP 内部都有相同的子目录结构（如 draft_content/、draft/ 等）
     - 合并后保留各自子目录，避免文件冲突
+    - 同名文件内容相同时只保留一份，内容不同时改名为 <名字>_batchN
+    - 条目的压缩数据原样复制（不解压、不重新压缩），内存占用与条目大小无关
     """
     output_path = Path(output_path)
     if output_path.exists():
         output_path.unlink()
 
-    seen_names = set()
+    # 同名且内容相同的文件只写一次；同名不同内容改名（添加批次后缀）
+    # 这里不改写草稿 JSON 里的路径，所以不合并名字不同的相同内容
+    index = zip_packager.ContentIndex(cross_name=False, suffix='_batch{}')
+    seen_dirs = set()
+    written = 0
 
-    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as out_zip:
+    # 输入 ZIP 全部保持打开到合并结束：判断重复时可能要回头读前面分段的条目
+    with contextlib.ExitStack() as stack:
+        out_zip = stack.enter_context(zipfile.ZipFile(output_path, 'w', allowZip64=True))
         for zip_path in input_paths:
             zip_path = Path(zip_path)
             if not zip_path.exists():
                 raise FileNotFoundError(f'ZIP 不存在: {zip_path}')
 
-            with zipfile.ZipFile(zip_path, 'r') as in_zip:
-                for info in in_zip.infolist():
-                    # 如果是目录，保留
-                    if info.is_dir():
-                        out_zip.writestr(info, in_zip.read(info.filename))
-                        continue
-
-                    # 如果是文件，重命名避免冲突（添加批次后缀）
-                    original_name = info.filename
-                    # 提取目录 + 文件名
-                    dir_part = os.path.dirname(original_name)
-                    base_name = os.path.basename(original_name)
-
-                    # 保留原名，冲突则添加序号
-                    final_name = original_name
-                    counter = 1
-                    while final_name in seen_names:
-                        name_no_ext, ext = os.path.splitext(base_name)
-                        final_name = os.path.join(dir_part, f'{name_no_ext}_batch{counter}{ext}')
-                        counter += 1
+            in_zip = stack.enter_context(zipfile.ZipFile(zip_path, 'r'))
+            raw = stack.enter_context(open(zip_path, 'rb'))
+            for info in in_zip.infolist():
+                # 如果是目录，保留（多个 ZIP 的同名目录只写一次）
+                if info.is_dir():
+                    if info.filename not in seen_dirs:
+                        seen_dirs.add(info.filename)
+                        zip_packager.copy_raw_member(raw, info, out_zip)
+                    continue
 
-                    seen_names.add(final_name)
-                    data = in_zip.read(info.filename)
-                    out_zip.writestr(final_name, data)
+                final_name, is_new = index.place(
+                    info.filename, info.file_size, functools.partial(in_zip.open, info), crc=info.CRC,
+                )
+                if is_new:
+                    zip_packager.copy_raw_member(raw, info, out_zip, final_name)
+                    written += 1
 
-    print(f'✅ 合并完成: {output_path} ({len(input_paths)} 个 ZIP → {len(seen_names)} 个文件)')
+    print(
+        f'✅ 合并完成: {output_path} ({len(input_paths)} 个 ZIP → {written} 个文件，'
+        f'去重 {index.deduped} 个 / {index.deduped_bytes / (1024 * 1024):.1f}MB)'
+    )
 
 
 def main():
@@ -12,6 +12,7 @@
 import express from 'express';
 import cors from 'cors';
 import { spawn } from 'child_process';
+import { createHash } from 'crypto';
 import { existsSync, readFileSync } from 'fs';
 import { join, dirname, basename, resolve } from 'path';
 import { fileURLToPath } from 'url';
@@ -31,6 +32,8 @@ app.use(express.json({ limit: '1gb' }));
 app.use(express.urlencoded({ extended: true, limit: '1gb' }));
 
 const recentZipPathByName = new Map();
+// ZIP 文件名 → 草稿目录：ZIP 已被清理（导出缓存淘汰等）但草稿目录还在时，下载时现场流式打包
+const recentDraftFolderByZipName = new Map();
 
 // 异步导出任务（内存队列，进程重启后会清空）
 const exportTasks = new Map();
@@ -84,11 +87,45 @@ function normalizeExportResult(result, returnZip) {
   if (returnZip && result.zip_path) {
     const zipFilename = basename(result.zip_path);
     recentZipPathByName.set(zipFilename, result.zip_path);
+    if (result.draft_folder) recentDraftFolderByZipName.set(zipFilename, result.draft_folder);
     result.zip_download_url = `/api/jianying/download/${encodeURIComponent(zipFilename)}`;
   }
   return result;
 }
 
+// ── 导出结果缓存 key ──────────────────────────────────────────────────────
+// 对原始请求（data:URL 提取成临时文件之前，按内容参与）做规范化哈希：键排序的紧凑 JSON 的 sha256。
+// Python 侧以它作为导出结果缓存的 key（见 batch_export），重复提交的相同请求直接返回已有 ZIP。
+// 规范化 JSON 逐段喂给 hash，不拼出整串；内联 data:URL 先单独哈希、以摘要代替原文，不为它多复制一份。
+function updateCanonicalHash(hash, value) {
+  if (Array.isArray(value)) {
+    hash.update('[');
+    value.forEach((item, i) => {
+      if (i) hash.update(',');
+      updateCanonicalHash(hash, item);
+    });
+    hash.update(']');
+  } else if (value && typeof value === 'object') {
+    const keys = Object.keys(value).filter((k) => value[k] !== undefined).sort();
+    hash.update('{');
+    keys.forEach((k, i) => {
+      hash.update(`${i ? ',' : ''}${JSON.stringify(k)}:`);
+      updateCanonicalHash(hash, value[k]);
+    });
+    hash.update('}');
+  } else if (typeof value === 'string' && value.startsWith('data:')) {
+    hash.update(`"data:sha256,${createHash('sha256').update(value).digest('hex')}"`);
+  } else {
+    hash.update(JSON.stringify(value ?? null));
+  }
+}
+
+function exportCacheKey(fields) {
+  const hash = createHash('sha256');
+  updateCanonicalHash(hash, fields);
+  return hash.digest('hex');
+}
+
 // ── Data URL → Temp File 转换（避免超长 stdin JSON）──────────────────────
 function extractDataUrlsToTempFiles(shots) {
   const tempDir = join('/tmp', `jianying_data_${Date.now()}`);
@@ -179,6 +216,7 @@ async function runExportJob(payload, taskId, onProgress, fromRailway = false) {
     randomTransitions = false,
     randomVideoEffects = false,
     returnZip = false,
+    seed = null,
   } = payload || {};
 
   // 获取任务对象，用于存储日志
@@ -206,6 +244,11 @@ async function runExportJob(payload, taskId, onProgress, fromRailway = false) {
 
   notify(5, '开始处理...');
 
+  const cacheKey = exportCacheKey({
+    draftName, shots, resolution, fps, outputPath, pathMapRoot,
+    forceDraftFolderName, randomTransitions, randomVideoEffects, seed,
+  });
+
   // ── Data URL → Temp File（本地/Railway 均需要，避免超长 stdin JSON）────────
   let processedShots = shots;
   let tempDir = null;
@@ -225,14 +268,8 @@ async function runExportJob(payload, taskId, onProgress, fromRailway = false) {
 
   let pyResult;
   try {
-    pyResult = await runPythonStdin(
-      [
-        '--name', draftName,
-        '--shots-json-stdin',
-        '--resolution', resolution,
-        '--fps', String(fps),
-        '--progress-callback',
-      ],
+    pyResult = await runExportPython(
+      { name: draftName, resolution, fps },
       {
         shots: processedShots,
         outputPath,
@@ -240,6 +277,8 @@ async function runExportJob(payload, taskId, onProgress, fromRailway = false) {
         forceDraftFolderName,
         randomTransitions,
         randomVideoEffects,
+        seed,
+        cacheKey,
       },
       (progress, stage) => {
         const scaledProgress = Math.round(5 + progress * 0.9);
@@ -768,6 +807,26 @@ app.get('/api/jianying/download/:filename', (req, res) => {
 
     const zipPath = candidates.find((p) => existsSync(p));
     if (!zipPath) {
+      const draftFolder = recentDraftFolderByZipName.get(filename);
+      // 只从同名目录（<草稿目录名><分段后缀>）重建，别的分段 / 批次的目录内容对不上这个 ZIP
+      if (draftFolder && `${basename(draftFolder)}.zip` === filename && existsSync(draftFolder)) {
+        // 草稿目录直接打包写入响应（zip_packager 输出到 stdout），不在磁盘上生成临时 ZIP
+        const pyCmd = existsSync('/usr/bin/python3') ? '/usr/bin/python3' : 'python3';
+        const child = spawn(pyCmd, [join(__dirname, 'zip_packager.py'), draftFolder], {
+          stdio: ['ignore', 'pipe', 'pipe'],
+        });
+        res.setHeader('Content-Type', 'application/zip');
+        res.setHeader('Content-Disposition', `attachment; filename*=UTF-8''${encodeURIComponent(filename)}`);
+        child.stdout.pipe(res);
+        child.stderr.on('data', (d) => console.error('[jianying-server] zip stream:', d.toString()));
+        child.on('close', (code) => {
+          if (code !== 0) res.destroy(new Error(`zip_packager exited with ${code}`));
+        });
+        res.on('close', () => {
+          if (!res.writableEnded) child.kill();
+        });
+        return;
+      }
       return res.status(404).json({ error: 'zip not found' });
     }
     res.download(zipPath, filename);
@@ -778,18 +837,21 @@ app.get('/api/jianying/download/:filename', (req, res) => {
 
 // ── 合并多个剪映草稿目录（分批导出场景）────────────────────────────────────
 // 分批导出的镜头资源合并成一个完整的草稿 JSON，最后打包成单个 ZIP
+// draftFolders 也可以是分段 ZIP（完整路径或最近导出的 ZIP 文件名），merge_drafts.py 直接读归档，不解压
+// 传 appendTo（已合并 ZIP 的文件名或路径）时只把 draftFolders 增量追加到该 ZIP 末尾，不重新合并已有分段
 app.post('/api/jianying/export/merge-drafts', async (req, res) => {
   try {
-    const { draftName, draftFolders, resolution = '1920x1080', fps = 30 } = req.body;
+    const { draftName, draftFolders, appendTo, resolution = '1920x1080', fps = 30 } = req.body;
     
-    if (!draftName) {
+    if (!draftName && !appendTo) {
       return res.status(400).json({ error: '缺少草稿名称' });
     }
     if (!Array.isArray(draftFolders) || draftFolders.length < 1) {
       return res.status(400).json({ error: '至少需要1个草稿目录' });
     }
+    const draftSources = draftFolders.map((p) => recentZipPathByName.get(p) || p);
 
-    console.log(`[jianying-server] 开始合并 ${draftFolders.length} 个草稿目录...`);
+    console.log(`[jianying-server] 开始合并 ${draftSources.length} 个草稿目录 / ZIP...`);
 
     // 调用 Python 脚本合并草稿
     const pyCmd = existsSync('/usr/bin/python3') ? '/usr/bin/python3' : 'python3';
@@ -799,15 +861,25 @@ app.post('/api/jianying/export/merge-drafts', async (req, res) => {
       return res.status(500).json({ error: '合并脚本不存在' });
     }
 
-    const mergedFilename = `${draftName.replace(/[^a-zA-Z0-9\u4e00-\u9fa5_-]/g, '_')}_${Date.now()}.zip`;
+    const appendPath = appendTo ? resolve(recentZipPathByName.get(appendTo) || appendTo) : null;
+    if (appendPath && !existsSync(appendPath)) {
+      return res.status(404).json({ error: `已合并的 ZIP 不存在: ${appendTo}` });
+    }
+    const mergedFilename = appendPath
+      ? basename(appendPath)
+      : `${draftName.replace(/[^a-zA-Z0-9\u4e00-\u9fa5_-]/g, '_')}_${Date.now()}.zip`;
     
-    const child = spawn(pyCmd, [
+    const child = spawn(pyCmd, appendPath ? [
+      mergeScript,
+      '--append', appendPath,
+      ...draftSources
+    ] : [
       mergeScript,
       '--name', draftName,
       '--output', mergedFilename,
       '--resolution', resolution,
       '--fps', String(fps),
-      ...draftFolders
+      ...draftSources
     ], {
       timeout: 600_000, // 10 分钟合并超时
       stdio: ['pipe', 'pipe', 'pipe'],
@@ -828,7 +900,7 @@ app.post('/api/jianying/export/merge-drafts', async (req, res) => {
     });
 
     // 检查合并后的 ZIP
-    const mergedPath = resolve(__dirname, 'exports', mergedFilename);
+    const mergedPath = appendPath || resolve(__dirname, 'exports', mergedFilename);
     if (!existsSync(mergedPath)) {
       throw new Error('合并后的 ZIP 文件不存在');
     }
@@ -938,6 +1010,11 @@ app.listen(PORT, '0.0.0.0', () => {
   console.log(`✅ 剪映导出服务已启动，端口: ${PORT}`);
   console.log(`📄 Python 脚本: ${PYTHON_SCRIPT}`);
   console.log(`   exists: ${existsSync(PYTHON_SCRIPT)}`);
+  console.log(`🐍 Python worker 池: ${PY_WORKER_POOL_SIZE || '关闭（每次导出单独启动进程）'}`);
+  // 预热 worker，首个导出请求不用等解释器冷启动
+  if (existsSync(PYTHON_SCRIPT)) {
+    for (let i = pyWorkers.size; i < PY_WORKER_POOL_SIZE; i++) spawnPyWorker();
+  }
   console.log(`🌐 允许的来源: Vercel 前端 + 本地 localhost:3000`);
 });
 
@@ -1022,3 +1099,181 @@ function runPythonStdin(args, payload, onProgress = null) {
 function runPython(args) {
   return runPythonStdin(args, null);
 }
+
+// ═══════════════════════════════════════════════════════════════════════════
+// 常驻 Python worker 池（jianying_export_service.py --serve）
+// 每个 worker 一次只处理一个任务，任务通过 stdin JSON-lines 投递，
+// 省去每次导出的解释器冷启动 + import + 模板读取。
+// JIANYING_PY_WORKERS=0 时回退到每次导出单独 spawn 进程。
+// ═══════════════════════════════════════════════════════════════════════════
+
+const PY_WORKER_POOL_SIZE = Math.max(0, parseInt(process.env.JIANYING_PY_WORKERS ?? '2', 10) || 0);
+// 单个 worker 处理若干任务后主动回收，防止长期运行的内存碎片累积
+const PY_WORKER_MAX_JOBS = Math.max(1, parseInt(process.env.JIANYING_PY_WORKER_MAX_JOBS ?? '50', 10) || 50);
+const PY_JOB_TIMEOUT_MS = 600_000;
+
+const pyWorkers = new Set();
+const pyJobQueue = [];
+let pyJobSeq = 0;
+
+function spawnPyWorker() {
+  const pyCmd = existsSync('/usr/bin/python3') ? '/usr/bin/python3' : 'python3';
+  const child = spawn(pyCmd, ['-u', PYTHON_SCRIPT, '--serve'], {
+    stdio: ['pipe', 'pipe', 'pipe'],
+  });
+  const worker = { child, job: null, jobsDone: 0, exited: false, stdoutBuf: '' };
+
+  child.stdout.on('data', (d) => {
+    worker.stdoutBuf += d.toString();
+    let nl;
+    while ((nl = worker.stdoutBuf.indexOf('\n')) >= 0) {
+      const line = worker.stdoutBuf.slice(0, nl).trim();
+      worker.stdoutBuf = worker.stdoutBuf.slice(nl + 1);
+      if (line) handlePyWorkerMessage(worker, line);
+    }
+  });
+
+  child.stderr.on('data', (d) => {
+    if (worker.job) worker.job.stderr += d.toString();
+  });
+
+  const onGone = (err) => {
+    if (worker.exited) return;
+    worker.exited = true;
+    pyWorkers.delete(worker);
+    const job = worker.job;
+    worker.job = null;
+    if (job) {
+      clearTimeout(job.timer);
+      // worker 崩溃/被杀：按普通子进程失败的形态返回，交给 runExportJob 解析 stderr
+      job.resolve({ code: job.killed ? -1 : (child.exitCode ?? -1), stdout: '', stderr: job.stderr + (err ? `\n${err.message}` : '') });
+    }
+    dispatchPyJobs();
+  };
+  child.on('exit', () => onGone(null));
+  child.on('error', (err) => onGone(err));
+
+  pyWorkers.add(worker);
+  return worker;
+}
+
+function handlePyWorkerMessage(worker, line) {
+  let msg;
+  try {
+    msg = JSON.parse(line);
+  } catch {
+    // 非协议输出（理论上已被 Python 侧重定向到 stderr），记录后忽略
+    if (worker.job) worker.job.stderr += `${line}\n`;
+    return;
+  }
+  const job = worker.job;
+  if (msg.type === 'error' && (msg.id == null || !job || msg.id === job.id)) {
+    // 任务 JSON 无法解析：worker 在输入流中的位置已不可靠，当前任务按失败返回并回收该 worker
+    if (job) {
+      clearTimeout(job.timer);
+      worker.job = null;
+      job.resolve({ code: 1, stdout: '', stderr: `${job.stderr}${msg.error || 'Python worker 任务解析失败'}\n` });
+    }
+    retirePyWorker(worker);
+    dispatchPyJobs();
+    return;
+  }
+  if (!job || (msg.id != null && msg.id !== job.id)) return;
+
+  if (msg.type === 'progress') {
+    if (job.onProgress) {
+      try {
+        job.onProgress(Number(msg.progress), msg.stage);
+      } catch {
+        // 回调异常不影响任务
+      }
+    }
+  } else if (msg.type === 'result') {
+    clearTimeout(job.timer);
+    worker.job = null;
+    worker.jobsDone += 1;
+    job.resolve({ code: 0, stdout: JSON.stringify(msg.result), stderr: job.stderr });
+    if (worker.jobsDone >= PY_WORKER_MAX_JOBS) {
+      retirePyWorker(worker);
+    }
+    dispatchPyJobs();
+  }
+}
+
+function retirePyWorker(worker) {
+  pyWorkers.delete(worker);
+  worker.exited = true;
+  try {
+    worker.child.stdin.end(`${JSON.stringify({ type: 'shutdown' })}\n`);
+  } catch {
+    worker.child.kill('SIGKILL');
+  }
+}
+
+function dispatchPyJobs() {
+  while (pyJobQueue.length > 0) {
+    let worker = [...pyWorkers].find((w) => !w.job && !w.exited);
+    if (!worker && pyWorkers.size < PY_WORKER_POOL_SIZE) {
+      worker = spawnPyWorker();
+    }
+    if (!worker) return;
+
+    const job = pyJobQueue.shift();
+    worker.job = job;
+    job.timer = setTimeout(() => {
+      job.killed = true;
+      console.error('[jianying-server] Python worker 任务超时被杀（10分钟）');
+      worker.child.kill('SIGKILL');
+    }, PY_JOB_TIMEOUT_MS);
+    worker.child.stdin.write(`${JSON.stringify(job.message)}\n`);
+  }
+}
+
+/**
+ * 把 shots 移到 payload 末尾：Python 侧边接收边导出，其余参数需先于镜头到达
+ * @param {object} payload
+ */
+function shotsLast(payload) {
+  if (!payload || !Array.isArray(payload.shots)) return payload;
+  const { shots, ...rest } = payload;
+  return { ...rest, shots };
+}
+
+/**
+ * 通过常驻 worker 池执行导出任务，返回与 runPythonStdin 相同的 { code, stdout, stderr } 形态
+ * @param {{name: string, resolution: string, fps: number}} opts - 原 CLI 参数
+ * @param {object} payload - 原 stdin JSON
+ * @param {function|null} onProgress - 进度回调 (progress: number, stage: string) => void
+ */
+function runExportPython(opts, payload, onProgress = null) {
+  payload = shotsLast(payload);
+  if (PY_WORKER_POOL_SIZE === 0) {
+    return runPythonStdin(
+      [
+        '--name', opts.name,
+        '--shots-json-stdin',
+        '--resolution', opts.resolution,
+        '--fps', String(opts.fps),
+        '--progress-callback',
+      ],
+      payload,
+      onProgress
+    );
+  }
+  if (!existsSync(PYTHON_SCRIPT)) {
+    return Promise.reject(new Error(`Python 脚本不存在: ${PYTHON_SCRIPT}`));
+  }
+  return new Promise((resolve) => {
+    const id = `job_${Date.now()}_${++pyJobSeq}`;
+    pyJobQueue.push({
+      id,
+      message: { id, name: opts.name, resolution: opts.resolution, fps: Number(opts.fps), payload },
+      onProgress,
+      resolve,
+      stderr: '',
+      timer: null,
+      killed: false,
+    });
+    dispatchPyJobs();
+  });
+}
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试直接导入 jianying-server 下的模块（jianying_export_service / merge_drafts / zip_packager）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,32 @@
+"""data:URL 边读边解码落盘：base64 正文里的 "\\/" 转义、被块边界拆开的 "data:" 头。"""
+import base64
+import io
+import json
+import os
+
+import pytest
+
+import jianying_export_service as export_service
+
+_MEDIA = bytes(range(256)) * 3  # base64 里包含 "/" 与 "+"
+
+
+def _data_url_json(mime: str = "image/png") -> str:
+    encoded = base64.b64encode(_MEDIA).decode("ascii")
+    assert "/" in encoded
+    # JSON 允许把 "/" 转义成 "\/"（部分序列化器默认如此）
+    return f"data:{mime};base64," + encoded.replace("/", "\\/")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 1 << 20])
+def test_data_url_escaped_slash_and_split_header(tmp_path, chunk_size):
+    # 小块读取时 "data:" 头、base64 正文和 "\/" 转义都会被拆在块边界上
+    text = json.dumps({"draftName": "x"})[:-1] + ', "shots": [{"imageUrl": "' + _data_url_json() + '"}]}'
+    reader = export_service.PayloadReader(io.BytesIO(text.encode("utf-8")), chunk_size=chunk_size)
+    job = reader.read_value(str(tmp_path))
+    path = job["shots"][0]["imageUrl"]
+    assert path == os.path.join(str(tmp_path), "media_0000.png")
+    with open(path, "rb") as f:
+        assert f.read() == _MEDIA
+    with pytest.raises(EOFError):
+        reader.read_value(str(tmp_path))
@@ -0,0 +1,114 @@
+"""下载引擎：keep-alive 连接复用、重定向、错误状态码，以及按 host 的 AIMD 并发上限。"""
+import errno
+import http.client
+import http.server
+import threading
+
+import pytest
+
+import jianying_export_service as export_service
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    peers: list = []
+
+    def do_GET(self):
+        type(self).peers.append(self.client_address)
+        if self.path == "/moved":
+            self.send_response(302)
+            self.send_header("Location", "/file.bin")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path != "/file.bin":
+            # 不用 send_error：它会带 Connection: close，这里要验证 404 之后连接仍可复用
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = b"x" * 4096
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.peers = []
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _get(engine, url):
+    with engine.open(url, {}, 10) as resp:
+        return resp.read()
+
+
+def test_host_limiter_aimd():
+    lim = export_service._HostLimiter(4, 6)
+    for ok, limit in ((True, 5), (True, 6), (True, 6), (False, 3), (None, 3), (False, 1), (False, 1)):
+        lim.acquire()
+        lim.release(ok)
+        assert (lim.limit, lim.active) == (limit, 0)
+
+
+@pytest.mark.parametrize("exc, network", [
+    (ConnectionResetError(), True),
+    (TimeoutError(), True),
+    (http.client.IncompleteRead(b""), True),
+    (OSError(errno.ENOSPC, "No space left on device"), False),
+    (GeneratorExit(), False),
+    (ValueError(), False),
+])
+def test_is_network_error(exc, network):
+    assert export_service._is_network_error(exc) is network
+
+
+def test_pooled_engine_reuses_connection_and_follows_redirect(server):
+    engine = export_service._PooledHttpEngine(per_host_initial=2, per_host_max=4)
+    try:
+        assert _get(engine, f"{server}/file.bin") == b"x" * 4096
+        assert _get(engine, f"{server}/moved") == b"x" * 4096
+        assert _get(engine, f"{server}/file.bin") == b"x" * 4096
+    finally:
+        engine.close()
+    # 4 个请求（含一次 302）走同一条 keep-alive 连接
+    assert len(_Handler.peers) == 4
+    assert len(set(_Handler.peers)) == 1
+    # 两次成功下载各 +1，重定向不计入
+    assert engine._limiter("127.0.0.1").limit == 4
+
+
+def test_pooled_engine_http_error_is_neutral(server):
+    engine = export_service._PooledHttpEngine(per_host_initial=2, per_host_max=4)
+    try:
+        with pytest.raises(OSError, match="HTTP Error 404"):
+            _get(engine, f"{server}/missing")
+        # 下载方写盘失败：不算网络错误，连接不回池
+        with pytest.raises(OSError, match="No space"):
+            with engine.open(f"{server}/file.bin", {}, 10) as resp:
+                resp.read(10)
+                raise OSError(errno.ENOSPC, "No space left on device")
+        assert _get(engine, f"{server}/file.bin") == b"x" * 4096
+    finally:
+        engine.close()
+    lim = engine._limiter("127.0.0.1")
+    assert (lim.limit, lim.active) == (3, 0)
+    # 404 之后连接仍复用；写盘失败的那条连接被关闭，最后一次请求新建连接
+    assert len(set(_Handler.peers)) == 2
+
+
+def test_pooled_engine_connection_error_halves_limit():
+    engine = export_service._PooledHttpEngine(per_host_initial=4, per_host_max=8)
+    with pytest.raises(ConnectionError):
+        # 端口 1 上没有服务：连接被拒绝
+        _get(engine, "http://127.0.0.1:1/file.bin")
+    assert engine._limiter("127.0.0.1").limit == 2
@@ -0,0 +1,53 @@
+"""导出结果缓存：命中、以及增量重建只继承参数相同的上一次构建。"""
+import os
+
+import pytest
+
+import jianying_export_service as export_service
+
+
+@pytest.fixture
+def cache_root(tmp_path, monkeypatch):
+    root = tmp_path / "export_cache"
+    (root / "locks").mkdir(parents=True)
+    monkeypatch.setattr(export_service, "_export_cache_root_path", str(root))
+    monkeypatch.setattr(export_service, "get_platform", lambda: "Linux")
+    monkeypatch.setenv("JIANYING_MEDIA_CACHE", "0")
+    return root
+
+
+@pytest.fixture
+def base_drafts(monkeypatch):
+    """记录每次实际构建拿到的 base_draft。"""
+    seen = []
+    build = export_service._batch_export_build
+
+    def spy(**kwargs):
+        seen.append(kwargs.get("base_draft"))
+        return build(**kwargs)
+
+    monkeypatch.setattr(export_service, "_batch_export_build", spy)
+    return seen
+
+
+def _shots(*captions):
+    return [{"caption": c, "duration": 1} for c in captions]
+
+
+def test_cache_hit_returns_previous_build(cache_root, base_drafts):
+    first = export_service.batch_export("缓存", _shots("一", "二"))
+    assert first["success"] and first.get("cache_key")
+    again = export_service.batch_export("缓存", _shots("一", "二"))
+    assert again["cache_hit"] and again["zip_path"] == first["zip_path"]
+    assert base_drafts == [None]
+
+
+def test_base_draft_requires_same_options(cache_root, base_drafts):
+    first = export_service.batch_export("ContentMaster_Export", _shots("一", "二"))
+    # 同名但参数不同：不继承
+    export_service.batch_export("ContentMaster_Export", _shots("一", "三"), random_transitions=True)
+    export_service.batch_export("ContentMaster_Export", _shots("一", "三"), resolution="1080x1920")
+    # 只有镜头不同：以上一次构建为基础增量重建
+    export_service.batch_export("ContentMaster_Export", _shots("一", "四"))
+    assert base_drafts == [None, None, None, first["draft_folder"]]
+    assert os.path.isfile(os.path.join(first["draft_folder"], ".shot_manifest.json"))
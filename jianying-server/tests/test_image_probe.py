@@ -0,0 +1,40 @@
+"""手工构造的图片头：progressive JPEG + EXIF 方向、WebP VP8X。"""
+import struct
+
+import jianying_export_service as export_service
+
+
+def _segment(marker: int, payload: bytes) -> bytes:
+    return bytes([0xFF, marker]) + struct.pack(">H", len(payload) + 2) + payload
+
+
+def _exif(orientation: int) -> bytes:
+    ifd = struct.pack("<H", 1) + struct.pack("<HHIH", 0x0112, 3, 1, orientation) + bytes(2) + struct.pack("<I", 0)
+    return b"Exif\x00\x00" + b"II*\x00" + struct.pack("<I", 8) + ifd
+
+
+def test_probe_progressive_jpeg_with_exif_orientation(tmp_path):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(
+        b"\xff\xd8"
+        + _segment(0xE0, b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00")
+        + _segment(0xE1, _exif(6))
+        + _segment(0xDB, bytes(65))
+        + b"\xff"  # marker 前的填充字节
+        + _segment(0xC2, struct.pack(">BHHB", 8, 600, 800, 3) + bytes(9))
+        + _segment(0xDA, bytes(10))
+        + bytes(256)
+    )
+    info = export_service.probe_image_header(str(path))
+    assert info == {"format": "jpeg", "width": 800, "height": 600, "orientation": 6}
+    # 方向 6（顺时针 90°）显示时宽高互换
+    assert export_service._read_image_dimensions(str(path), 1, 1) == (600, 800)
+
+
+def test_probe_webp_vp8x(tmp_path):
+    path = tmp_path / "extended.webp"
+    vp8x = b"VP8X" + struct.pack("<I", 10) + b"\x10\x00\x00\x00" + (3999).to_bytes(3, "little") + (2249).to_bytes(3, "little")
+    body = b"WEBP" + vp8x + b"ALPH" + struct.pack("<I", 4) + bytes(4)
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body + bytes(64))
+    info = export_service.probe_image_header(str(path))
+    assert info == {"format": "webp", "width": 4000, "height": 2250, "orientation": 1}
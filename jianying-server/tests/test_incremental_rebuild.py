@@ -0,0 +1,92 @@
+"""镜头清单增量重建：在已有草稿目录上重建（不删除旧媒体、只是不再打包），以及以 base_draft 为基础构建新目录。"""
+import json
+import os
+import struct
+import zipfile
+import zlib
+
+import pytest
+
+import jianying_export_service as export_service
+
+
+def _write_png(path, rgb):
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    raw = b"".join(b"\x00" + bytes(rgb) * 4 for _ in range(4))
+    path.write_bytes(
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", 4, 4, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+
+@pytest.fixture
+def images(tmp_path, monkeypatch):
+    monkeypatch.setenv("JIANYING_MEDIA_CACHE", "0")
+    paths = {}
+    for name, rgb in (("red", (255, 0, 0)), ("blue", (0, 0, 255)), ("green", (0, 255, 0))):
+        paths[name] = tmp_path / f"{name}.png"
+        _write_png(paths[name], rgb)
+    return paths
+
+
+def _export(out_dir, shots, **kwargs):
+    return export_service.create_draft_on_mac(
+        "增量", shots, output_dir=str(out_dir), width=1280, height=720, package_zip=True, **kwargs,
+    )
+
+
+def _image_paths(result):
+    with open(result["content_path"], encoding="utf-8") as f:
+        content = json.load(f)
+    return [os.path.relpath(m["path"], result["draft_folder"]) for m in content["materials"]["videos"]]
+
+
+def test_rebuild_in_existing_folder_keeps_replaced_media(tmp_path, images):
+    out = tmp_path / "out"
+    first = _export(out, [
+        {"caption": "一", "imageUrl": str(images["red"]), "duration": 2},
+        {"caption": "二", "imageUrl": str(images["blue"]), "duration": 1},
+    ])
+    red_rel, blue_rel = _image_paths(first)
+
+    second = _export(out, [
+        {"caption": "一", "imageUrl": str(images["red"]), "duration": 2},
+        {"caption": "二", "imageUrl": str(images["green"]), "duration": 1},
+    ])
+    assert second["draft_folder"] == first["draft_folder"]
+    assert second["draft_id"] == first["draft_id"]
+    assert second["reused_shots"] == 1
+    new_red, green_rel = _image_paths(second)
+    assert new_red == red_rel and green_rel != blue_rel
+
+    # 被替换的旧媒体仍在目录里（其他任务可能正在读它），但不进本次 ZIP
+    assert second["stale_media"] == [os.path.normpath(blue_rel)]
+    assert os.path.isfile(os.path.join(first["draft_folder"], blue_rel))
+    with zipfile.ZipFile(second["zip_path"]) as zf:
+        names = set(zf.namelist())
+    assert {red_rel, green_rel} <= names
+    assert blue_rel not in names and ".shot_manifest.json" not in names
+
+
+def test_base_draft_builds_a_new_folder(tmp_path, images):
+    base = _export(tmp_path / "base", [
+        {"caption": "一", "imageUrl": str(images["red"]), "duration": 2},
+        {"caption": "二", "imageUrl": str(images["blue"]), "duration": 1},
+    ])
+    before = sorted(os.listdir(os.path.join(base["draft_folder"], "Resources", "image")))
+
+    result = _export(tmp_path / "next", [
+        {"caption": "一", "imageUrl": str(images["red"]), "duration": 2},
+        {"caption": "三", "duration": 1},
+    ], base_draft=base["draft_folder"])
+    assert result["draft_folder"] != base["draft_folder"]
+    assert result["reused_shots"] == 1 and result["stale_media"] == []
+    red_rel = _image_paths(base)[0]
+    assert _image_paths(result)[0] == red_rel
+    assert os.path.isfile(os.path.join(result["draft_folder"], red_rel))
+    # 基础草稿保持原样
+    assert sorted(os.listdir(os.path.join(base["draft_folder"], "Resources", "image"))) == before
@@ -0,0 +1,59 @@
+"""媒体元数据缓存：按整个文件内容取键，文件哈希按 inode + 大小 + mtime 复用。"""
+import hashlib
+import os
+
+import pytest
+
+import jianying_export_service as export_service
+
+
+@pytest.fixture
+def meta_db(tmp_path, monkeypatch):
+    monkeypatch.setenv("JIANYING_MEDIA_META_CACHE", "1")
+    monkeypatch.setattr(export_service, "get_persistent_dir", lambda: str(tmp_path))
+    monkeypatch.setattr(export_service, "_media_meta_db", None)
+    yield tmp_path / "media_meta.sqlite"
+    conn = export_service._media_meta_db
+    if conn:
+        conn.close()
+
+
+def _same_head_and_tail(path, middle: bytes):
+    edge = b"\x00" * (256 * 1024)
+    path.write_bytes(edge + middle + edge)
+
+
+def test_files_differing_only_in_the_middle_do_not_share_meta(tmp_path, meta_db, monkeypatch):
+    a, b = tmp_path / "a.mp4", tmp_path / "b.mp4"
+    _same_head_and_tail(a, b"A" * 1024)
+    _same_head_and_tail(b, b"B" * 1024)
+    probed = []
+
+    def fake_box_meta(path):
+        probed.append(os.path.basename(path))
+        return {"duration_us": 1_000_000 if path.endswith("a.mp4") else 2_000_000}
+
+    monkeypatch.setattr(export_service, "_mp4_box_meta", fake_box_meta)
+    assert export_service.probe_media(str(a))["duration_us"] == 1_000_000
+    assert export_service.probe_media(str(b))["duration_us"] == 2_000_000
+    # 再次探测走缓存
+    assert export_service.probe_media(str(a))["duration_us"] == 1_000_000
+    assert probed == ["a.mp4", "b.mp4"]
+    assert meta_db.is_file()
+
+
+def test_file_digest_reused_until_size_or_mtime_changes(tmp_path, meta_db):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"x" * 4096)
+    first = export_service._media_fingerprint(str(path))
+    st = os.stat(path)
+
+    # 大小与 mtime 都不变：不重新读取文件（取舍：原地改写并还原 mtime 的文件不会被发现）
+    path.write_bytes(b"y" * 4096)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert export_service._media_fingerprint(str(path))[0] == first[0]
+
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    again = export_service._media_fingerprint(str(path))
+    assert again[0] != first[0]
+    assert again[0] == hashlib.sha256(b"y" * 4096).hexdigest()
@@ -0,0 +1,81 @@
+"""合并时的媒体去重：同名不同内容改名、不同名相同内容只存一份，素材 path 随之改写。"""
+import json
+import struct
+import zipfile
+import zlib
+
+import pytest
+
+import jianying_export_service as export_service
+import merge_drafts
+
+
+def _write_png(path, width):
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    raw = b"".join(b"\x00" + b"\x00\x80\xff" * width for _ in range(width))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, width, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _export_part(out_dir, images, suffix):
+    result = export_service.create_draft_on_mac(
+        "去重",
+        [{"caption": str(i), "imageUrl": str(image), "duration": 1} for i, image in enumerate(images)],
+        output_dir=str(out_dir),
+        force_draft_folder_name="去重",
+        package_zip=True,
+        zip_part_suffix=suffix,
+    )
+    assert not result.get("zip_error")
+    return result["zip_path"]
+
+
+def _read_merged(zip_path):
+    with zipfile.ZipFile(zip_path) as zf:
+        name = next(n for n in zf.namelist() if n.startswith("Timelines/") and n.endswith("/draft_content.json"))
+        media = {n: zf.read(n) for n in zf.namelist() if n.startswith("Resources/image/") and not n.endswith("/")}
+        return json.loads(zf.read(name)), media
+
+
+@pytest.mark.parametrize("mode", ["merge", "append"])
+def test_merge_renames_conflicting_media(tmp_path, monkeypatch, mode):
+    monkeypatch.setenv("JIANYING_MEDIA_CACHE", "0")
+    monkeypatch.setattr(merge_drafts, "MERGE_WORKERS", 1)
+    first, other, copy = tmp_path / "a" / "pic.png", tmp_path / "b" / "pic.png", tmp_path / "b" / "copy.png"
+    _write_png(first, 4)
+    _write_png(other, 8)
+    _write_png(copy, 4)
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    part1 = _export_part(out_dir, [first], "_part1")
+    part2 = _export_part(out_dir, [other, copy], "_part2")
+
+    merged_zip = str(tmp_path / "merged.zip")
+    if mode == "merge":
+        result = merge_drafts.merge_drafts("合并", merged_zip, [part1, part2])
+    else:
+        merge_drafts.merge_drafts("合并", merged_zip, [part1])
+        result = merge_drafts.append_drafts(merged_zip, [part2])
+    assert result["deduped_media"] == 1
+
+    content, media = _read_merged(merged_zip)
+    # 第二段的 pic.png 内容不同 → 改名为 pic_1.png；copy.png 与第一段的 pic.png 相同 → 不写入，引用已有文件
+    assert media == {
+        "Resources/image/pic.png": first.read_bytes(),
+        "Resources/image/pic_1.png": other.read_bytes(),
+    }
+    paths = [mat["path"].replace("\\", "/") for mat in content["materials"]["videos"]]
+    assert [p.rsplit("/Resources/", 1)[1] for p in paths] == ["image/pic.png", "image/pic_1.png", "image/pic.png"]
+    # 片段仍指向各自的素材
+    by_id = {mat["id"]: mat for mat in content["materials"]["videos"]}
+    video = next(t for t in content["tracks"] if t["type"] in ("video", 0))
+    assert [by_id[seg["material_id"]]["path"] for seg in video["segments"]] == [
+        mat["path"] for mat in content["materials"]["videos"]
+    ]
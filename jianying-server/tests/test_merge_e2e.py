@@ -0,0 +1,83 @@
+"""导出 → 合并 → 追加：导出服务的分段 ZIP 直接交给 merge_drafts / append_drafts。"""
+import json
+import struct
+import zipfile
+import zlib
+
+import jianying_export_service as export_service
+import merge_drafts
+
+
+def _write_png(path, width=4, height=4):
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    raw = b"".join(b"\x00" + b"\xff\x00\x00" * width for _ in range(height))
+    path.write_bytes(
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _export_part(out_dir, shots, suffix):
+    result = export_service.create_draft_on_mac(
+        "分批",
+        shots,
+        output_dir=str(out_dir),
+        width=1280,
+        height=720,
+        force_draft_folder_name="分批",
+        package_zip=True,
+        zip_part_suffix=suffix,
+    )
+    assert not result.get("zip_error")
+    return result
+
+
+def _merged_content(zip_path):
+    with zipfile.ZipFile(zip_path) as zf:
+        name = next(n for n in zf.namelist() if n.startswith("Timelines/") and n.endswith("/draft_content.json"))
+        return json.loads(zf.read(name))
+
+
+def test_export_merge_append(tmp_path, monkeypatch):
+    monkeypatch.setenv("JIANYING_MEDIA_CACHE", "0")
+    monkeypatch.setattr(merge_drafts, "MERGE_WORKERS", 1)
+    image = tmp_path / "pic.png"
+    _write_png(image)
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+
+    part1 = _export_part(out_dir, [
+        {"caption": "一", "imageUrl": str(image), "duration": 2},
+        {"caption": "二", "duration": 1.5},
+    ], "_part1")
+    part2 = _export_part(out_dir, [
+        {"caption": "三", "imageUrl": str(image), "duration": 3},
+    ], "_part2")
+    assert part1["draft_folder"] != part2["draft_folder"]
+    assert (part1["total_duration"], part2["total_duration"]) == (3_500_000, 3_000_000)
+
+    merged_zip = tmp_path / "merged.zip"
+    merged = merge_drafts.merge_drafts("合并", str(merged_zip), [part1["zip_path"]])
+    assert merged["success"]
+    assert (merged["video_segments"], merged["text_segments"]) == (2, 2)
+    assert merged["total_duration_sec"] == 3.5
+
+    appended = merge_drafts.append_drafts(str(merged_zip), [part2["zip_path"]])
+    assert appended["appended_drafts"] == 1
+    assert (appended["video_segments"], appended["audio_segments"], appended["text_segments"]) == (3, 0, 3)
+    assert appended["total_duration_sec"] == 6.5
+
+    content = _merged_content(merged_zip)
+    assert content["duration"] == 6_500_000
+    tracks = {track["type"]: track["segments"] for track in content["tracks"]}
+    assert set(tracks) == {"video", "text"}
+    starts = [seg["target_timerange"]["start"] for seg in tracks["video"]]
+    assert starts == [0, 2_000_000, 3_500_000]
+
+    # 一次合并两个分段与先合并再追加结果一致
+    full = merge_drafts.merge_drafts("合并", str(tmp_path / "full.zip"), [part1["zip_path"], part2["zip_path"]])
+    assert (full["video_segments"], full["text_segments"], full["total_duration_sec"]) == (3, 3, 6.5)
@@ -0,0 +1,77 @@
+"""手工构造的 MP4 / MOV 样本：moov 在 mdat 之后、version 1 mdhd、旋转矩阵。"""
+import struct
+
+import jianying_export_service as export_service
+
+
+def _box(btype: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), btype) + payload
+
+
+def _full_box(btype: bytes, version: int, payload: bytes) -> bytes:
+    return _box(btype, bytes([version, 0, 0, 0]) + payload)
+
+
+def _tkhd(matrix: tuple, width: int, height: int) -> bytes:
+    head = struct.pack(">IIIII", 0, 0, 1, 0, 0) + bytes(8) + bytes(8)
+    return _full_box(b"tkhd", 0, head + struct.pack(">9i", *matrix) + struct.pack(">II", width << 16, height << 16))
+
+
+def _trak(handler: bytes, tkhd: bytes, mdhd: bytes, sample_entry: bytes, stts: bytes = b"") -> bytes:
+    hdlr = _full_box(b"hdlr", 0, bytes(4) + handler + bytes(12) + b"\x00")
+    stsd = _full_box(b"stsd", 0, struct.pack(">I", 1) + sample_entry)
+    stbl = _box(b"stbl", stsd + stts)
+    return _box(b"trak", tkhd + _box(b"mdia", mdhd + hdlr + _box(b"minf", stbl)))
+
+
+def _write_mp4(path):
+    identity = (0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+    rotate_90 = (0, 0x10000, 0, -0x10000, 0, 0, 0, 0, 0x40000000)
+    # 视频轨：version 1 mdhd（64 位时长），9s @ 90kHz，30fps
+    video = _trak(
+        b"vide",
+        _tkhd(rotate_90, 1920, 1080),
+        _full_box(b"mdhd", 1, bytes(16) + struct.pack(">IQ", 90000, 9 * 90000) + bytes(4)),
+        _box(b"avc1", bytes(24) + struct.pack(">HH", 1920, 1080) + bytes(50)),
+        _full_box(b"stts", 0, struct.pack(">III", 1, 270, 3000)),
+    )
+    # 音频轨：version 0 mdhd，5s @ 44.1kHz
+    audio = _trak(
+        b"soun",
+        _tkhd(identity, 0, 0),
+        _full_box(b"mdhd", 0, bytes(8) + struct.pack(">II", 44100, 5 * 44100) + bytes(4)),
+        _box(b"mp4a", bytes(16) + struct.pack(">HH", 2, 16) + bytes(4) + struct.pack(">I", 44100 << 16)),
+    )
+    mvhd = _full_box(b"mvhd", 0, bytes(8) + struct.pack(">II", 1000, 10_000) + bytes(80))
+    # moov 在 mdat 之后，mdat 用 64 位 largesize 头
+    mdat_body = bytes(4096)
+    mdat = struct.pack(">I4sQ", 1, b"mdat", 16 + len(mdat_body)) + mdat_body
+    path.write_bytes(_box(b"ftyp", b"isom" + bytes(4) + b"isomavc1") + mdat + _box(b"moov", mvhd + video + audio))
+
+
+def test_mp4_box_meta_moov_after_mdat(tmp_path):
+    path = tmp_path / "clip.mp4"
+    _write_mp4(path)
+    meta = export_service._mp4_box_meta(str(path))
+    assert meta == {
+        "duration_us": 10_000_000,
+        "width": 1920,
+        "height": 1080,
+        "rotation": 90,
+        "codec": "avc1",
+        "fps": 30.0,
+        "video_duration_us": 9_000_000,
+        "sample_rate": 44100,
+        "channels": 2,
+    }
+
+
+def test_iter_boxes_stops_at_truncated_box():
+    buf = _box(b"free", b"abcd") + struct.pack(">I4s", 64, b"skip") + b"xx"
+    assert list(export_service._iter_boxes(buf)) == [(b"free", 8, 12)]
+
+
+def test_mp4_box_meta_rejects_non_isobmff(tmp_path):
+    path = tmp_path / "not.mp4"
+    path.write_bytes(b"ID3" + bytes(64))
+    assert export_service._mp4_box_meta(str(path)) is None
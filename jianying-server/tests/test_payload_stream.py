@@ -0,0 +1,35 @@
+"""PayloadReader 流式 ingest：镜头逐个产出，同一个流上连续读取两个任务（--serve 模式）。"""
+import base64
+import io
+import json
+import os
+
+import pytest
+
+import jianying_export_service as export_service
+
+
+def test_payload_reader_two_jobs_on_one_stream(tmp_path):
+    media = bytes(range(256))
+    first = {"draftName": "a", "shots": [{"caption": "一"}, {"caption": "二", "note": "[\"}"}]}
+    second = {"draftName": "b", "shots": [{"audioUrl": "data:audio/mpeg;base64," + base64.b64encode(media).decode()}]}
+    text = json.dumps(first, ensure_ascii=False) + "\n" + json.dumps(second) + "\n"
+    reader = export_service.PayloadReader(io.BytesIO(text.encode("utf-8")), chunk_size=5)
+
+    events = list(reader.iter_events(str(tmp_path / "job1")))
+    assert events == [
+        ("head", {"draftName": "a"}),
+        ("item", {"caption": "一"}),
+        ("item", {"caption": "二", "note": "[\"}"}),
+        ("end", {"draftName": "a", "shots": []}),
+    ]
+
+    spool = tmp_path / "job2"
+    spool.mkdir()
+    job = reader.read_value(str(spool))
+    assert job["draftName"] == "b"
+    assert job["shots"][0]["audioUrl"] == os.path.join(str(spool), "media_0000.mp3")
+    with open(job["shots"][0]["audioUrl"], "rb") as f:
+        assert f.read() == media
+    with pytest.raises(EOFError):
+        reader.read_value(str(tmp_path))
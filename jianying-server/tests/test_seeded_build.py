@@ -0,0 +1,49 @@
+"""seed 构建可复现：缓存里已有同参数的旧草稿（增量重建的候选）时，产物仍与冷构建逐字节相同。"""
+import shutil
+import struct
+import zlib
+
+import jianying_export_service as export_service
+
+
+def _write_png(path, rgb):
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    raw = b"".join(b"\x00" + bytes(rgb) * 4 for _ in range(4))
+    path.write_bytes(
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", 4, 4, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+
+def test_same_seed_same_bytes_with_warm_cache(tmp_path, monkeypatch):
+    root = tmp_path / "export_cache"
+    (root / "locks").mkdir(parents=True)
+    monkeypatch.setattr(export_service, "_export_cache_root_path", str(root))
+    monkeypatch.setattr(export_service, "get_platform", lambda: "Linux")
+    monkeypatch.setenv("JIANYING_MEDIA_CACHE", "0")
+    red, blue = tmp_path / "red.png", tmp_path / "blue.png"
+    _write_png(red, (255, 0, 0))
+    _write_png(blue, (0, 0, 255))
+    shots = [
+        {"caption": "一", "imageUrl": str(red), "duration": 2},
+        {"caption": "二", "imageUrl": str(blue), "duration": 1},
+    ]
+    options = dict(resolution="1280x720", random_transitions=True, random_filters=True, seed=7)
+
+    def build(shot_list):
+        result = export_service.batch_export("复现", shot_list, **options)
+        assert result["success"] and not result.get("cache_hit")
+        with open(result["zip_path"], "rb") as f:
+            return f.read()
+
+    cold = build(shots)
+    shutil.rmtree(root)
+    (root / "locks").mkdir(parents=True)
+
+    # 同参数、同 seed、镜头不同的旧构建留在缓存里（未改动的第一个镜头可被增量重建复用）
+    build([shots[0], {"caption": "三", "imageUrl": str(red), "duration": 3}])
+    assert build(shots) == cold
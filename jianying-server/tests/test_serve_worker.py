@@ -0,0 +1,42 @@
+"""--serve 常驻 worker：任务 JSON 只读到一部分时报错退出，不回复 result、不接着读错位的 stdin。"""
+import io
+import json
+
+import pytest
+
+import jianying_export_service as export_service
+
+
+def _messages(out: io.StringIO) -> list:
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+@pytest.mark.parametrize("tail", [
+    '], "seed": }}\n',  # 镜头数组之后的 JSON 已损坏：镜头照常交给导出，读完剩余部分时才发现
+    ', {"caption": "二", "dura',  # 镜头数组中途断流：导出方消费镜头时就出错
+])
+def test_serve_jobs_exits_on_truncated_job(tmp_path, monkeypatch, tail):
+    monkeypatch.setenv("JIANYING_MEDIA_CACHE", "0")
+    broken = '{"id": "j1", "output": %s, "payload": {"shots": [{"caption": "一", "duration": 1}' % (
+        json.dumps(str(tmp_path)),
+    ) + tail
+    following = json.dumps({"id": "j2", "output": str(tmp_path), "payload": {"shots": []}}) + "\n"
+    out = io.StringIO()
+    handled = export_service.serve_jobs(io.BytesIO((broken + following).encode("utf-8")), out)
+
+    messages = [m for m in _messages(out) if m["type"] != "progress"]
+    assert handled == 1
+    assert [m["type"] for m in messages] == ["ready", "error"]
+    assert messages[1]["id"] == "j1"
+
+
+def test_serve_jobs_runs_consecutive_jobs(tmp_path, monkeypatch):
+    monkeypatch.setenv("JIANYING_MEDIA_CACHE", "0")
+    jobs = "".join(
+        json.dumps({"id": job_id, "name": job_id, "output": str(tmp_path), "payload": {"shots": [{"caption": job_id, "duration": 1}]}}) + "\n"
+        for job_id in ("j1", "j2")
+    )
+    out = io.StringIO()
+    assert export_service.serve_jobs(io.BytesIO(jobs.encode("utf-8")), out) == 2
+    results = [m for m in _messages(out) if m["type"] == "result"]
+    assert [(m["id"], m["result"]["success"]) for m in results] == [("j1", True), ("j2", True)]
@@ -0,0 +1,48 @@
+"""并行压缩：pack_folder 在 1 个线程与多个线程下输出的 ZIP 逐字节一致。"""
+import json
+import zipfile
+
+import zip_packager
+
+
+def _draft_folder(root):
+    folder = root / "draft"
+    (folder / "Resources" / "videoAlg").mkdir(parents=True)
+    for i in range(12):
+        (folder / f"part{i}.json").write_text(json.dumps({"i": i, "ids": list(range(i * 300))}))
+    (folder / "Resources" / "clip.mp4").write_bytes(bytes(range(256)) * 20)
+    (folder / "Resources" / "voice.wav").write_bytes(bytes(20000))
+    (folder / ".shot_manifest.json").write_text("{}")
+    return folder
+
+
+def _pack(monkeypatch, folder, target, workers):
+    monkeypatch.setattr(zip_packager, "ZIP_WORKERS", workers)
+    zip_packager.pack_folder(str(folder), str(target), date_time=(2024, 1, 2, 3, 4, 6))
+    return target.read_bytes()
+
+
+def test_pack_folder_parallel_matches_serial(tmp_path, monkeypatch):
+    folder = _draft_folder(tmp_path)
+    serial = _pack(monkeypatch, folder, tmp_path / "serial.zip", 1)
+
+    deflated = []
+    real_deflate = zip_packager._deflate_file
+    monkeypatch.setattr(zip_packager, "_deflate_file", lambda path, level: deflated.append(path) or real_deflate(path, level))
+    parallel = _pack(monkeypatch, folder, tmp_path / "parallel.zip", 4)
+
+    # 12 个 JSON + voice.wav 进线程池，clip.mp4 原样存入
+    assert len(deflated) == 13
+    assert parallel == serial
+    with zipfile.ZipFile(tmp_path / "parallel.zip") as zf:
+        assert zf.testzip() is None
+        assert ".shot_manifest.json" not in zf.namelist()
+        assert zf.getinfo("Resources/voice.wav").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_pack_folder_large_files_bypass_pool(tmp_path, monkeypatch):
+    folder = _draft_folder(tmp_path)
+    serial = _pack(monkeypatch, folder, tmp_path / "serial.zip", 1)
+    # 超过阈值的文件在写入线程里流式压缩，输出仍与串行一致
+    monkeypatch.setattr(zip_packager, "_PARALLEL_MAX_BYTES", 4096)
+    assert _pack(monkeypatch, folder, tmp_path / "parallel.zip", 4) == serial
@@ -0,0 +1,78 @@
+"""copy_raw_member / merge_zips：压缩数据原样搬运，源条目带数据描述符时也能得到正确的本地头。"""
+import io
+import struct
+import zipfile
+
+import merge_zips
+import zip_packager
+
+
+class _Unseekable(io.RawIOBase):
+    def __init__(self):
+        self.buf = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.buf += b
+        return len(b)
+
+
+def _streamed_zip(path, members: dict) -> None:
+    """写到不可 seek 的流：zipfile 给每个条目加数据描述符（flag bit 3），本地头里 CRC / 大小为 0。"""
+    out = _Unseekable()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            with zf.open(name, "w") as dst:
+                dst.write(data)
+    path.write_bytes(bytes(out.buf))
+
+
+def test_copy_raw_member_data_descriptor_source(tmp_path):
+    members = {
+        "draft_content.json": b'{"tracks": []}' * 500,
+        "Resources/clip.mp4": bytes(range(256)) * 64,
+    }
+    src_path = tmp_path / "src.zip"
+    _streamed_zip(src_path, members)
+    with zipfile.ZipFile(src_path) as zf:
+        infos = zf.infolist()
+    assert all(info.flag_bits & 0x08 for info in infos)
+
+    dst = io.BytesIO()
+    with open(src_path, "rb") as raw, zipfile.ZipFile(dst, "w") as out:
+        for info in infos:
+            zip_packager.copy_raw_member(raw, info, out, "copy/" + info.filename)
+
+    with zipfile.ZipFile(dst) as zf:
+        assert zf.testzip() is None
+        for info, src_info in zip(zf.infolist(), infos):
+            assert not info.flag_bits & 0x08
+            assert (info.CRC, info.compress_size, info.compress_type) == (
+                src_info.CRC, src_info.compress_size, src_info.compress_type,
+            )
+            assert zf.read(info) == members[src_info.filename]
+    # 本地头单独可读（不依赖中央目录）：CRC 与大小已写进本地头
+    raw = dst.getvalue()
+    with zipfile.ZipFile(io.BytesIO(raw)) as zf:
+        first = zf.infolist()[0]
+    header = raw[first.header_offset:first.header_offset + zipfile.sizeFileHeader]
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    assert (fields[zipfile._FH_CRC], fields[zipfile._FH_COMPRESSED_SIZE]) == (first.CRC, first.compress_size)
+
+
+def test_merge_zips_dedups_and_renames(tmp_path):
+    a, b = tmp_path / "a.zip", tmp_path / "b.zip"
+    _streamed_zip(a, {"draft/shared.png": b"same", "draft/cover.jpg": b"first"})
+    _streamed_zip(b, {"draft/shared.png": b"same", "draft/cover.jpg": b"second"})
+    out = tmp_path / "merged.zip"
+    merge_zips.merge_zips(out, [a, b])
+
+    with zipfile.ZipFile(out) as zf:
+        assert zf.testzip() is None
+        assert sorted(n for n in zf.namelist() if not n.endswith("/")) == [
+            "draft/cover.jpg", "draft/cover_batch1.jpg", "draft/shared.png",
+        ]
+        assert zf.read("draft/cover.jpg") == b"first"
+        assert zf.read("draft/cover_batch1.jpg") == b"second"
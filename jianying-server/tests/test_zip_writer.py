@@ -0,0 +1,72 @@
+"""DraftZipWriter / write_raw_member：媒体 STORED、JSON DEFLATE，预压缩数据直接写入，输出可以是不可 seek 的流。"""
+import io
+import zipfile
+
+import pytest
+
+import zip_packager
+
+
+class _Unseekable(io.RawIOBase):
+    """只能顺序写的输出（模拟 HTTP 响应 / stdout）。"""
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.buf += b
+        return len(b)
+
+
+def test_draft_zip_writer_to_unseekable_stream(tmp_path):
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(bytes(range(256)) * 40)
+    content = b'{"materials": {"videos": []}}' * 50
+    out = _Unseekable()
+    writer = zip_packager.DraftZipWriter(out, date_time=(2024, 1, 2, 3, 4, 6))
+    assert writer.add_dir("Resources")
+    assert writer.add_file(str(clip), "Resources/clip.mp4")
+    assert not writer.add_file(str(clip), "Resources/clip.mp4")
+    assert writer.add_bytes("draft_content.json", content)
+    assert writer.close() is None
+
+    with zipfile.ZipFile(io.BytesIO(bytes(out.buf))) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["Resources/", "Resources/clip.mp4", "draft_content.json"]
+        assert zf.getinfo("Resources/clip.mp4").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("draft_content.json").compress_type == zipfile.ZIP_DEFLATED
+        assert zf.read("Resources/clip.mp4") == clip.read_bytes()
+        assert zf.read("draft_content.json") == content
+
+
+def test_write_raw_member_predeflated(tmp_path):
+    src = tmp_path / "draft_meta_info.json"
+    src.write_bytes(b'{"draft_name": "a"}' * 200)
+    crc, size, data = zip_packager._deflate_file(str(src), 6)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        info = zipfile.ZipInfo("draft_meta_info.json", (2024, 1, 2, 3, 4, 6))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.flag_bits = 0x08
+        # 分块写入，和 iter_raw_member 的用法一致
+        zip_packager.write_raw_member(zf, info, (data[:100], data[100:]), crc, size, len(data))
+        zf.writestr("after.json", b"{}")
+
+    with zipfile.ZipFile(buf) as zf:
+        assert zf.testzip() is None
+        info = zf.getinfo("draft_meta_info.json")
+        assert not info.flag_bits & 0x08
+        assert (info.CRC, info.file_size, info.compress_size) == (crc, size, len(data))
+        assert zf.read("draft_meta_info.json") == src.read_bytes()
+        assert zf.read("after.json") == b"{}"
+
+
+def test_write_raw_member_rejects_encrypted():
+    with zipfile.ZipFile(io.BytesIO(), "w") as zf:
+        info = zipfile.ZipInfo("secret.json")
+        info.flag_bits = 0x01
+        with pytest.raises(ValueError):
+            zip_packager.write_raw_member(zf, info, (b"",), 0, 0, 0)
@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+"""
+剪映草稿 ZIP 打包（jianying_export_service.py / merge_drafts.py / merge_zips.py 共用）
+  - mp4 / jpg / mp3 等本身已压缩的媒体用 ZIP_STORED 原样存入，只有 JSON 等文本走 DEFLATE
+  - DraftZipWriter 可以边生成边写：媒体下载完成就写入，不必等草稿目录全部落盘后再整体重读一遍
+  - 输出既可以是路径，也可以是不可 seek 的流（HTTP 响应 / stdout），此时 zipfile 自动改用数据描述符
+  - 需要 DEFLATE 的文件在线程池里并行压缩（zlib 压缩时释放 GIL），再按原顺序写入并生成中央目录；
+    压缩级别可按扩展名配置（JIANYING_ZIP_LEVELS）
+  - copy_raw_member() 把其他 ZIP 的条目压缩数据逐字节搬过来（合并 ZIP 时不解压、不重新压缩）
+  - ContentIndex 合并多个分段时按内容去重：相同内容只存一份，同名不同内容自动改名
+  - DraftZipWriter(append=True) 在已有 ZIP 末尾追加条目、重写中央目录（增量合并），不重写已有数据
+用法：
+  python zip_packager.py <草稿目录> [输出.zip]      # 不给输出路径时 ZIP 直接写到 stdout
+"""
+import collections
+import hashlib
+import os
+import struct
+import sys
+import threading
+import typing
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# 已压缩格式：DEFLATE 几乎没有收益，只会白白消耗 CPU
+STORED_EXTS = frozenset({
+    ".mp4", ".mov", ".m4v", ".webm", ".mkv", ".avi",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic",
+    ".mp3", ".m4a", ".aac", ".ogg", ".opus", ".flac",
+    ".zip", ".gz", ".7z",
+})
+DEFLATE_LEVEL = int(os.environ.get("JIANYING_ZIP_LEVEL", "6") or 6)
+_CHUNK = 1024 * 1024
+# 并行压缩线程数（1 表示不用线程池）
+ZIP_WORKERS = max(1, int(os.environ.get("JIANYING_ZIP_WORKERS", "0") or 0) or min(8, os.cpu_count() or 1))
+# 超过该大小的文件不进线程池（压缩结果要整块驻留内存），在写入线程里流式压缩
+_PARALLEL_MAX_BYTES = 16 * 1024 * 1024
+# 只供服务端使用的记账文件，打包草稿 ZIP 时跳过（导出服务的镜头清单 _SHOT_MANIFEST_NAME，含构建 salt、id 与本机路径指纹）
+SERVER_ONLY_NAMES = frozenset({".shot_manifest.json"})
+# 追加模式下被替换条目留下的空洞超过该大小（且超过有效数据的 1/4）时，close() 整体压实一次
+_COMPACT_MIN_BYTES = 32 * 1024 * 1024
+
+
+def _parse_levels(raw: str) -> dict:
+    """解析 "json=9,wav=1" 形式的按扩展名压缩级别。"""
+    levels = {}
+    for part in raw.split(","):
+        ext, _, level = part.partition("=")
+        ext = ext.strip().lower().lstrip(".")
+        if ext and level.strip().isdigit():
+            levels["." + ext] = max(0, min(9, int(level)))
+    return levels
+
+
+# 按扩展名覆盖 DEFLATE_LEVEL：WAV 等 PCM 数据压缩收益低，默认用最快级别
+COMPRESS_LEVELS = {".wav": 1, **_parse_levels(os.environ.get("JIANYING_ZIP_LEVELS", ""))}
+
+
+def compress_type_for(name: str) -> int:
+    """按扩展名选择压缩方式：媒体 ZIP_STORED，其余 ZIP_DEFLATED。"""
+    return zipfile.ZIP_STORED if os.path.splitext(name)[1].lower() in STORED_EXTS else zipfile.ZIP_DEFLATED
+
+
+def compress_level_for(name: str) -> int:
+    return COMPRESS_LEVELS.get(os.path.splitext(name)[1].lower(), DEFLATE_LEVEL)
+
+
+def _deflate_file(path: str, level: int) -> tuple:
+    """整文件 raw DEFLATE（线程池内调用），返回 (crc32, 原始大小, 压缩数据)。"""
+    co = zlib.compressobj(level, zlib.DEFLATED, -15)
+    crc = 0
+    size = 0
+    parts = []
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(_CHUNK)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            parts.append(co.compress(chunk))
+    parts.append(co.flush())
+    return crc, size, b"".join(parts)
+
+
+def write_raw_member(
+    zf: zipfile.ZipFile,
+    info: zipfile.ZipInfo,
+    chunks: typing.Iterable[bytes],
+    crc: int,
+    file_size: int,
+    compress_size: int,
+) -> None:
+    """
+    把已经按 info.compress_type 压缩好的数据作为一个条目写入 zf，不经过 zipfile 的压缩器。
+    CRC 与大小事先已知，直接写进本地文件头（不需要数据描述符，也不需要回头 seek）；中央目录在 zf.close() 时生成。
+    """
+    if info.flag_bits & 0x1:
+        raise ValueError(f"不支持加密条目: {info.filename}")
+    info.CRC = crc
+    info.file_size = file_size
+    info.compress_size = compress_size
+    # 去掉数据描述符标志与旧的 zip64 扩展字段（FileHeader 按需重新生成）
+    info.flag_bits &= ~0x08
+    info.extra = zipfile._strip_extra(info.extra, (1,)) if info.extra else b""
+    with zf._lock:
+        if zf._writing:
+            raise ValueError("ZIP 正在写入其他条目")
+        zf._writecheck(info)
+        zf._didModify = True
+        info.header_offset = zf.fp.tell()
+        zf.fp.write(info.FileHeader())
+        for chunk in chunks:
+            zf.fp.write(chunk)
+        zf.filelist.append(info)
+        zf.NameToInfo[info.filename] = info
+        zf.start_dir = zf.fp.tell()
+
+
+def iter_raw_member(src: typing.BinaryIO, info: zipfile.ZipInfo) -> typing.Iterator[bytes]:
+    """按块读出源 ZIP 中某个条目的压缩数据（不解压）；src 为以二进制方式打开的源 ZIP 文件。"""
+    src.seek(info.header_offset)
+    header = src.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"本地文件头损坏: {info.filename}")
+    # 本地头里的文件名 / 扩展字段长度可能与中央目录不同，以本地头为准
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    src.seek(info.header_offset + zipfile.sizeFileHeader + name_len + extra_len)
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = src.read(min(_CHUNK, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"条目数据不完整: {info.filename}")
+        remaining -= len(chunk)
+        yield chunk
+
+
+def copy_raw_member(src: typing.BinaryIO, info: zipfile.ZipInfo, dst: zipfile.ZipFile, arcname: str = None) -> None:
+    """
+    把源 ZIP 的一个条目原样（压缩数据逐字节）复制到 dst，可改名：不解压也不重新压缩，内存占用与条目大小无关。
+    """
+    new = zipfile.ZipInfo(arcname or info.filename, info.date_time)
+    new.compress_type = info.compress_type
+    new.comment = info.comment
+    new.extra = info.extra
+    new.create_system = info.create_system
+    new.create_version = info.create_version
+    new.extract_version = info.extract_version
+    new.external_attr = info.external_attr
+    new.internal_attr = info.internal_attr
+    # 保留 DEFLATE 级别提示位与 UTF-8 文件名标志；数据描述符标志由 write_raw_member 清除
+    new.flag_bits = info.flag_bits
+    write_raw_member(dst, new, iter_raw_member(src, info), info.CRC, info.file_size, info.compress_size)
+
+
+def _digest(opener: typing.Callable[[], typing.BinaryIO]) -> bytes:
+    h = hashlib.sha256()
+    with opener() as f:
+        while True:
+            chunk = f.read(_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.digest()
+
+
+class ContentIndex:
+    """
+    合并多个分段时给文件分配 ZIP 内的名字：place() 对内容已存过的文件返回已有名字（不必再写），
+    同名但内容不同的文件改名为 <名字><suffix><扩展名>（suffix 中的 {} 为从 1 开始的序号）。
+    先按大小（以及 ZIP 条目自带的 CRC）粗筛，只有粗筛撞上时才读内容算 sha256，绝大多数文件不额外读一遍。
+    cross_name=False 时只和同名文件比较（调用方无法改写引用路径时，内容相同但名字不同的文件不能合并）。
+    """
+
+    def __init__(self, cross_name: bool = True, suffix: str = "_{}"):
+        self._cross_name = cross_name
+        self._suffix = suffix
+        self._by_key: dict = {}
+        self._names: set = set()
+        self.deduped = 0
+        self.deduped_bytes = 0
+
+    def place(
+        self, arcname: str, size: int, opener: typing.Callable[[], typing.BinaryIO], crc: int = None,
+    ) -> typing.Tuple[str, bool]:
+        """
+        返回 (最终 arcname, 是否需要写入)。opener() 返回可读的二进制流，只在需要比较内容时调用；
+        之后的 place() 还可能再调用它，调用方要保证源文件在合并结束前一直可读。
+        """
+        key = (size,) if self._cross_name else (size, arcname)
+        entries = self._by_key.setdefault(key, [])
+        digest = None
+        for entry in entries:
+            # entry: [crc, sha256 或 None, 名字, opener]
+            if crc is not None and entry[0] is not None and entry[0] != crc:
+                continue
+            if entry[1] is None:
+                entry[1] = _digest(entry[3])
+            if digest is None:
+                digest = _digest(opener)
+            if entry[1] == digest:
+                self.deduped += 1
+                self.deduped_bytes += size
+                return entry[2], False
+        name = self._unique(arcname)
+        entries.append([crc, digest, name, opener])
+        return name, True
+
+    def _unique(self, arcname: str) -> str:
+        name = arcname
+        if name in self._names:
+            stem, ext = os.path.splitext(arcname)
+            n = 1
+            while name in self._names:
+                name = f"{stem}{self._suffix.format(n)}{ext}"
+                n += 1
+        self._names.add(name)
+        return name
+
+
+class DraftZipWriter:
+    """
+    增量写 ZIP：add_file() 随时写入单个已就绪的文件，add_tree() 收尾时补齐目录里其余文件（已写过的跳过）。
+    target 为路径时先写 <target>.part，close() 成功后原子替换；abort() 丢弃半成品。
+    date_time 指定后所有条目使用该时间（可复现构建），否则取文件 mtime。
+    append=True 时在已有 ZIP（target 必须是路径）末尾追加：已有条目原地保留，discard() 把要替换的条目从中央目录去掉，
+    close() 重写中央目录；abort() 写回原中央目录并截掉追加的数据，ZIP 恢复原样。
+    """
+
+    def __init__(
+        self, target: typing.Union[str, typing.BinaryIO], date_time: tuple = None, workers: int = None,
+        append: bool = False,
+    ):
+        self.path = target if isinstance(target, str) else None
+        self._tail = None
+        if append:
+            if not self.path or not zipfile.is_zipfile(self.path):
+                raise zipfile.BadZipFile(f"追加目标不是有效的 ZIP: {target}")
+            self._tmp = None
+            self._zf = zipfile.ZipFile(self.path, "a", allowZip64=True)
+            # 追加会从原中央目录的位置开始覆盖写，先留一份原中央目录，出错时写回
+            with open(self.path, "rb") as f:
+                f.seek(self._zf.start_dir)
+                self._tail = (self._zf.start_dir, f.read())
+        else:
+            self._tmp = f"{self.path}.part" if self.path else None
+            self._zf = zipfile.ZipFile(self._tmp or target, "w", allowZip64=True)
+        self._date_time = date_time
+        self._names: set = {info.filename.rstrip("/") for info in self._zf.infolist()}
+        self._lock = threading.RLock()
+        self._workers = ZIP_WORKERS if workers is None else max(1, int(workers))
+        self._pool: typing.Optional[ThreadPoolExecutor] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _info(self, path: str, arcname: str) -> zipfile.ZipInfo:
+        info = zipfile.ZipInfo.from_file(path, arcname)
+        if self._date_time:
+            info.date_time = self._date_time
+        if not info.is_dir():
+            info.compress_type = compress_type_for(arcname)
+            info._compresslevel = compress_level_for(arcname) if info.compress_type == zipfile.ZIP_DEFLATED else None
+        return info
+
+    def _claim(self, arcname: str) -> bool:
+        key = arcname.rstrip("/")
+        if key in self._names:
+            return False
+        self._names.add(key)
+        return True
+
+    def _write_file(self, path: str, arcname: str, deflated: tuple = None) -> None:
+        info = self._info(path, arcname)
+        if info.is_dir():
+            self._zf.writestr(info, b"")
+        elif deflated is not None:
+            crc, size, data = deflated
+            write_raw_member(self._zf, info, (data,), crc, size, len(data))
+        else:
+            with open(path, "rb") as src, self._zf.open(info, "w") as dst:
+                while True:
+                    chunk = src.read(_CHUNK)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+
+    def add_file(self, path: str, arcname: str) -> bool:
+        """写入一个文件（或目录条目）；arcname 已写过时跳过并返回 False。"""
+        arcname = arcname.replace(os.sep, "/")
+        with self._lock:
+            if not self._claim(arcname):
+                return False
+            self._write_file(path, arcname)
+            return True
+
+    def add_files(self, entries: typing.Iterable[tuple]) -> int:
+        """
+        按顺序写入一批 (path, arcname)，返回新写入的条目数。
+        需要 DEFLATE 的中小文件先提交到线程池并行压缩，写入仍按原顺序进行（ZIP 内容与顺序和串行写入一致）；
+        在途任务数限制在 2 × 线程数，内存占用有上限。
+        """
+        pending: collections.deque = collections.deque()
+        window = self._workers * 2
+        added = 0
+        with self._lock:
+            for path, arcname in entries:
+                arcname = arcname.replace(os.sep, "/")
+                if not self._claim(arcname):
+                    continue
+                fut = None
+                if (
+                    self._workers > 1
+                    and not arcname.endswith("/")
+                    and compress_type_for(arcname) == zipfile.ZIP_DEFLATED
+                    and os.path.getsize(path) <= _PARALLEL_MAX_BYTES
+                ):
+                    if self._pool is None:
+                        self._pool = ThreadPoolExecutor(max_workers=self._workers)
+                    fut = self._pool.submit(_deflate_file, path, compress_level_for(arcname))
+                pending.append((path, arcname, fut))
+                added += 1
+                while len(pending) > window:
+                    p, a, f = pending.popleft()
+                    self._write_file(p, a, f.result() if f else None)
+            while pending:
+                p, a, f = pending.popleft()
+                self._write_file(p, a, f.result() if f else None)
+        return added
+
+    def add_dir(self, arcname: str) -> bool:
+        """写入一个目录条目（ZIP 中的空目录）；已写过时跳过并返回 False。"""
+        arcname = arcname.replace(os.sep, "/").rstrip("/") + "/"
+        with self._lock:
+            if not self._claim(arcname):
+                return False
+            info = zipfile.ZipInfo(arcname, date_time=self._date_time or _now_date_time())
+            info.external_attr = (0o40755 << 16) | 0x10
+            self._zf.writestr(info, b"")
+            return True
+
+    def add_bytes(self, arcname: str, data: bytes) -> bool:
+        """写入内存中的内容（如生成的 JSON）；arcname 已写过时跳过并返回 False。"""
+        with self._lock:
+            if not self._claim(arcname):
+                return False
+            info = zipfile.ZipInfo(arcname, date_time=self._date_time or _now_date_time())
+            info.compress_type = compress_type_for(arcname)
+            info._compresslevel = compress_level_for(arcname) if info.compress_type == zipfile.ZIP_DEFLATED else None
+            info.external_attr = 0o644 << 16
+            self._zf.writestr(info, data)
+            return True
+
+    def add_raw(self, src: typing.BinaryIO, info: zipfile.ZipInfo, arcname: str = None) -> bool:
+        """从另一个 ZIP 原样复制一个条目（不解压也不重新压缩，见 copy_raw_member）；arcname 已写过时跳过并返回 False。"""
+        arcname = arcname or info.filename
+        with self._lock:
+            if not self._claim(arcname):
+                return False
+            copy_raw_member(src, info, self._zf, arcname)
+            return True
+
+    def discard(self, arcname: str) -> bool:
+        """追加模式下把已有条目从中央目录去掉（数据留在原处成为空洞），之后可以用同名重新写入。"""
+        with self._lock:
+            info = self._zf.NameToInfo.pop(arcname, None)
+            if info is None:
+                return False
+            self._zf.filelist.remove(info)
+            self._zf._didModify = True
+            self._names.discard(arcname.rstrip("/"))
+            return True
+
+    def add_tree(self, folder: str, prefix: str = "", exclude: typing.Collection[str] = SERVER_ONLY_NAMES) -> int:
+        """
+        按排序后的顺序写入 folder 下全部目录与文件（与 shutil.make_archive 相同的相对路径），返回新写入的条目数。
+        文件名或相对 folder 的路径在 exclude 中的文件跳过。
+        """
+        def _walk():
+            for dirpath, dirnames, filenames in os.walk(folder):
+                dirnames.sort()
+                rel_dir = os.path.relpath(dirpath, folder)
+                for name in dirnames:
+                    yield os.path.join(dirpath, name), os.path.normpath(os.path.join(prefix, rel_dir, name)) + "/"
+                for name in sorted(filenames):
+                    if name in exclude or os.path.normpath(os.path.join(rel_dir, name)) in exclude:
+                        continue
+                    yield os.path.join(dirpath, name), os.path.normpath(os.path.join(prefix, rel_dir, name))
+
+        return self.add_files(_walk())
+
+    def close(self) -> typing.Optional[str]:
+        """写出中央目录；目标为路径时替换为正式文件并返回路径。"""
+        self._shutdown_pool()
+        self._zf.close()
+        if self._tmp:
+            os.replace(self._tmp, self.path)
+        elif self._tail is not None:
+            compact_if_sparse(self.path)
+        return self.path
+
+    def _shutdown_pool(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def abort(self) -> None:
+        self._shutdown_pool()
+        if self._tail is not None:
+            # 不写新的中央目录，直接写回原中央目录并截断
+            self._zf._didModify = False
+            try:
+                self._zf.close()
+            except Exception:
+                pass
+            start, tail = self._tail
+            with open(self.path, "r+b") as f:
+                f.seek(start)
+                f.write(tail)
+                f.truncate()
+            return
+        try:
+            self._zf.close()
+        except Exception:
+            pass
+        if self._tmp and os.path.exists(self._tmp):
+            try:
+                os.remove(self._tmp)
+            except OSError:
+                pass
+
+
+def _now_date_time() -> tuple:
+    import time
+    return time.localtime()[:6]
+
+
+def compact_if_sparse(path: str, min_dead: int = _COMPACT_MIN_BYTES) -> bool:
+    """
+    追加合并后被替换条目留下的空洞较多时，把有效条目原样复制到新 ZIP（不解压不重压）后替换，返回是否压实。
+    有效数据按中央目录估算（本地头 + 文件名 + 扩展字段 + 压缩数据）。
+    """
+    with zipfile.ZipFile(path) as zf:
+        infos = zf.infolist()
+        live = sum(
+            zipfile.sizeFileHeader + len(info.filename.encode("utf-8")) + len(info.extra) + info.compress_size
+            for info in infos
+        )
+        dead = zf.start_dir - live
+    if dead < max(min_dead, live // 4):
+        return False
+    with open(path, "rb") as raw, DraftZipWriter(path) as writer:
+        for info in infos:
+            writer.add_raw(raw, info)
+    return True
+
+
+def pack_folder(
+    folder: str, target: typing.Union[str, typing.BinaryIO], date_time: tuple = None,
+    exclude: typing.Collection[str] = SERVER_ONLY_NAMES,
+) -> typing.Optional[str]:
+    """把整个草稿目录打包为 ZIP（替代 shutil.make_archive(..., 'zip', root_dir=folder)），跳过 exclude 中的文件。"""
+    writer = DraftZipWriter(target, date_time=date_time)
+    try:
+        writer.add_tree(folder, exclude=exclude)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def main():
+    if len(sys.argv) not in (2, 3) or not os.path.isdir(sys.argv[1]):
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
+    if len(sys.argv) == 3:
+        pack_folder(sys.argv[1], sys.argv[2])
+    else:
+        pack_folder(sys.argv[1], sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+
+
+if __name__ == "__main__":
+    main()